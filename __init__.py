@@ -1,3 +1,17 @@
-﻿from .orchestrator import Orchestrator
+﻿from __future__ import annotations
 
-__all__ = ["Orchestrator"]
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .orchestrator import Orchestrator
+
+__all__ = ["Orchestrator"]
+
+
+def __getattr__(name: str) -> Any:
+    # Importing the package stays cheap; the orchestrator (and the openai SDK) load on first use.
+    if name == "Orchestrator":
+        from .orchestrator import Orchestrator
+
+        return Orchestrator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
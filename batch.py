@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import contextvars
+import copy
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import fields
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, TextIO
+
+from .batch_api import run_batch_job
+from .context import ConversationContext
+from .llm_client import BatchCollector, BatchPending, collect_batch
+from .tracing import trace_run
+from .usage import track_usage
+
+if TYPE_CHECKING:
+    from .orchestrator import Orchestrator, _LoopGuard
+
+_log = logging.getLogger(__name__)
+
+
+def iter_records(path: Path) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Stream ``(run_id, record)`` pairs from a JSONL file, one story per line.
+
+    The run id is the record's ``id`` field, falling back to its line number.
+    """
+    with path.open(encoding="utf-8") as handle:
+        for line_no, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield str(record.get("id", line_no)), record
+
+
+def _run_one(orchestrator: Orchestrator, run_id: str, record: dict[str, Any]) -> dict[str, Any]:
+    try:
+        result = orchestrator.run(
+            enabler_story=record["enabler_story"],
+            potential_fix=record["potential_fix"],
+            human_preferences=record.get("human_preferences"),
+            run_id=run_id,
+        )
+    except Exception as exc:  # one bad story must not abort the batch
+        return {"id": run_id, "error": f"{type(exc).__name__}: {exc}"}
+    return {"id": run_id, "result": result}
+
+
+def run_batch(
+    orchestrator: Orchestrator,
+    records: Iterable[tuple[str, dict[str, Any]]],
+    out: TextIO,
+    *,
+    workers: int = 4,
+) -> dict[str, int]:
+    """
+    Run every record through ``orchestrator`` on a pool of ``workers`` threads
+
+    Results are written to ``out`` as JSONL in completion order. At most ``2 * workers``
+    records are read ahead, so memory stays flat regardless of corpus size. When the
+    orchestrator has a checkpoint store, runs it reports as finished are skipped and
+    interrupted ones resume from their last completed stage.
+    Returns ``{"succeeded": n, "failed": m, "skipped": k}``.
+    """
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+    store = orchestrator.checkpoint_store
+
+    def drain(done: Iterable[Future]) -> None:
+        for future in done:
+            line = future.result()
+            counts["failed" if "error" in line else "succeeded"] += 1
+            out.write(json.dumps(line, ensure_ascii=False) + "\n")
+        out.flush()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="u2-batch") as pool:
+        pending: set[Future] = set()
+        for run_id, record in records:
+            if store is not None and store.is_finished(run_id):
+                counts["skipped"] += 1
+                continue
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                drain(done)
+            pending.add(pool.submit(_run_one, orchestrator, run_id, record))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            drain(done)
+    return counts
+
+
+class _OfflineRun:
+    """
+    One story advanced stage round by stage round under run_offline()
+
+    The run keeps its own contextvars.Context, holding its usage and metrics scopes, and every
+    step of its pipeline is executed inside it. Agents run on a copy of the conversation
+    context that is only adopted once all their completions have been answered.
+    """
+
+    def __init__(
+        self, orchestrator: Orchestrator, run_id: str, ctx: ConversationContext, start: str, guard: _LoopGuard
+    ):
+        self.orchestrator = orchestrator
+        self.run_id = run_id
+        self.ctx = ctx
+        self.collector = BatchCollector()
+        self.context = contextvars.Context()
+        self.request: tuple[str, bool, bool] | None = None
+        self.result: dict[str, Any] | None = None
+        self._scopes = [track_usage(), trace_run(orchestrator.tracer, run_id=run_id, offline=True)]
+        self.guard = guard
+        self._steps = orchestrator._pipeline(ctx, start, self.guard)
+        self.context.run(self._start)
+
+    def _start(self) -> None:
+        for scope in self._scopes:
+            scope.__enter__()
+        self._advance(None)
+
+    def _advance(self, reply: Any) -> None:
+        """Send ``reply`` to the pipeline and run it up to its next agent request or its end"""
+        try:
+            while True:
+                kind, stage, arg = self._steps.send(reply)
+                reply = None
+                if kind == "agent":
+                    self.request = (stage, arg, self.guard.memoizable(stage, arg))
+                    return
+                if kind == "feedback":
+                    raise RuntimeError("Offline batch runs cannot ask for human feedback")
+                self.orchestrator._save_checkpoint(self.run_id, stage, self.ctx, guard=self.guard)
+        except StopIteration as stop:
+            self.request = None
+            self.result = stop.value
+            self.orchestrator._finished(self.run_id, self.ctx, stop.value)
+            for scope in reversed(self._scopes):
+                scope.__exit__(None, None, None)
+
+    def step(self) -> None:
+        """Run agents until one has a completion pending in the next batch job, or the run ends"""
+        self.context.run(self._step)
+
+    def _step(self) -> None:
+        while self.request is not None:
+            stage, restart, memoize = self.request
+            trial = copy.deepcopy(self.ctx)
+            try:
+                with collect_batch(self.collector):
+                    output = self.orchestrator._run_agent(stage, trial, restart=restart, memoize=memoize)
+            except BatchPending:
+                return
+            for f in fields(trial):
+                setattr(self.ctx, f.name, getattr(trial, f.name))
+            self.collector.answers.clear()
+            self._advance(output)
+
+    def answer(self, custom_id: str, response: Any, charge: bool = True) -> None:
+        self.context.run(self.collector.answer, custom_id, response, charge)
+
+    def close(self, error: BaseException) -> None:
+        """Leave the run's usage and metrics scopes after it failed, recording ``error`` on its span"""
+        self.context.run(self._close, error)
+
+    def _close(self, error: BaseException) -> None:
+        for scope in reversed(self._scopes):
+            scope.__exit__(type(error), error, error.__traceback__)
+
+
+def run_offline(
+    orchestrator: Orchestrator,
+    records: Iterable[tuple[str, dict[str, Any]]],
+    out: TextIO,
+    *,
+    poll_interval: float | None = None,
+) -> dict[str, int]:
+    """
+    Run every record through ``orchestrator`` with one provider batch job per stage round
+
+    Every run is advanced until its agent needs a completion; the completions of all runs are
+    then submitted together (see batch_api.run_batch_job), which is logged at INFO level, and,
+    once the job has finished, every run is advanced again. Agents are rerun with the answered
+    completions replayed, so one making several LLM calls takes a round per call.
+
+    Identical requests from several runs are submitted once and billed once, to the first run
+    that queued them; the other runs record the answer like a cache hit (see
+    BatchCollector.answer), so summing the runs' usage gives what the batch job cost.
+    Results are written to ``out`` as JSONL, in the format of run_batch(), as runs finish.
+    Checkpoints behave as in run_batch(). Returns ``{"succeeded": n, "failed": m, "skipped": k}``.
+    """
+    if orchestrator.interactive:
+        raise ValueError("Offline batch mode cannot be combined with interactive mode")
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+    store = orchestrator.checkpoint_store
+    active: list[_OfflineRun] = []
+
+    def fail(run_id: str, exc: BaseException) -> None:
+        counts["failed"] += 1
+        out.write(json.dumps({"id": run_id, "error": f"{type(exc).__name__}: {exc}"}, ensure_ascii=False) + "\n")
+
+    def step(runs: Iterable[_OfflineRun]) -> list[_OfflineRun]:
+        waiting = []
+        for run in runs:
+            try:
+                run.step()
+            except Exception as exc:  # one bad story must not abort the batch
+                run.close(exc)
+                fail(run.run_id, exc)
+                continue
+            if run.result is not None:
+                counts["succeeded"] += 1
+                out.write(json.dumps({"id": run.run_id, "result": run.result}, ensure_ascii=False) + "\n")
+            else:
+                waiting.append(run)
+        out.flush()
+        return waiting
+
+    for run_id, record in records:
+        if store is not None and store.is_finished(run_id):
+            counts["skipped"] += 1
+            continue
+        try:
+            ctx, start, result, guard = orchestrator._begin(
+                run_id, record["enabler_story"], record["potential_fix"], record.get("human_preferences")
+            )
+            if start == "done":
+                # A near-duplicate's result was reused.
+                counts["succeeded"] += 1
+                out.write(json.dumps({"id": run_id, "result": result}, ensure_ascii=False) + "\n")
+                continue
+            active.append(_OfflineRun(orchestrator, run_id, ctx, start, guard))
+        except Exception as exc:
+            fail(run_id, exc)
+
+    active = step(active)
+    try:
+        while active:
+            requests: dict[str, dict[str, Any]] = {}
+            for run in active:
+                for custom_id, pending in run.collector.pending.items():
+                    requests.setdefault(custom_id, pending.request)
+            _log.info("Submitting batch of %d requests for %d runs", len(requests), len(active))
+            responses = run_batch_job(requests, poll_interval=poll_interval)
+            answered = []
+            charged: set[str] = set()
+            for run in active:
+                try:
+                    for custom_id in list(run.collector.pending):
+                        run.answer(custom_id, responses[custom_id], charge=custom_id not in charged)
+                        charged.add(custom_id)
+                except Exception as exc:
+                    run.close(exc)
+                    fail(run.run_id, exc)
+                    continue
+                answered.append(run)
+            active = step(answered)
+    except BaseException as exc:
+        # Unfinished runs keep their checkpoints and resume on the next call.
+        for run in active:
+            run.close(exc)
+        raise
+    return counts
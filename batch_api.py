@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import json
+import time
+from types import SimpleNamespace
+from typing import Any
+
+from .llm_client import _shared_client, _with_retries
+from .settings import settings
+
+ENDPOINT = "/v1/chat/completions"
+_TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchRequestError(RuntimeError):
+    """A request the provider's batch job answered with an error, or did not answer at all"""
+
+
+def run_batch_job(
+    requests: dict[str, dict[str, Any]],
+    *,
+    client: Any = None,
+    poll_interval: float | None = None,
+) -> dict[str, Any]:
+    """
+    Answer chat completion ``requests`` (keyed by ``custom_id``) through the provider Batch API
+
+    Requests are uploaded as OpenAI Batch JSONL in jobs of at most ``U2_BATCH_MAX_REQUESTS``,
+    which are polled every ``U2_BATCH_POLL_INTERVAL`` seconds until they end. Returns each
+    ``custom_id``'s completion, in the shape of a ``chat.completions.create`` response, or a
+    BatchRequestError. ``client`` defaults to the shared OpenAI client (or the override_clients()
+    one, e.g. a FakeLLMBackend acting as a local batch server).
+    """
+    client = client or _shared_client(settings.openai_api_key)
+    poll_interval = settings.batch_poll_interval if poll_interval is None else poll_interval
+    ids = list(requests)
+    size = max(settings.batch_max_requests, 1)
+    jobs = [
+        _submit(client, {custom_id: requests[custom_id] for custom_id in ids[start:start + size]})
+        for start in range(0, len(ids), size)
+    ]
+    results: dict[str, Any] = {}
+    while jobs:
+        batches = [_retrieve(client, job.id) for job in jobs]
+        jobs = [batch for batch in batches if batch.status not in _TERMINAL]
+        for batch in batches:
+            if batch.status in _TERMINAL:
+                results.update(_read_results(client, batch))
+        if jobs:
+            time.sleep(poll_interval)
+    for custom_id in ids:
+        results.setdefault(custom_id, BatchRequestError(f"Batch job returned no result for {custom_id}"))
+    return results
+
+
+@_with_retries
+def _submit(client: Any, requests: dict[str, dict[str, Any]]) -> Any:
+    lines = []
+    for custom_id, request in requests.items():
+        body = dict(request)
+        # SDK-only passthrough parameters go into the raw request body.
+        body.update(body.pop("extra_body", None) or {})
+        line = {"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body}
+        lines.append(json.dumps(line, ensure_ascii=False))
+    upload = client.files.create(file=("batch.jsonl", ("\n".join(lines) + "\n").encode("utf-8")), purpose="batch")
+    return client.batches.create(
+        input_file_id=upload.id, endpoint=ENDPOINT, completion_window=settings.batch_completion_window
+    )
+
+
+@_with_retries
+def _retrieve(client: Any, batch_id: str) -> Any:
+    return client.batches.retrieve(batch_id)
+
+
+@_with_retries
+def _read_results(client: Any, batch: Any) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    for file_id in (getattr(batch, "output_file_id", None), getattr(batch, "error_file_id", None)):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if line.strip():
+                custom_id, result = _parse_line(line)
+                results[custom_id] = result
+    return results
+
+
+def _parse_line(line: str) -> tuple[str, Any]:
+    # object_hook gives the body attribute access, like the SDK's response models.
+    record = json.loads(line, object_hook=lambda data: SimpleNamespace(**data))
+    response = getattr(record, "response", None)
+    error = getattr(record, "error", None)
+    if error is None and response is not None and response.status_code == 200:
+        return record.custom_id, response.body
+    if error is None:
+        # A non-200 response carries the API error in its body.
+        error = getattr(getattr(response, "body", None), "error", None)
+    message = getattr(error, "message", None) or f"HTTP {getattr(response, 'status_code', '?')}"
+    return record.custom_id, BatchRequestError(f"Batch request {record.custom_id} failed: {message}")
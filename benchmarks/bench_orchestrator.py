@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any
+
+from ..batch import run_batch
+from ..events import StageEvent
+from ..fake_llm import FakeLLMBackend, LatencyModel
+from ..llm_client import override_clients
+from ..orchestrator import Orchestrator
+
+SCRIPTED_RESPONSES = {
+    "discovery": (
+        "===== DISCOVERY AGENT ANALYSIS =====\n"
+        "Core Problem:\nNightly alert noise exhausts on-call engineers.\n"
+        "Baseline Solution:\nTune static thresholds and add dashboards.\n"
+        "Critical Defects Analysis:\nLimitation 1:\n- Name: Static thresholds\n- Risk Level: High\n"
+        "===== END DISCOVERY ANALYSIS ====="
+    ),
+    "exploration": (
+        "===== EXPLORATION AGENT ANALYSIS =====\n"
+        + "\n".join(f"UU #{n}: Candidate {n}\nValidation Score: 0.9\nPriority Level: High" for n in range(1, 4))
+        + "\n===== END EXPLORATION ANALYSIS ====="
+    ),
+    "integration": "===== INTEGRATION SYNTHESIS =====\nPrimary Recommendation:\nAdopt UU #1.\n===== END INTEGRATION SYNTHESIS =====",
+}
+
+STORY = {
+    "enabler_story": "As a platform reliability lead, I want automated nighttime anomaly detection.",
+    "potential_fix": "Introduce new anomaly detection heuristics with configurable thresholds.",
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class _NullWriter:
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def _backend(latency: LatencyModel) -> FakeLLMBackend:
+    return FakeLLMBackend(SCRIPTED_RESPONSES, latency=latency)
+
+
+def measure_overhead(runs: int) -> float:
+    """Milliseconds per run spent outside the (zero-latency) LLM calls."""
+    backend = _backend(LatencyModel())
+    with override_clients(backend, backend.async_client()):
+        orchestrator = Orchestrator()
+        orchestrator.run(**STORY)  # warm up imports and tokenizer caches
+        start = time.perf_counter()
+        for _ in range(runs):
+            orchestrator.run(**STORY)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def measure_stage_latency(runs: int, latency: LatencyModel) -> dict[str, dict[str, float]]:
+    started: dict[str, float] = {}
+    samples: dict[str, list[float]] = {}
+
+    def on_event(event: StageEvent) -> None:
+        if event.kind == "stage_started":
+            started[event.stage] = event.timestamp
+        elif event.kind == "stage_finished":
+            samples.setdefault(event.stage, []).append((event.timestamp - started.pop(event.stage)) * 1000)
+
+    backend = _backend(latency)
+    with override_clients(backend, backend.async_client()):
+        orchestrator = Orchestrator(event_callback=on_event)
+        for _ in range(runs):
+            orchestrator.run(**STORY)
+    return {
+        stage: {"p50": round(percentile(values, 50), 2), "p99": round(percentile(values, 99), 2)}
+        for stage, values in samples.items()
+    }
+
+
+def measure_memory(runs: int) -> float:
+    """KiB retained per finished run, keeping every result alive as a batch caller would."""
+    backend = _backend(LatencyModel())
+    with override_clients(backend, backend.async_client()):
+        orchestrator = Orchestrator()
+        orchestrator.run(**STORY)
+        gc.collect()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        results = [orchestrator.run(**STORY) for _ in range(runs)]
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    del results
+    return (current - baseline) / runs / 1024
+
+
+def measure_batch(runs: int, workers: list[int], latency: LatencyModel) -> dict[int, float]:
+    throughput: dict[int, float] = {}
+    for count in workers:
+        backend = _backend(latency)
+        with override_clients(backend, backend.async_client()):
+            orchestrator = Orchestrator()
+            records = ((str(i), dict(STORY)) for i in range(runs))
+            start = time.perf_counter()
+            run_batch(orchestrator, records, _NullWriter(), workers=count)
+            throughput[count] = round(runs / (time.perf_counter() - start), 2)
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the orchestration loop against a fake LLM backend.")
+    parser.add_argument("--runs", type=int, default=100, help="Runs per measurement.")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mean simulated LLM latency.")
+    parser.add_argument("--spread", type=float, default=0.0, help="Latency spread: ms for uniform/normal, log-space sigma for lognormal.")
+    parser.add_argument("--distribution", default="fixed", choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--workers", default="1,4,16", help="Comma-separated worker counts for the batch path.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="Optional path to write the report as JSON.")
+    args = parser.parse_args()
+
+    spread = args.spread if args.distribution == "lognormal" else args.spread / 1000
+
+    def latency() -> LatencyModel:
+        return LatencyModel(args.distribution, args.latency_ms / 1000, spread, seed=args.seed)
+
+    report: dict[str, Any] = {
+        "runs": args.runs,
+        "latency": {"distribution": args.distribution, "mean_ms": args.latency_ms, "spread": args.spread},
+        "overhead_ms_per_run": round(measure_overhead(args.runs), 3),
+        "stage_latency_ms": measure_stage_latency(args.runs, latency()),
+        "memory_kib_per_run": round(measure_memory(args.runs), 2),
+        "batch": {
+            f"workers={count}": runs_per_sec
+            for count, runs_per_sec in measure_batch(
+                args.runs, [int(w) for w in args.workers.split(",")], latency()
+            ).items()
+        },
+    }
+    report["serial_runs_per_sec"] = report["batch"].get("workers=1")
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any
+
+PACKAGE = __package__.rpartition(".")[0]
+# Modules that must stay out of light imports: together they take most of a second to load.
+HEAVY_MODULES = ("openai", "httpx", "tenacity", "tiktoken")
+
+
+def import_time_ms(module: str) -> dict[str, Any]:
+    """Cumulative import time of ``module`` in a fresh interpreter (python -X importtime), without settings"""
+    env = {name: value for name, value in os.environ.items() if name != "OPENAI_API_KEY"}
+    code = f"import json, sys, {module}; print(json.dumps(sorted(set(sys.modules) & set({HEAVY_MODULES!r}))))"
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env, check=True
+    )
+    cumulative = 0
+    slowest: list[tuple[int, str]] = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        head, total_us, name = line.split("|")
+        self_us = head.removeprefix("import time:").strip()
+        if not self_us.isdigit():  # the column header
+            continue
+        slowest.append((int(self_us), name.strip()))
+        if name.strip() == module:
+            cumulative = int(total_us)
+    slowest.sort(reverse=True)
+    return {
+        "ms": round(cumulative / 1000, 2),
+        "heavy_modules": json.loads(process.stdout),
+        "slowest_self_ms": {name: round(us / 1000, 2) for us, name in slowest[:5]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import times of the package and its CLI against a budget.")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Maximum cumulative import time per module.")
+    parser.add_argument("--repeat", type=int, default=3, help="Measurements per module; the fastest counts.")
+    parser.add_argument(
+        "--module",
+        action="append",
+        help=f"Module to check (repeatable); defaults to {PACKAGE} and {PACKAGE}.cli.",
+    )
+    args = parser.parse_args()
+
+    report: dict[str, Any] = {"budget_ms": args.budget_ms, "modules": {}}
+    failed = False
+    for module in args.module or [PACKAGE, f"{PACKAGE}.cli"]:
+        result = min((import_time_ms(module) for _ in range(args.repeat)), key=lambda measured: measured["ms"])
+        result["ok"] = result["ms"] <= args.budget_ms and not result["heavy_modules"]
+        failed = failed or not result["ok"]
+        report["modules"][module] = result
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable
+
+from .settings import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE INDEX IF NOT EXISTS responses_created ON responses (created);
+"""
+
+# Writes between recounts of the cache size, which other processes sharing the file change too.
+_RECOUNT_WRITES = 1000
+
+
+class ResponseCache:
+    """SQLite-backed completion cache with TTL expiry and size-bounded LRU eviction.
+
+    Safe to share between threads; several processes may point at the same file. The total
+    size is tracked as entries are written and evicted, and only recounted from the table
+    every ``_RECOUNT_WRITES`` writes, so entries added by other processes are noticed late.
+    """
+
+    def __init__(self, path: str | Path, *, ttl: float | None = None, max_bytes: int | None = None):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Bytes of all entries, or None until the next recount.
+        self._size: int | None = None
+        self._writes = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def key(
+        model: str,
+        temperature: float,
+        top_p: float,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        response_format: dict[str, Any] | None = None,
+    ) -> str:
+        # Optional parameters only join the key when set, so existing entries stay valid.
+        parts: list[Any] = [model, temperature, top_p, messages]
+        if max_tokens is not None or response_format is not None:
+            parts.append(max_tokens)
+        if response_format is not None:
+            parts.append(response_format)
+        payload = json.dumps(
+            parts,
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._resize(-row[2])
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            replaced = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._resize(size - (replaced[0] if replaced else 0))
+            self._evict()
+
+    def _resize(self, delta: int) -> None:
+        if self._size is not None:
+            self._size += delta
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            cutoff = time.time() - self.ttl
+            (expired,) = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses WHERE created < ?", (cutoff,)
+            ).fetchone()
+            if expired:
+                self._conn.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+                self._resize(-expired)
+        if self.max_bytes is None:
+            return
+        self._writes += 1
+        if self._size is None or self._writes >= _RECOUNT_WRITES:
+            (self._size,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+            self._writes = 0
+        if self._size <= self.max_bytes:
+            return
+        stale: list[str] = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if self._size <= self.max_bytes:
+                break
+            stale.append(key)
+            self._size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in stale])
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._size = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryTTLCache:
+    """Thread-safe in-process LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, max_entries: int, ttl: float | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_shared: dict[Path, ResponseCache] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache() -> ResponseCache | None:
+    """Return the process-wide cache configured by ``U2_CACHE_PATH``, or None when disabled."""
+    if not settings.cache_path:
+        return None
+    path = Path(settings.cache_path).expanduser()
+    with _shared_lock:
+        cache = _shared.get(path)
+        if cache is None:
+            cache = ResponseCache(path, ttl=settings.cache_ttl, max_bytes=settings.cache_max_bytes)
+            _shared[path] = cache
+        return cache
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any
+
+# One emphasis per strategy of EXPLORATION_PROMPT, appended as a final system message.
+STRATEGY_EMPHASES = (
+    "For this analysis, emphasize STRATEGY 1 (Cross-Domain Analogical Reasoning): explore more source "
+    "domains and map each analogue carefully back to the software problem.",
+    "For this analysis, emphasize STRATEGY 2 (Reverse Thinking): work backward from the ideal end-state "
+    "and hunt for hidden prerequisites and unnecessary components.",
+    "For this analysis, emphasize STRATEGY 3 (External Validation): report fewer UUs, each backed by "
+    "concrete evidence for every validation criterion.",
+)
+
+_UU_HEADING = re.compile(r"^\s*UU #(\d+)", re.MULTILINE)
+_VALIDATION_SCORE = re.compile(r"Validation Score:\s*([01](?:\.\d+)?)")
+
+
+@dataclass
+class CandidateVariant:
+    temperature: float
+    emphasis: str | None = None
+
+
+def candidate_variants(count: int, temperature: float, spread: float) -> list[CandidateVariant]:
+    """
+    Return ``count`` variants: the unmodified prompt at ``temperature`` first, then the three
+    strategy emphases in turn at temperatures alternately ``spread`` above and below it
+    """
+    variants = [CandidateVariant(temperature)]
+    for index in range(1, count):
+        offset = spread * ((index + 1) // 2) * (1 if index % 2 else -1)
+        variants.append(
+            CandidateVariant(
+                temperature=min(max(temperature + offset, 0.0), 2.0),
+                emphasis=STRATEGY_EMPHASES[(index - 1) % len(STRATEGY_EMPHASES)],
+            )
+        )
+    return variants
+
+
+def score_exploration(output: Any) -> float:
+    """
+    Cheap quality score of an ExplorationOutput: the number of distinct validated UUs, plus
+    their mean validation score (0-1) to break ties
+    """
+    text = f"{output.validated_uus}\n{output.analysis}"
+    uus = len(set(_UU_HEADING.findall(text)))
+    scores = [float(value) for value in _VALIDATION_SCORE.findall(text) if float(value) <= 1.0]
+    return uus + (sum(scores) / len(scores) if scores else 0.0)
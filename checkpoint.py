@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Iterator
+
+
+class CheckpointStore(ABC):
+    """
+    Persistence interface for in-progress orchestrator runs
+
+    A checkpoint is a JSON-serializable dict with keys ``run_id``, ``stage`` (the next stage
+    to execute, or ``"done"``), ``context`` (``ConversationContext.to_dict()``), ``result`` and
+    ``guard`` (the run's loop guard at that stage, or None).
+    """
+
+    @abstractmethod
+    def load(self, run_id: str) -> dict[str, Any] | None:
+        ...
+
+    @abstractmethod
+    def save(self, run_id: str, checkpoint: dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, run_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def run_ids(self) -> Iterator[str]:
+        """The run_id of every stored checkpoint."""
+
+    def is_finished(self, run_id: str) -> bool:
+        checkpoint = self.load(run_id)
+        return checkpoint is not None and checkpoint["stage"] == "done"
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    """Checkpoints kept by this process only, serialized like FileCheckpointStore's."""
+
+    def __init__(self):
+        self._checkpoints: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def load(self, run_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            stored = self._checkpoints.get(run_id)
+        return json.loads(stored) if stored is not None else None
+
+    def save(self, run_id: str, checkpoint: dict[str, Any]) -> None:
+        stored = json.dumps(checkpoint, ensure_ascii=False)
+        with self._lock:
+            self._checkpoints[run_id] = stored
+
+    def delete(self, run_id: str) -> None:
+        with self._lock:
+            self._checkpoints.pop(run_id, None)
+
+    def run_ids(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._checkpoints))
+
+
+class FileCheckpointStore(CheckpointStore):
+    """
+    One JSON file per run, replaced atomically on every save
+
+    The file is named after the run_id with unsafe characters replaced, plus a hash of the
+    run_id itself, so that e.g. 'a/b' and 'a_b' do not share a file.
+    """
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, run_id: str) -> Path:
+        digest = hashlib.sha256(run_id.encode("utf-8")).hexdigest()[:12]
+        return self.directory / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', run_id)}-{digest}.json"
+
+    def load(self, run_id: str) -> dict[str, Any] | None:
+        path = self._path(run_id)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def save(self, run_id: str, checkpoint: dict[str, Any]) -> None:
+        path = self._path(run_id)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(checkpoint, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def delete(self, run_id: str) -> None:
+        self._path(run_id).unlink(missing_ok=True)
+
+    def run_ids(self) -> Iterator[str]:
+        for path in self.directory.glob("*.json"):
+            try:
+                yield json.loads(path.read_text(encoding="utf-8"))["run_id"]
+            except (OSError, ValueError, KeyError):
+                # Deleted or replaced while listing.
+                continue
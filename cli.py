@@ -1,31 +1,75 @@
 ﻿from __future__ import annotations
 
 import argparse
+import hashlib
 import json
+import logging
+import sys
 from pathlib import Path
 
-from .orchestrator import Orchestrator
+# Pipeline modules are imported only once arguments are parsed, so --help and --validate stay fast.
 
 
 def main():
     parser = argparse.ArgumentParser(description="Run U2Facilitator agent pipeline.")
-    parser.add_argument("--input", type=Path, required=True, help="Path to JSON input.")
-    parser.add_argument("--output", type=Path, help="Optional path to write JSON result.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", type=Path, help="Path to JSON input.")
+    source.add_argument("--batch", type=Path, help="Path to JSONL corpus, one story per line.")
+    source.add_argument("--serve", action="store_true", help="Serve the HTTP job API instead of running one input.")
+    parser.add_argument("--output", type=Path, help="Optional path to write JSON result (JSONL in batch mode).")
     parser.add_argument("--interactive", "-i", action="store_true", 
                        help="Enable interactive mode with human-in-the-loop at each agent stage.")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel runs in batch and serve mode.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address the job API listens on.")
+    parser.add_argument("--port", type=int, default=8000, help="Port the job API listens on.")
+    parser.add_argument("--offline", action="store_true",
+                       help="In batch mode, submit each stage round as one provider Batch API job.")
+    parser.add_argument("--checkpoint-dir", type=Path,
+                       help="Persist runs here after each stage; reruns resume, and batch mode skips finished stories.")
+    parser.add_argument("--validate", action="store_true",
+                       help="Check the settings and input stories, then exit without running the pipeline.")
+    parser.add_argument("--run-id",
+                       help="Checkpoint and dedupe key of the --input story (default: its id, else its resolved path).")
     args = parser.parse_args()
 
+    if args.run_id is not None and not args.input:
+        parser.error("--run-id requires --input")
+
+    if args.validate:
+        if args.serve:
+            parser.error("--validate requires --input or --batch")
+        sys.exit(_validate(args))
+
+    if args.serve:
+        if args.interactive or args.offline:
+            parser.error("--serve jobs choose interactivity per submission and cannot run offline")
+        _main_serve(args)
+        return
+
+    if args.batch:
+        if args.interactive:
+            parser.error("--interactive cannot be combined with --batch")
+        _main_batch(args)
+        return
+    if args.offline:
+        parser.error("--offline requires --batch")
+
+    from .checkpoint import FileCheckpointStore
+    from .orchestrator import Orchestrator
+
     payload = json.loads(args.input.read_text(encoding="utf-8"))
     
     if args.interactive:
         print("\n" + "🚀 Interactive Mode - You will participate in decisions after each agent stage".center(80, "="))
         print()
     
-    orchestrator = Orchestrator(interactive=args.interactive)
+    store = FileCheckpointStore(args.checkpoint_dir) if args.checkpoint_dir else None
+    orchestrator = Orchestrator(interactive=args.interactive, checkpoint_store=store)
     result_json = orchestrator.run_to_json(
         enabler_story=payload["enabler_story"],
         potential_fix=payload["potential_fix"],
         human_preferences=payload.get("human_preferences"),
+        run_id=_input_run_id(args, payload),
     )
 
     if args.output:
@@ -38,5 +82,93 @@ def main():
         print(result_json)
 
 
+def _input_run_id(args: argparse.Namespace, payload: dict) -> str:
+    """
+    Run id of the --input story: --run-id, else the story's "id", else derived from its file
+
+    A derived id hashes the resolved path, so same-named files in different directories
+    neither share a checkpoint nor replace each other in the story index.
+    """
+    if args.run_id is not None:
+        return args.run_id
+    if "id" in payload:
+        return str(payload["id"])
+    digest = hashlib.sha256(str(args.input.resolve()).encode("utf-8")).hexdigest()[:12]
+    return f"{args.input.stem}-{digest}"
+
+
+def _validate(args: argparse.Namespace) -> int:
+    """Report invalid settings and stories on stderr; returns the exit status"""
+    from .batch import iter_records
+    from .settings import get_settings
+
+    errors = []
+    try:
+        get_settings()
+    except Exception as exc:
+        errors.append(f"settings: {exc}")
+    try:
+        if args.batch:
+            records = list(iter_records(args.batch))
+        else:
+            payload = json.loads(args.input.read_text(encoding="utf-8"))
+            records = [(_input_run_id(args, payload), payload)]
+    except (OSError, ValueError, AttributeError) as exc:
+        # AttributeError: a line holding JSON other than an object.
+        errors.append(f"input: {exc}")
+        records = []
+    for run_id, record in records:
+        for name in ("enabler_story", "potential_fix"):
+            if not isinstance(record.get(name), str) or not record[name].strip():
+                errors.append(f"story {run_id}: missing {name}")
+    for error in errors:
+        print(error, file=sys.stderr)
+    print(f"Validated {len(records)} stories: {len(errors)} errors", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def _main_serve(args: argparse.Namespace) -> None:
+    import asyncio
+
+    from .checkpoint import FileCheckpointStore
+    from .service import serve
+
+    store = FileCheckpointStore(args.checkpoint_dir) if args.checkpoint_dir else None
+    print(f"Serving the job API on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers, checkpoint_store=store))
+    except KeyboardInterrupt:
+        pass
+
+
+def _main_batch(args: argparse.Namespace) -> None:
+    from .batch import iter_records, run_batch, run_offline
+    from .checkpoint import FileCheckpointStore
+    from .orchestrator import Orchestrator
+
+    store = FileCheckpointStore(args.checkpoint_dir) if args.checkpoint_dir else None
+    orchestrator = Orchestrator(checkpoint_store=store)
+    records = iter_records(args.batch)
+
+    def run(out):
+        if args.offline:
+            logging.basicConfig(level=logging.INFO, format="%(message)s")
+            counts = run_offline(orchestrator, records, out)
+        else:
+            counts = run_batch(orchestrator, records, out, workers=args.workers)
+        print(
+            f"{'Offline batch' if args.offline else 'Batch'} finished: {counts['succeeded']} succeeded, "
+            f"{counts['failed']} failed, {counts['skipped']} skipped",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        # Append when resuming so results of previously finished stories are kept.
+        with args.output.open("a" if store else "w", encoding="utf-8") as out:
+            run(out)
+    else:
+        run(sys.stdout)
+
+
 if __name__ == "__main__":
     main()
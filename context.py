@@ -1,30 +1,131 @@
 ﻿from __future__ import annotations
 
-from dataclasses import dataclass, field
+from collections import deque
+from collections.abc import MutableSequence
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterable, Iterator
 
+from .settings import settings
 
-@dataclass
+
+# Field descriptions double as the JSON-schema descriptions of structured agent output.
+@dataclass(slots=True)
 class DiscoveryOutput:
-    core_problem: str
-    baseline_solution: str
-    critical_defects: str
+    core_problem: str = field(metadata={"description": "Refined core problem statement"})
+    baseline_solution: str = field(metadata={"description": "Conventional baseline solution built on the potential fix"})
+    critical_defects: str = field(metadata={"description": "Critical defects analysis: every limitation with its details"})
 
 
-@dataclass
+@dataclass(slots=True)
 class ExplorationOutput:
-    analysis: str
-    validated_uus: str
-    requires_discovery_reset: bool = False
-    requires_more_validation: bool = False
+    analysis: str = field(metadata={"description": "Full exploration analysis"})
+    validated_uus: str = field(metadata={"description": "Validated Unknown Unknowns in the UU reporting format"})
+    requires_discovery_reset: bool = field(
+        default=False, metadata={"description": "True if the problem definition must be rediscovered"}
+    )
+    requires_more_validation: bool = field(
+        default=False, metadata={"description": "True if validation evidence is insufficient"}
+    )
 
 
-@dataclass
+@dataclass(slots=True)
 class IntegrationOutput:
-    synthesis: str
-    callback: str | None = None
+    synthesis: str = field(metadata={"description": "Full integration synthesis"})
+    callback: str | None = field(
+        default=None,
+        metadata={"description": "Agent to call back, if any", "enum": ["exploration", "discovery", None]},
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class SearchEntry:
+    """One search: its query (None for free-form text) and the rendered results"""
+
+    query: str | None
+    results: str
+
+    @classmethod
+    def parse(cls, text: str) -> SearchEntry:
+        """Inverse of str(), for search logs stored as rendered text."""
+        if text.startswith("Query: "):
+            query, _, results = text[len("Query: "):].partition("\n")
+            return cls(query, results)
+        return cls(None, text)
+
+    def __str__(self) -> str:
+        return self.results if self.query is None else f"Query: {self.query}\n{self.results}"
+
+
+class SearchLog(MutableSequence):
+    """
+    Bounded ring buffer of SearchEntry, read as a sequence of "Query: ...\n<results>" strings
+
+    Holds at most ``maxlen`` entries (``U2_SEARCH_LOG_MAX_ENTRIES`` by default, None for no
+    limit), dropping the oldest. Appending a search already in the log moves it to the end
+    instead of storing it again, so callback loops repeating their searches do not grow it.
+    """
+
+    __slots__ = ("_entries",)
+
+    def __init__(self, entries: Iterable[str | SearchEntry] = (), maxlen: int | None = -1):
+        self._entries: deque[SearchEntry] = deque(maxlen=settings.search_log_max_entries if maxlen == -1 else maxlen)
+        for entry in entries:
+            self.append(entry)
+
+    @property
+    def maxlen(self) -> int | None:
+        return self._entries.maxlen
+
+    def entries(self) -> list[SearchEntry]:
+        return list(self._entries)
+
+    def append(self, value: str | SearchEntry) -> None:
+        entry = _search_entry(value)
+        try:
+            self._entries.remove(entry)
+        except ValueError:
+            pass
+        self._entries.append(entry)
 
+    def insert(self, index: int, value: str | SearchEntry) -> None:
+        if len(self._entries) == self._entries.maxlen:
+            if index == 0:
+                return
+            self._entries.popleft()
+            index -= 1
+        self._entries.insert(index, _search_entry(value))
 
-@dataclass
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [str(entry) for entry in list(self._entries)[index]]
+        return str(self._entries[index])
+
+    def __setitem__(self, index: int, value: str | SearchEntry) -> None:
+        self._entries[index] = _search_entry(value)
+
+    def __delitem__(self, index: int) -> None:
+        del self._entries[index]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return (str(entry) for entry in self._entries)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (SearchLog, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"SearchLog({list(self)!r}, maxlen={self.maxlen})"
+
+
+def _search_entry(value: str | SearchEntry) -> SearchEntry:
+    return value if isinstance(value, SearchEntry) else SearchEntry.parse(value)
+
+
+@dataclass(slots=True)
 class ConversationContext:
     enabler_story: str
     potential_fix: str
@@ -32,7 +133,31 @@ class ConversationContext:
     discovery: DiscoveryOutput | None = None
     exploration: ExplorationOutput | None = None
     integration: IntegrationOutput | None = None
-    search_log: list[str] = field(default_factory=list)
+    search_log: SearchLog = field(default_factory=SearchLog)
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.search_log, SearchLog):
+            self.search_log = SearchLog(self.search_log)
 
     def append_search(self, query: str, results: str) -> None:
-        self.search_log.append(f"Query: {query}\n{results}")
+        self.search_log.append(SearchEntry(query, results))
+
+    def to_dict(self) -> dict[str, Any]:
+        data = {name: getattr(self, name) for name in ("enabler_story", "potential_fix", "human_preferences")}
+        for name in ("discovery", "exploration", "integration"):
+            output = getattr(self, name)
+            data[name] = asdict(output) if output is not None else None
+        data["search_log"] = list(self.search_log)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> ConversationContext:
+        data = dict(data)
+        for name, output_type in (
+            ("discovery", DiscoveryOutput),
+            ("exploration", ExplorationOutput),
+            ("integration", IntegrationOutput),
+        ):
+            if data.get(name) is not None:
+                data[name] = output_type(**data[name])
+        return cls(**data)
@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Iterator, TextIO
+
+from .batch import iter_records
+from .llm_client import LLMClient, override_call
+from .settings import settings
+from .usage import stage_scope, track_usage
+
+# The baseline prompting strategies of baselineprompt.md, sent as the system message.
+BASELINE_PROMPTS = {
+    "zsp": (
+        "You are given a software project description and its current requirements.\n"
+        'Please identify potential "unknown unknowns"—factors or opportunities that are not explicitly mentioned\n'
+        "but could significantly change the system design, architecture, or user experience.\n"
+        "Explain why each identified factor was likely missing from the original requirements."
+    ),
+    "rbp": (
+        "You are acting as a senior software architect responsible for uncovering missing assumptions and hidden "
+        "dependencies\nthat may affect long-term system scalability and innovation.\n"
+        'Based on the project description and requirements below, identify possible "unknown unknowns"—\n'
+        "concepts, constraints, or opportunities that are absent but could fundamentally reshape the system.\n"
+        "For each UU, explain:\n1. Why it was overlooked.\n2. How it could influence design or architecture."
+    ),
+    "tbp": (
+        "Analyze the following project in four steps:\n"
+        "Step 1 — Identify any implicit assumptions in the given requirements.\n"
+        "Step 2 — Consider cross-domain or regulatory factors that may have been overlooked.\n"
+        'Step 3 — Suggest one or more potential "unknown unknowns" that could expand or constrain the solution '
+        "space.\n"
+        "Step 4 — Justify each UU by explaining:\n"
+        "  - (a) Evidence of absence in the current documentation.\n"
+        "  - (b) How discovery could alter design decisions or enable new capabilities.\n"
+        "Return your answer in the following structured format:\n\n"
+        "[\n  {\n"
+        '    "UU_Name": "",\n'
+        '    "Type": "(Cross-Domain / Regulatory / Technical / User-Context / Performance)",\n'
+        '    "Description": "",\n'
+        '    "Justification": ""\n'
+        "  }\n]"
+    ),
+}
+SYSTEMS = ("u2f", *BASELINE_PROMPTS)
+
+# The four acceptance criteria of "UU EVALUATION CASE STUDIES.md", with its worked examples.
+JUDGE_PROMPT = """You review software requirement analyses for genuine "unknown unknowns" (UUs).
+
+List every distinct UU candidate proposed in the analysis below and judge each one against four criteria:
+1. Absence: the factor is absent from the project description and requirements, not merely implied by them.
+2. Emergence: it was discovered through exploration, not an activity already planned or expected.
+3. Transformation: it reshapes the solution space (architecture, constraints or capabilities), not a local tweak.
+4. Non-routine: it is a conceptual leap beyond standard engineering practice.
+Mark each criterion the candidate passes as true; a split or doubtful decision is false.
+
+Accepted examples: an event-driven architecture turning a notification system into real-time collaboration;
+GDPR data residency forcing geo-distributed storage behind a file upload feature; passwordless WebAuthn for a
+mobile user base with biometric sensors; CQRS instead of read replicas; a PWA with service workers removing
+the need for a CDN.
+Rejected examples: API rate limiting (routine, fails 4); optimizing indices after performance testing
+(planned, fails 2); adding logging to a new service (implied and routine, fails 1 and 4).
+
+[Project Description]
+{enabler_story}
+
+[Current Requirements]
+- {potential_fix}
+
+[Analysis]
+{output}"""
+
+
+@dataclass
+class CandidateVerdict:
+    name: str = field(metadata={"description": "Short name of the UU candidate"})
+    absence: bool = field(default=False, metadata={"description": "Passes criterion 1 (absence)"})
+    emergence: bool = field(default=False, metadata={"description": "Passes criterion 2 (emergence)"})
+    transformation: bool = field(default=False, metadata={"description": "Passes criterion 3 (transformation)"})
+    non_routine: bool = field(default=False, metadata={"description": "Passes criterion 4 (non-routine)"})
+    rationale: str = field(default="", metadata={"description": "The failed criteria and why, in a few words"})
+
+
+@dataclass
+class JudgeVerdict:
+    candidates: list[CandidateVerdict] = field(
+        default_factory=list, metadata={"description": "Every distinct UU candidate, judged on each criterion"}
+    )
+
+
+CRITERIA = ("absence", "emergence", "transformation", "non_routine")
+_VERDICT_FIELDS = ("verdict", "scores", "judge_usage", "error")
+
+
+def verdict_scores(verdict: JudgeVerdict) -> dict[str, int]:
+    """
+    Candidates, passes per criterion and accepted candidates of ``verdict``
+
+    Counted here rather than by the judge, so a candidate is accepted exactly when it passes
+    all four criteria and no count can exceed the number of candidates.
+    """
+    scores = {"candidates": len(verdict.candidates)}
+    for criterion in CRITERIA:
+        scores[criterion] = sum(bool(getattr(candidate, criterion)) for candidate in verdict.candidates)
+    scores["accepted"] = sum(
+        all(getattr(candidate, criterion) for criterion in CRITERIA) for candidate in verdict.candidates
+    )
+    return scores
+
+
+def baseline_messages(system: str, story: dict[str, Any]) -> list[dict[str, str]]:
+    """Messages of a baseline strategy, with the story in the input format of baselineprompt.md"""
+    role = "[Role]\nSenior Software Architect\n\n" if system == "rbp" else ""
+    task = "" if system == "tbp" else "\n\n[Your Task]\nIdentify potential unknown unknowns (UUs)."
+    user = (
+        f"{role}[Project Description]\n{story['enabler_story']}\n\n"
+        f"[Current Requirements]\n- {story['potential_fix']}{task}"
+    )
+    return [{"role": "system", "content": BASELINE_PROMPTS[system]}, {"role": "user", "content": user}]
+
+
+class Evaluator:
+    """
+    Runs U2F and the baseline strategies on stories and scores their output with an LLM judge
+
+    Baselines are answered by one completion each, attributed to a stage named after the
+    strategy ('zsp', 'rbp', 'tbp'); judging happens in the 'judge' stage at temperature 0, so
+    ``U2_STAGE_MODELS`` can give the judge its own model. Completions go through the response
+    cache when ``U2_CACHE_PATH`` is set, so a repeated evaluation does not pay twice for them.
+    Per-token metrics count a cached completion's tokens all the same (``logical_tokens``);
+    only ``billed_tokens`` and the cost leave them out.
+
+    The default orchestrator has no story index and no stage memo: a run answered from an
+    earlier one reports no tokens or cost of its own, which would inflate U2F's accepted UUs
+    per 1K tokens.
+    """
+
+    def __init__(self, orchestrator: Any = None, client: LLMClient | None = None):
+        if orchestrator is None:
+            from .orchestrator import Orchestrator
+
+            orchestrator = Orchestrator()
+            orchestrator.story_index = None
+            orchestrator.stage_memo = None
+        self.orchestrator = orchestrator
+        self.client = client or LLMClient()
+
+    def generate(self, run_id: str, story: dict[str, Any], system: str) -> dict[str, Any]:
+        """One system's answer to ``story`` with the tokens (logical and billed), cost and seconds it took"""
+        started = time.perf_counter()
+        if system == "u2f":
+            result = self.orchestrator.run(
+                enabler_story=story["enabler_story"],
+                potential_fix=story["potential_fix"],
+                human_preferences=story.get("human_preferences"),
+            )
+            output = f"{result['exploration_analysis']}\n\n{result['integration_synthesis']}"
+            usage = result["usage"]
+        else:
+            with track_usage() as run_usage, stage_scope(system):
+                output = self.client.complete(baseline_messages(system, story))
+            usage = run_usage.as_dict()
+        return {
+            "id": run_id,
+            "system": system,
+            "enabler_story": story["enabler_story"],
+            "potential_fix": story["potential_fix"],
+            "output": output,
+            "seconds": round(time.perf_counter() - started, 3),
+            "tokens": usage.get("logical_tokens", usage.get("total_tokens", 0)),
+            "billed_tokens": usage.get("total_tokens", 0),
+            "cost_usd": usage.get("cost_usd", 0.0),
+            "cache_hits": usage.get("cache_hits", 0),
+        }
+
+    def judge(self, generation: dict[str, Any]) -> dict[str, Any]:
+        """``generation`` with the judge's verdict and the judge's own token usage added"""
+        prompt = JUDGE_PROMPT.format(
+            enabler_story=generation["enabler_story"],
+            potential_fix=generation["potential_fix"],
+            output=generation["output"],
+        )
+        with track_usage() as judge_usage, stage_scope("judge"), override_call(
+            temperature=settings.stage_temperatures.get("judge", 0.0)
+        ):
+            verdict, _ = self.client.complete_structured([{"role": "user", "content": prompt}], JudgeVerdict)
+        return {
+            **generation,
+            "verdict": asdict(verdict),
+            "scores": verdict_scores(verdict),
+            "judge_usage": judge_usage.as_dict(),
+        }
+
+    def evaluate(self, run_id: str, story: dict[str, Any], system: str) -> dict[str, Any]:
+        try:
+            generation = self.generate(run_id, story, system)
+        except Exception as exc:  # one bad story must not abort the evaluation
+            return {"id": run_id, "system": system, "error": f"{type(exc).__name__}: {exc}"}
+        return self.rescore(generation)
+
+    def rescore(self, generation: dict[str, Any]) -> dict[str, Any]:
+        """Judge a stored generation again; a failed verdict keeps the output so it can be rescored later"""
+        generation = {name: value for name, value in generation.items() if name not in _VERDICT_FIELDS}
+        try:
+            return self.judge(generation)
+        except Exception as exc:
+            return {**generation, "error": f"{type(exc).__name__}: {exc}"}
+
+
+class Summary:
+    """Per-system quality, cost and latency aggregated over scored lines"""
+
+    def __init__(self):
+        self.systems: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, line: dict[str, Any]) -> None:
+        with self._lock:
+            stats = self.systems.setdefault(line["system"], {"stories": 0, "errors": 0})
+            if "error" in line:
+                stats["errors"] += 1
+                return
+            stats["stories"] += 1
+            scores = line["scores"]
+            for name in ("candidates", "accepted", *CRITERIA):
+                stats[name] = stats.get(name, 0) + scores[name]
+            for name in ("tokens", "seconds", "cost_usd"):
+                stats[name] = stats.get(name, 0) + line[name]
+            # Lines scored before billed tokens were reported separately hold billed tokens only.
+            stats["billed_tokens"] = stats.get("billed_tokens", 0) + line.get("billed_tokens", line["tokens"])
+            judge_usage = line["judge_usage"]
+            judge_tokens = judge_usage.get("logical_tokens", judge_usage.get("total_tokens", 0))
+            stats["judge_tokens"] = stats.get("judge_tokens", 0) + judge_tokens
+
+    def as_dict(self) -> dict[str, Any]:
+        report: dict[str, Any] = {}
+        with self._lock:
+            systems = {name: dict(stats) for name, stats in self.systems.items()}
+        for name, stats in systems.items():
+            stories = stats["stories"]
+            if not stories:
+                report[name] = stats
+                continue
+            candidates = stats["candidates"]
+            report[name] = {
+                "stories": stories,
+                "errors": stats["errors"],
+                "accepted_uus_per_story": round(stats["accepted"] / stories, 3),
+                "acceptance_rate": round(stats["accepted"] / candidates, 3) if candidates else 0.0,
+                "criterion_pass_rates": {
+                    criterion: round(stats[criterion] / candidates, 3) if candidates else 0.0 for criterion in CRITERIA
+                },
+                "tokens_per_story": round(stats["tokens"] / stories, 1),
+                "billed_tokens_per_story": round(stats["billed_tokens"] / stories, 1),
+                "seconds_per_story": round(stats["seconds"] / stories, 3),
+                "cost_usd": round(stats["cost_usd"], 6),
+                "accepted_per_1k_tokens": round(stats["accepted"] * 1000 / stats["tokens"], 4) if stats["tokens"] else None,
+                "accepted_per_minute": round(stats["accepted"] * 60 / stats["seconds"], 4) if stats["seconds"] else None,
+                "judge_tokens": stats["judge_tokens"],
+            }
+        return report
+
+
+def _drain(tasks: Iterable[tuple[Any, ...]], function: Any, out: TextIO, summary: Summary, workers: int) -> None:
+    """Run ``function(*task)`` on a pool of ``workers`` threads, writing each result to ``out`` as it finishes"""
+
+    def write(done: Iterable[Future]) -> None:
+        for future in done:
+            line = future.result()
+            summary.add(line)
+            out.write(json.dumps(line, ensure_ascii=False) + "\n")
+        out.flush()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="u2-eval") as pool:
+        pending: set[Future] = set()
+        for task in tasks:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write(done)
+            pending.add(pool.submit(function, *task))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            write(done)
+
+
+def run_evaluation(
+    evaluator: Evaluator,
+    records: Iterable[tuple[str, dict[str, Any]]],
+    out: TextIO,
+    *,
+    systems: Iterable[str] = SYSTEMS,
+    workers: int = 4,
+) -> dict[str, Any]:
+    """
+    Run every system on every record in parallel, writing scored outputs to ``out`` as JSONL
+
+    Returns the per-system summary: accepted UUs per story, acceptance and per-criterion
+    pass rates over the judged candidates, tokens (logical and billed), seconds and cost per
+    story, and accepted UUs per 1K logical tokens and per minute. Judge tokens are reported
+    separately.
+    """
+    systems = list(systems)
+    unknown = set(systems) - set(SYSTEMS)
+    if unknown:
+        raise ValueError(f"Unknown systems: {sorted(unknown)}")
+    summary = Summary()
+    tasks = ((run_id, record, system) for run_id, record in records for system in systems)
+    _drain(tasks, evaluator.evaluate, out, summary, workers)
+    return summary.as_dict()
+
+
+def rescore(evaluator: Evaluator, lines: Iterable[dict[str, Any]], out: TextIO, *, workers: int = 4) -> dict[str, Any]:
+    """Judge the outputs of a previous run_evaluation() again (e.g. after a rubric change) without regenerating them"""
+    summary = Summary()
+    _drain(((line,) for line in lines if "output" in line), evaluator.rescore, out, summary, workers)
+    return summary.as_dict()
+
+
+def _read_lines(path: Path) -> Iterator[dict[str, Any]]:
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate U2F against the baseline prompting strategies.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", type=Path, help="JSONL stories, one per line.")
+    source.add_argument("--rescore", type=Path, help="Scored JSONL of an earlier run to judge again.")
+    parser.add_argument("--systems", default=",".join(SYSTEMS), help="Comma-separated systems to run.")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel generations and judgements.")
+    parser.add_argument("--output", type=Path, required=True, help="Scored outputs, as JSONL.")
+    parser.add_argument("--report", type=Path, help="Optional path to write the summary as JSON.")
+    parser.add_argument("--cache", help="Response cache file; overrides U2_CACHE_PATH.")
+    args = parser.parse_args()
+
+    if args.cache:
+        settings.cache_path = args.cache
+    evaluator = Evaluator()
+    with args.output.open("w", encoding="utf-8") as out:
+        if args.rescore:
+            report = rescore(evaluator, _read_lines(args.rescore), out, workers=args.workers)
+        else:
+            report = run_evaluation(
+                evaluator, iter_records(args.corpus), out, systems=args.systems.split(","), workers=args.workers
+            )
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class StageEvent:
+    """
+    Progress event emitted by the Orchestrator
+
+    kind is one of 'stage_started', 'token', 'stage_finished', 'run_suspended' or
+    'run_finished'. data is the text delta for 'token', the stage output for
+    'stage_finished', and the result dictionary for 'run_suspended' and 'run_finished'.
+    """
+
+    kind: str
+    stage: str
+    data: Any = None
+    timestamp: float = field(default_factory=time.monotonic)
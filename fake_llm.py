@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Iterator, Mapping, Sequence
+
+from .tokens import count_message_tokens, count_tokens
+from .usage import current_stage, stage_scope
+
+
+class LatencyModel:
+    """
+    Seeded per-call latency distribution, in seconds
+
+    kind is 'fixed' (always ``mean``), 'uniform' (mean ± spread), 'normal' (stddev ``spread``)
+    or 'lognormal' (median ``mean``, log-space sigma ``spread``). Samples are clamped at zero.
+    """
+
+    def __init__(self, kind: str = "fixed", mean: float = 0.0, spread: float = 0.0, seed: int = 0):
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind!r}")
+        self.kind = kind
+        self.mean = mean
+        self.spread = spread
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "uniform":
+                value = self._random.uniform(self.mean - self.spread, self.mean + self.spread)
+            elif self.kind == "normal":
+                value = self._random.gauss(self.mean, self.spread)
+            elif self.kind == "lognormal":
+                value = self.mean * self._random.lognormvariate(0.0, self.spread)
+            else:
+                value = self.mean
+        return max(value, 0.0)
+
+
+class FakeLLMBackend:
+    """
+    Deterministic stand-in for the OpenAI chat completions API
+
+    ``responses`` maps a stage name ('discovery', 'exploration', 'integration', or 'default'
+    for calls outside a stage) to one response or a sequence served in order, the last one
+    repeating; alternatively a callable ``(stage, messages) -> str``. Requests made with
+    ``logprobs=True`` report every token at probability ``confidence``, a float or a callable
+    ``model -> float``. A leading system message seen before is reported as cached prompt
+    tokens, like a provider's prefix cache. It also serves the OpenAI Files and Batch APIs
+    used by batch_api, answering a batch job on its first poll; a request whose ``custom_id``
+    starts with '<stage>:' is answered as that stage, and one whose response raises is answered
+    with an error. Install it with
+    ``llm_client.override_clients(backend, backend.async_client())``.
+    """
+
+    def __init__(
+        self,
+        responses: Mapping[str, str | Sequence[str]] | Callable[[str | None, list[dict[str, str]]], str],
+        *,
+        latency: LatencyModel | None = None,
+        chunk_chars: int = 16,
+        confidence: float | Callable[[str], float] = 1.0,
+    ):
+        self.responses = responses
+        self.latency = latency or LatencyModel()
+        self.chunk_chars = chunk_chars
+        self.confidence = confidence
+        self.calls: dict[str, int] = {}
+        self._prefixes: set[str] = set()
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+        self._files: dict[str, bytes] = {}
+        self._batches: dict[str, SimpleNamespace] = {}
+
+    @classmethod
+    def from_jsonl(cls, path: str | Path, **kwargs: Any) -> FakeLLMBackend:
+        """Replay responses captured by RecordingClient (``{"stage": ..., "response": ...}`` lines)."""
+        responses: dict[str, list[str]] = {}
+        with Path(path).open(encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    record = json.loads(line)
+                    responses.setdefault(record.get("stage") or "default", []).append(record["response"])
+        return cls(responses, **kwargs)
+
+    def respond(self, messages: list[dict[str, str]]) -> str:
+        stage = current_stage()
+        if callable(self.responses):
+            with self._lock:
+                self.calls[stage or "default"] = self.calls.get(stage or "default", 0) + 1
+            return self.responses(stage, messages)
+        key = stage if stage in self.responses else "default"
+        with self._lock:
+            index = self.calls.get(key, 0)
+            self.calls[key] = index + 1
+        scripted = self.responses[key]
+        if isinstance(scripted, str):
+            return scripted
+        return scripted[min(index, len(scripted) - 1)]
+
+    def _create_file(self, *, file: Any, purpose: str) -> SimpleNamespace:
+        if isinstance(file, tuple):
+            file = file[1]
+        data = file.read() if hasattr(file, "read") else file
+        with self._lock:
+            file_id = f"file-{len(self._files) + 1}"
+            self._files[file_id] = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        return SimpleNamespace(id=file_id, purpose=purpose, bytes=len(self._files[file_id]))
+
+    def _file_content(self, file_id: str) -> SimpleNamespace:
+        data = self._files[file_id]
+        return SimpleNamespace(content=data, text=data.decode("utf-8"), read=lambda: data)
+
+    def _create_batch(
+        self, *, input_file_id: str, endpoint: str, completion_window: str, **kwargs: Any
+    ) -> SimpleNamespace:
+        with self._lock:
+            batch_id = f"batch-{len(self._batches) + 1}"
+            batch = SimpleNamespace(
+                id=batch_id,
+                status="validating",
+                input_file_id=input_file_id,
+                endpoint=endpoint,
+                completion_window=completion_window,
+                output_file_id=None,
+                error_file_id=None,
+            )
+            self._batches[batch_id] = batch
+        return batch
+
+    def _retrieve_batch(self, batch_id: str) -> SimpleNamespace:
+        batch = self._batches[batch_id]
+        if batch.status == "validating":
+            lines = []
+            for line in self._files[batch.input_file_id].decode("utf-8").splitlines():
+                if line.strip():
+                    request = json.loads(line)
+                    lines.append(json.dumps(self._answer_batch_line(request), ensure_ascii=False))
+            output = self._create_file(file="\n".join(lines) + "\n", purpose="batch_output")
+            batch.output_file_id = output.id
+            batch.status = "completed"
+        return batch
+
+    def _answer_batch_line(self, request: dict[str, Any]) -> dict[str, Any]:
+        body = request["body"]
+        try:
+            with stage_scope(request["custom_id"].split(":", 1)[0]):
+                content = self.respond(body["messages"])
+        except Exception as exc:
+            return {
+                "id": f"response-{request['custom_id']}",
+                "custom_id": request["custom_id"],
+                "response": None,
+                "error": {"code": "server_error", "message": str(exc)},
+            }
+        model, messages = body["model"], body["messages"]
+        completion = _completion(
+            model,
+            messages,
+            content,
+            self._logprob(model) if body.get("logprobs") else None,
+            self._cached_tokens(model, messages),
+        )
+        return {
+            "id": f"response-{request['custom_id']}",
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "body": _as_json(completion)},
+            "error": None,
+        }
+
+    def async_client(self) -> SimpleNamespace:
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self._acreate)))
+
+    def _cached_tokens(self, model: str, messages: list[dict[str, str]]) -> int:
+        if not messages or messages[0]["role"] != "system":
+            return 0
+        with self._lock:
+            seen = messages[0]["content"] in self._prefixes
+            self._prefixes.add(messages[0]["content"])
+        return count_message_tokens(messages[:1], model) if seen else 0
+
+    def _logprob(self, model: str) -> float:
+        confidence = self.confidence(model) if callable(self.confidence) else self.confidence
+        return math.log(max(confidence, 1e-9))
+
+    def _create(self, *, model: str, messages: list[dict[str, str]], stream: bool = False, **kwargs: Any) -> Any:
+        content = self.respond(messages)
+        delay = self.latency.sample()
+        cached = self._cached_tokens(model, messages)
+        if stream:
+            return self._chunks(model, messages, content, delay, cached)
+        time.sleep(delay)
+        return _completion(model, messages, content, self._logprob(model) if kwargs.get("logprobs") else None, cached)
+
+    def _chunks(
+        self, model: str, messages: list[dict[str, str]], content: str, delay: float, cached: int = 0
+    ) -> Iterator[Any]:
+        pieces = _split(content, self.chunk_chars)
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            yield _chunk(piece)
+        yield SimpleNamespace(choices=[], usage=_usage(model, messages, content, cached))
+
+    async def _acreate(
+        self, *, model: str, messages: list[dict[str, str]], stream: bool = False, **kwargs: Any
+    ) -> Any:
+        content = self.respond(messages)
+        delay = self.latency.sample()
+        cached = self._cached_tokens(model, messages)
+        if stream:
+            return self._achunks(model, messages, content, delay, cached)
+        await asyncio.sleep(delay)
+        return _completion(model, messages, content, self._logprob(model) if kwargs.get("logprobs") else None, cached)
+
+    async def _achunks(
+        self, model: str, messages: list[dict[str, str]], content: str, delay: float, cached: int = 0
+    ) -> AsyncIterator[Any]:
+        pieces = _split(content, self.chunk_chars)
+        for piece in pieces:
+            await asyncio.sleep(delay / len(pieces))
+            yield _chunk(piece)
+        yield SimpleNamespace(choices=[], usage=_usage(model, messages, content, cached))
+
+
+class RecordingClient:
+    """Wrap a real OpenAI client and append every response, tagged with its stage, to a JSONL file."""
+
+    def __init__(self, client: Any, path: str | Path):
+        self.client = client
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs: Any) -> Any:
+        stage = current_stage()
+        response = self.client.chat.completions.create(**kwargs)
+        if not kwargs.get("stream"):
+            self._write(stage, response.choices[0].message.content)
+            return response
+        return self._tee(stage, response)
+
+    def _tee(self, stage: str | None, chunks: Iterator[Any]) -> Iterator[Any]:
+        parts: list[str] = []
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self._write(stage, "".join(parts))
+
+    def _write(self, stage: str | None, content: str | None) -> None:
+        line = json.dumps({"stage": stage, "response": content or ""}, ensure_ascii=False)
+        with self._lock, self.path.open("a", encoding="utf-8") as handle:
+            handle.write(line + "\n")
+
+
+def _split(content: str, size: int) -> list[str]:
+    return [content[i:i + size] for i in range(0, len(content), size)] or [""]
+
+
+def _usage(model: str, messages: list[dict[str, str]], content: str, cached: int = 0) -> SimpleNamespace:
+    prompt_tokens = count_message_tokens(messages, model)
+    completion_tokens = count_tokens(content, model)
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=min(cached, prompt_tokens)),
+    )
+
+
+def _completion(
+    model: str, messages: list[dict[str, str]], content: str, logprob: float | None = None, cached: int = 0
+) -> SimpleNamespace:
+    logprobs = None
+    if logprob is not None:
+        logprobs = SimpleNamespace(
+            content=[SimpleNamespace(token=token, logprob=logprob) for token in content.split() or [""]]
+        )
+    return SimpleNamespace(
+        model=model,
+        choices=[
+            SimpleNamespace(
+                index=0,
+                message=SimpleNamespace(role="assistant", content=content),
+                finish_reason="stop",
+                logprobs=logprobs,
+            )
+        ],
+        usage=_usage(model, messages, content, cached),
+    )
+
+
+def _as_json(value: Any) -> Any:
+    if isinstance(value, SimpleNamespace):
+        return {name: _as_json(item) for name, item in vars(value).items()}
+    if isinstance(value, list):
+        return [_as_json(item) for item in value]
+    return value
+
+
+def _chunk(piece: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=piece))], usage=None)
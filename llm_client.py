@@ -1,29 +1,686 @@
 ﻿from __future__ import annotations
 
-from typing import Optional
-
-from openai import OpenAI
-from tenacity import retry, stop_after_attempt, wait_exponential
+import asyncio
+import functools
+import inspect
+import math
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Iterator, Optional, TypeVar
 
+from .cache import ResponseCache, shared_cache
+from .prompts import PREFIX_HASHES
+from .rate_limit import is_retryable, retry_wait
+from .router import Provider, Router, default_router
+from .structured import parse_output, response_format
 from .settings import settings
+from .tokens import count_message_tokens, count_tokens, fit_messages
+from .tracing import activate, annotate, count, finish_span, record_retry, span, start_span
+from .usage import current_stage, record_usage, stage_scope
+
+# openai, httpx and tenacity are imported on first use: together they take most of a second.
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+T = TypeVar("T")
+
+_clients: dict[tuple[str, str | None], OpenAI] = {}
+_clients_lock = threading.Lock()
+_client_override: tuple[Any, Any] | None = None
+_token_listener: ContextVar[Callable[[str], None] | None] = ContextVar("u2_token_listener", default=None)
+_call_overrides: ContextVar[dict[str, Any]] = ContextVar("u2_call_overrides", default={})
+_batch_collector: ContextVar[BatchCollector | None] = ContextVar("u2_batch_collector", default=None)
+_async_pools: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _AsyncPool] = weakref.WeakKeyDictionary()
+
+
+def _pool_limits() -> httpx.Limits:
+    import httpx
+
+    return httpx.Limits(
+        max_connections=settings.max_connections,
+        max_keepalive_connections=settings.max_connections,
+        keepalive_expiry=settings.keepalive_expiry,
+    )
+
+
+@contextmanager
+def override_clients(client: Any, async_client: Any = None) -> Iterator[None]:
+    """
+    Serve every LLMClient and AsyncLLMClient call made in this block from the given OpenAI-compatible
+    clients instead of the network (whatever the provider), e.g. a FakeLLMBackend for tests and benchmarks.
+    """
+    global _client_override
+    previous = _client_override
+    _client_override = (client, async_client)
+    try:
+        yield
+    finally:
+        _client_override = previous
+
+
+def _shared_client(api_key: str, base_url: str | None = None) -> OpenAI:
+    """Return the process-wide ``OpenAI`` client for ``api_key`` at ``base_url``, sharing one keep-alive pool."""
+    if _client_override is not None:
+        return _client_override[0]
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            import httpx
+            from openai import OpenAI
+
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=httpx.Client(limits=_pool_limits()))
+            _clients[api_key, base_url] = client
+        return client
+
+
+class _AsyncPool:
+    """Connection pool and in-flight semaphore shared by every AsyncLLMClient on one event loop."""
+
+    def __init__(self):
+        import httpx
+
+        self.http_client = httpx.AsyncClient(limits=_pool_limits())
+        self.semaphore = asyncio.Semaphore(settings.max_in_flight)
+        self.clients: dict[tuple[str, str | None], AsyncOpenAI] = {}
+
+    def client(self, api_key: str, base_url: str | None = None) -> AsyncOpenAI:
+        if _client_override is not None and _client_override[1] is not None:
+            return _client_override[1]
+        client = self.clients.get((api_key, base_url))
+        if client is None:
+            from openai import AsyncOpenAI
+
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client)
+            self.clients[api_key, base_url] = client
+        return client
+
+
+def _async_pool() -> _AsyncPool:
+    # httpx pools and asyncio semaphores are bound to the loop that first uses them.
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = _AsyncPool()
+        _async_pools[loop] = pool
+    return pool
+
+
+async def aclose_pool() -> None:
+    """Close the connection pool of the running event loop, e.g. on service shutdown."""
+    pool = _async_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.http_client.aclose()
+
+
+def _with_retries(function: Callable) -> Callable:
+    """
+    Retry ``function`` up to ``U2_MAX_RETRIES`` attempts while its errors are retryable
+
+    Waits honor the provider's Retry-After and otherwise back off exponentially with full
+    jitter, so workers rate limited together do not retry together.
+
+    The tenacity wrapper is built on the first call, so neither tenacity nor the settings are
+    loaded when this module is imported.
+    """
+    if inspect.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def call_async(*args: Any, **kwargs: Any) -> Any:
+            return await _retrying(function)(*args, **kwargs)
+
+        return call_async
+
+    @functools.wraps(function)
+    def call(*args: Any, **kwargs: Any) -> Any:
+        return _retrying(function)(*args, **kwargs)
+
+    return call
+
+
+@functools.lru_cache(maxsize=None)
+def _retrying(function: Callable) -> Callable:
+    from tenacity import retry, retry_if_exception, stop_after_attempt
+
+    return retry(
+        stop=stop_after_attempt(settings.max_retries),
+        wait=retry_wait,
+        retry=retry_if_exception(is_retryable),
+        before_sleep=record_retry,
+    )(function)
+
+
+@contextmanager
+def override_call(
+    *,
+    model: str | None = None,
+    temperature: float | None = None,
+    instruction: str | None = None,
+    response_format: dict[str, Any] | None = None,
+    fresh: bool | None = None,
+) -> Iterator[None]:
+    """
+    Send every completion made in this context to ``model`` at ``temperature`` with
+    ``response_format``, appending ``instruction`` as a final system message, e.g. to steer
+    one of several speculative candidates. With ``fresh``, the response cache is not read
+    (fresh answers are still stored), e.g. for a retry that asks for a different answer.
+    """
+    overrides = dict(_call_overrides.get())
+    for name, value in (
+        ("model", model),
+        ("temperature", temperature),
+        ("instruction", instruction),
+        ("response_format", response_format),
+        ("fresh", fresh),
+    ):
+        if value is not None:
+            overrides[name] = value
+    token = _call_overrides.set(overrides)
+    try:
+        yield
+    finally:
+        _call_overrides.reset(token)
+
+
+# Call parameters resolve as: override_call(), then the per-stage settings, then the client's own.
+# A provider with its own model answers with that one instead (see router.Provider).
+def _model(client: LLMClient | AsyncLLMClient) -> str:
+    overrides = _call_overrides.get()
+    if "model" in overrides:
+        return overrides["model"]
+    return settings.stage_models.get(current_stage(), client.model)
+
+
+def _temperature(client: LLMClient | AsyncLLMClient) -> float:
+    overrides = _call_overrides.get()
+    if "temperature" in overrides:
+        return overrides["temperature"]
+    return settings.stage_temperatures.get(current_stage(), client.temperature)
+
+
+def _max_tokens(client: LLMClient | AsyncLLMClient) -> int | None:
+    return settings.stage_max_tokens.get(current_stage(), client.max_tokens)
+
+
+def _request(client: LLMClient | AsyncLLMClient, messages: list[dict[str, str]], **extra: Any) -> dict[str, Any]:
+    """Keyword arguments of ``chat.completions.create`` for one call."""
+    request = {"model": _model(client), "messages": messages, "temperature": _temperature(client), "top_p": client.top_p}
+    max_tokens = _max_tokens(client)
+    if max_tokens is not None:
+        request["max_tokens"] = max_tokens
+    if "response_format" in _call_overrides.get():
+        request["response_format"] = _call_overrides.get()["response_format"]
+    prefix = PREFIX_HASHES.get(messages[0]["content"]) if messages and messages[0]["role"] == "system" else None
+    if prefix is not None:
+        annotate(prompt_prefix=prefix)
+        if settings.prompt_cache_key:
+            request["extra_body"] = {"prompt_cache_key": prefix}
+    request.update(extra)
+    return request
+
+
+def _drafting() -> bool:
+    """Whether completions in this context are first drafted by ``settings.draft_model``."""
+    if settings.draft_model is None or "model" in _call_overrides.get():
+        return False
+    return not settings.draft_stages or current_stage() in settings.draft_stages
+
+
+def _confidence(response: Any) -> float | None:
+    """Geometric-mean token probability of a completion requested with logprobs, if reported."""
+    logprobs = getattr(response.choices[0], "logprobs", None)
+    tokens = getattr(logprobs, "content", None)
+    if not tokens:
+        return None
+    return math.exp(sum(token.logprob for token in tokens) / len(tokens))
+
+
+def _accept_draft(response: Any) -> bool:
+    confidence = _confidence(response)
+    accepted = confidence is not None and confidence >= settings.draft_min_confidence
+    annotate(draft_confidence=-1.0 if confidence is None else round(confidence, 4), draft_accepted=accepted)
+    count("drafts_accepted" if accepted else "draft_escalations")
+    return accepted
+
+
+def _prepare(client: LLMClient | AsyncLLMClient, messages: list[dict[str, str]]) -> tuple[list[dict[str, str]], int]:
+    """Apply call overrides and the context budget to ``messages`` and return them with their prompt token count."""
+    instruction = _call_overrides.get().get("instruction")
+    if instruction is not None:
+        messages = [*messages, {"role": "system", "content": instruction}]
+    budget = settings.max_context_tokens
+    if budget is not None:
+        fitted = fit_messages(messages, budget, _model(client))
+        if len(fitted) < len(messages):
+            record_usage(context_truncations=1)
+        messages = fitted
+    return messages, count_message_tokens(messages, _model(client))
+
+
+def _record_completion(
+    client: LLMClient | AsyncLLMClient,
+    prompt_tokens: int,
+    content: str | None,
+    usage: Any = None,
+    price_factor: float = 1.0,
+    model: str | None = None,
+) -> None:
+    """Record the usage and cost of a completion answered by ``model`` (by default the one asked for)."""
+    # Prefer the provider's accounting; fall back to local counts when it reports none.
+    model = model or _model(client)
+    cached_tokens = 0
+    if usage is not None:
+        prompt_tokens = usage.prompt_tokens
+        completion_tokens = usage.completion_tokens
+        # Prompt tokens the provider served from its prefix cache, billed at a discount.
+        cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+    else:
+        completion_tokens = count_tokens(content or "", model)
+    prompt_price, completion_price = settings.model_prices.get(
+        model, (settings.prompt_cost_per_1k, settings.completion_cost_per_1k)
+    )
+    billed_prompt = prompt_tokens - cached_tokens * settings.cached_prompt_discount
+    annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens)
+    record_usage(
+        llm_calls=1,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cached_tokens=cached_tokens,
+        cost_usd=(billed_prompt * prompt_price + completion_tokens * completion_price) / 1000 * price_factor,
+    )
+
+
+def _cache_key(
+    client: LLMClient | AsyncLLMClient, messages: list[dict[str, str]], model: str | None = None
+) -> str | None:
+    """
+    Cache key of a completion answered by ``model``
+
+    Defaults to the model the router's first provider answers with, so a failover answer
+    from another model is stored under that model and never returned as the primary's.
+    """
+    if client.cache is None:
+        return None
+    return ResponseCache.key(
+        model or client.router.resolve_model(_model(client)),
+        _temperature(client),
+        client.top_p,
+        messages,
+        _max_tokens(client),
+        _call_overrides.get().get("response_format"),
+    )
+
+
+def _cache_keys(client: LLMClient | AsyncLLMClient, messages: list[dict[str, str]]) -> list[str | None]:
+    """Keys a cached answer to ``messages`` may be under: the primary model's, then an accepted draft's."""
+    keys = [_cache_key(client, messages)]
+    if _drafting():
+        with override_call(model=settings.draft_model):
+            keys.append(_cache_key(client, messages))
+    return keys
+
+
+def _cache_get(client: LLMClient | AsyncLLMClient, prompt_tokens: int, *keys: str | None) -> str | None:
+    """
+    The first cached answer under ``keys``, counted as one hit or miss
+
+    A hit is free, but its prompt and (locally counted) completion tokens are recorded as
+    ``cache_hit_tokens``, so per-token metrics still see the work the answer stands for.
+    """
+    keys = tuple(key for key in keys if key is not None)
+    if not keys or _call_overrides.get().get("fresh"):
+        return None
+    cached = next((value for value in map(client.cache.get, keys) if value is not None), None)
+    if cached is None:
+        record_usage(cache_misses=1)
+    else:
+        record_usage(cache_hits=1, cache_hit_tokens=prompt_tokens + count_tokens(cached, _model(client)))
+    annotate(cached=cached is not None)
+    return cached
+
+
+def _cache_put(cache: ResponseCache | None, key: str | None, content: str | None) -> None:
+    if key is not None and content is not None:
+        cache.put(key, content)
+
+
+class BatchPending(BaseException):
+    """
+    Aborts an agent whose next completion has been queued for a provider batch job
+
+    A BaseException, so that agents catching Exception around their LLM calls let it through.
+    """
+
+
+@dataclass
+class BatchRequest:
+    """A completion queued by a BatchCollector, with what is needed to account for its answer"""
+
+    request: dict[str, Any]
+    client: LLMClient | AsyncLLMClient
+    stage: str | None
+    prompt_tokens: int
+
+
+@dataclass
+class BatchCollector:
+    """
+    Completions of one run under offline batch execution
+
+    While installed with collect_batch(), completions already answered by a batch job are
+    replayed from ``answers`` and the first unanswered one is queued in ``pending`` (keyed by
+    its batch ``custom_id``) before raising BatchPending, so the agent can be rerun once the
+    job has answered it. The response cache and drafting are bypassed.
+    """
+
+    answers: dict[str, str] = field(default_factory=dict)
+    pending: dict[str, BatchRequest] = field(default_factory=dict)
+
+    def resolve(self, client: LLMClient | AsyncLLMClient, messages: list[dict[str, str]], prompt_tokens: int) -> str:
+        request = _request(client, messages)
+        key = ResponseCache.key(
+            request["model"],
+            request["temperature"],
+            request["top_p"],
+            messages,
+            request.get("max_tokens"),
+            request.get("response_format"),
+        )
+        custom_id = f"{current_stage() or 'default'}:{key}"
+        if custom_id in self.answers:
+            return self.answers[custom_id]
+        self.pending[custom_id] = BatchRequest(request, client, current_stage(), prompt_tokens)
+        raise BatchPending(custom_id)
+
+    def answer(self, custom_id: str, response: Any, charge: bool = True) -> None:
+        """
+        Record the batch job's response to a pending request, raising it if it is an error
+
+        Without ``charge`` the response was billed to another run that queued the same request;
+        it is recorded like a cache hit, its tokens in ``cache_hit_tokens`` only.
+        """
+        pending = self.pending.pop(custom_id)
+        if isinstance(response, Exception):
+            raise response
+        content = response.choices[0].message.content
+        model = pending.request["model"]
+        with stage_scope(pending.stage), override_call(model=model), span("llm.batch", model=model):
+            if charge:
+                _record_completion(
+                    pending.client, pending.prompt_tokens, content, response.usage, settings.batch_price_factor
+                )
+            else:
+                usage = response.usage
+                tokens = (
+                    usage.prompt_tokens + usage.completion_tokens
+                    if usage is not None
+                    else pending.prompt_tokens + count_tokens(content or "", model)
+                )
+                record_usage(cache_hits=1, cache_hit_tokens=tokens)
+                annotate(shared=True)
+        self.answers[custom_id] = content
+
+
+@contextmanager
+def collect_batch(collector: BatchCollector) -> Iterator[None]:
+    """Answer completions made in this context from ``collector`` instead of the provider."""
+    token = _batch_collector.set(collector)
+    try:
+        yield
+    finally:
+        _batch_collector.reset(token)
+
+
+def collecting_batch() -> bool:
+    """Whether completions in this context are answered by a batch job, bypassing routing and drafting."""
+    return _batch_collector.get() is not None
+
+
+async def _single(value: str) -> AsyncIterator[str]:
+    yield value
+
+
+@contextmanager
+def listen_tokens(listener: Callable[[str], None]) -> Iterator[None]:
+    """Route every completion made in this context through streaming, passing each delta to ``listener``."""
+    token = _token_listener.set(listener)
+    try:
+        yield
+    finally:
+        _token_listener.reset(token)
+
+
+def _emit_token(delta: str) -> None:
+    listener = _token_listener.get()
+    if listener is not None:
+        listener(delta)
 
 
 class LLMClient:
-    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
-        self.client = OpenAI(api_key=api_key or settings.openai_api_key)
-        self.model = model or settings.model_name
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        router: Optional[Router] = None,
+    ):
+        self.api_key = api_key or settings.openai_api_key
+        self.router = router or default_router()
+        self.model = model or self.router.default_model or settings.model_name
         self.temperature = settings.temperature
         self.top_p = settings.top_p
+        self.max_tokens = settings.max_tokens
+        self.cache = cache if cache is not None else shared_cache()
 
-    @retry(
-        stop=stop_after_attempt(settings.max_retries),
-        wait=wait_exponential(multiplier=1, min=1, max=10),
-    )
     def complete(self, messages: list[dict[str, str]]) -> str:
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            top_p=self.top_p,
+        messages, prompt_tokens = _prepare(self, messages)
+        if _batch_collector.get() is not None:
+            return _batch_collector.get().resolve(self, messages, prompt_tokens)
+        if _token_listener.get() is not None:
+            return "".join(self._stream(messages, prompt_tokens))
+        with span("llm.complete", model=_model(self)):
+            cached = _cache_get(self, prompt_tokens, *_cache_keys(self, messages))
+            if cached is not None:
+                return cached
+            drafted = self._draft(messages, prompt_tokens) if _drafting() else None
+            if drafted is not None:
+                content, model = drafted
+            else:
+                response, model = self._complete(messages)
+                content = response.choices[0].message.content
+                _record_completion(self, prompt_tokens, content, response.usage, model=model)
+        _cache_put(self.cache, _cache_key(self, messages, model), content)
+        return content
+
+    def complete_structured(self, messages: list[dict[str, str]], output_type: type[T]) -> tuple[T, list[str]]:
+        """
+        Complete with JSON constrained to the schema of ``output_type`` (a context.py output
+        dataclass) and return the parsed output with the search queries the model asked for
+        """
+        with override_call(response_format=response_format(output_type)):
+            return parse_output(self.complete(messages), output_type)
+
+    def _draft(self, messages: list[dict[str, str]], prompt_tokens: int) -> tuple[str, str] | None:
+        """(answer, model that gave it) of the draft model, or None when its confidence calls for escalation."""
+        with override_call(model=settings.draft_model):
+            response, model = self._complete(messages, logprobs=True)
+            content = response.choices[0].message.content
+            _record_completion(self, prompt_tokens, content, response.usage, model=model)
+        return (content, model) if _accept_draft(response) else None
+
+    def stream(self, messages: list[dict[str, str]]) -> Iterator[str]:
+        """Yield completion deltas as they arrive; a cache hit is yielded as a single delta."""
+        messages, prompt_tokens = _prepare(self, messages)
+        if _batch_collector.get() is not None:
+            return iter([_batch_collector.get().resolve(self, messages, prompt_tokens)])
+        return self._stream(messages, prompt_tokens)
+
+    def _stream(self, messages: list[dict[str, str]], prompt_tokens: int) -> Iterator[str]:
+        # The span is only made current around non-yielding sections: a generator may be
+        # resumed from a different context than the one it was created in.
+        current = start_span("llm.stream", model=_model(self))
+        error = None
+        try:
+            with activate(current):
+                key = _cache_key(self, messages)
+                cached = _cache_get(self, prompt_tokens, key)
+            if cached is not None:
+                _emit_token(cached)
+                yield cached
+                return
+            parts: list[str] = []
+            usage = None
+            with activate(current):
+                chunks, model = self._open_stream(messages)
+            for chunk in chunks:
+                usage = getattr(chunk, "usage", None) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not parts:
+                        current.attributes["ttft_ms"] = round(current.duration_ms, 3)
+                    parts.append(delta)
+                    _emit_token(delta)
+                    yield delta
+            content = "".join(parts)
+            with activate(current):
+                _record_completion(self, prompt_tokens, content, usage, model=model)
+            key = _cache_key(self, messages, model)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            finish_span(current, error)
+        _cache_put(self.cache, key, content)
+
+    @_with_retries
+    def _open_stream(self, messages: list[dict[str, str]]):
+        return self.router.create(
+            self._client_for,
+            **_request(self, messages, stream=True, stream_options={"include_usage": True}),
+        )
+
+    @_with_retries
+    def _complete(self, messages: list[dict[str, str]], **extra: Any):
+        return self.router.create(self._client_for, **_request(self, messages, **extra))
+
+    def _client_for(self, provider: Provider) -> OpenAI:
+        return _shared_client(provider.api_key or self.api_key, provider.base_url)
+
+
+class AsyncLLMClient:
+    """Non-blocking counterpart of :class:`LLMClient`.
+
+    All instances on an event loop share one keep-alive connection pool, and at most
+    ``settings.max_in_flight`` requests are outstanding at any time.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        router: Optional[Router] = None,
+    ):
+        self.api_key = api_key or settings.openai_api_key
+        self.router = router or default_router()
+        self.model = model or self.router.default_model or settings.model_name
+        self.temperature = settings.temperature
+        self.top_p = settings.top_p
+        self.max_tokens = settings.max_tokens
+        self.cache = cache if cache is not None else shared_cache()
+
+    async def complete(self, messages: list[dict[str, str]]) -> str:
+        messages, prompt_tokens = _prepare(self, messages)
+        if _batch_collector.get() is not None:
+            return _batch_collector.get().resolve(self, messages, prompt_tokens)
+        if _token_listener.get() is not None:
+            return "".join([delta async for delta in self._stream(messages, prompt_tokens)])
+        with span("llm.complete", model=_model(self)):
+            cached = _cache_get(self, prompt_tokens, *_cache_keys(self, messages))
+            if cached is not None:
+                return cached
+            drafted = await self._draft(messages, prompt_tokens) if _drafting() else None
+            if drafted is not None:
+                content, model = drafted
+            else:
+                response, model = await self._complete(messages)
+                content = response.choices[0].message.content
+                _record_completion(self, prompt_tokens, content, response.usage, model=model)
+        _cache_put(self.cache, _cache_key(self, messages, model), content)
+        return content
+
+    async def complete_structured(
+        self, messages: list[dict[str, str]], output_type: type[T]
+    ) -> tuple[T, list[str]]:
+        with override_call(response_format=response_format(output_type)):
+            return parse_output(await self.complete(messages), output_type)
+
+    async def _draft(self, messages: list[dict[str, str]], prompt_tokens: int) -> tuple[str, str] | None:
+        with override_call(model=settings.draft_model):
+            response, model = await self._complete(messages, logprobs=True)
+            content = response.choices[0].message.content
+            _record_completion(self, prompt_tokens, content, response.usage, model=model)
+        return (content, model) if _accept_draft(response) else None
+
+    def stream(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        """Async counterpart of :meth:`LLMClient.stream`; holds an in-flight slot until exhausted."""
+        messages, prompt_tokens = _prepare(self, messages)
+        if _batch_collector.get() is not None:
+            return _single(_batch_collector.get().resolve(self, messages, prompt_tokens))
+        return self._stream(messages, prompt_tokens)
+
+    async def _stream(self, messages: list[dict[str, str]], prompt_tokens: int) -> AsyncIterator[str]:
+        current = start_span("llm.stream", model=_model(self))
+        error = None
+        try:
+            with activate(current):
+                key = _cache_key(self, messages)
+                cached = _cache_get(self, prompt_tokens, key)
+            if cached is not None:
+                _emit_token(cached)
+                yield cached
+                return
+            parts: list[str] = []
+            usage = None
+            pool = _async_pool()
+            async with pool.semaphore:
+                with activate(current):
+                    response, model = await self._open_stream(pool, messages)
+                async for chunk in response:
+                    usage = getattr(chunk, "usage", None) or usage
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        if not parts:
+                            current.attributes["ttft_ms"] = round(current.duration_ms, 3)
+                        parts.append(delta)
+                        _emit_token(delta)
+                        yield delta
+            content = "".join(parts)
+            with activate(current):
+                _record_completion(self, prompt_tokens, content, usage, model=model)
+            key = _cache_key(self, messages, model)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            finish_span(current, error)
+        _cache_put(self.cache, key, content)
+
+    @_with_retries
+    async def _open_stream(self, pool: _AsyncPool, messages: list[dict[str, str]]):
+        return await self.router.acreate(
+            lambda provider: pool.client(provider.api_key or self.api_key, provider.base_url),
+            **_request(self, messages, stream=True, stream_options={"include_usage": True}),
         )
-        return response.choices[0].message.content
+
+    @_with_retries
+    async def _complete(self, messages: list[dict[str, str]], **extra: Any):
+        pool = _async_pool()
+        async with pool.semaphore:
+            return await self.router.acreate(
+                lambda provider: pool.client(provider.api_key or self.api_key, provider.base_url),
+                **_request(self, messages, **extra),
+            )
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .search import SearchBackend, SearchResult
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    title TEXT NOT NULL,
+    link TEXT NOT NULL,
+    body TEXT NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_file ON documents (file);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    doc_count INTEGER NOT NULL,
+    total_length INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats (id, doc_count, total_length) VALUES (0, 0, 0);
+"""
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in into is it its of on or that the their this to was "
+    "were will with".split()
+)
+_TEXT_SUFFIXES = (".md", ".txt", ".rst", ".html", ".htm")
+_SNIPPET_CHARS = 240
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN.findall(text.casefold()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+class LocalIndex:
+    """
+    On-disk BM25 inverted index stored in SQLite
+
+    Documents come from a directory of text files (one document per file) or JSONL files
+    (one document per line with ``text``/``content``/``snippet`` and optional ``title`` and
+    ``link``/``url``). Re-indexing only touches files whose modification time changed.
+    """
+
+    def __init__(self, path: str | Path, *, k1: float = 1.2, b: float = 0.75):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT doc_count FROM stats").fetchone()[0]
+
+    def refresh(self, corpus: str | Path) -> int:
+        """Index new or modified files under ``corpus`` and drop vanished ones; returns files re-indexed."""
+        root = Path(corpus)
+        files = [root] if root.is_file() else sorted(p for p in root.rglob("*") if p.is_file())
+        files = [p for p in files if p.suffix in _TEXT_SUFFIXES or p.suffix == ".jsonl"]
+        seen = {str(p.resolve()) for p in files}
+        changed = 0
+        with self._lock, self._conn:
+            known = dict(self._conn.execute("SELECT path, mtime FROM files"))
+            prefix = str(root.resolve())
+            under_root = [p for p in known if p == prefix or p.startswith(prefix + os.sep)]
+            for stale in [p for p in under_root if p not in seen]:
+                self._remove_file(stale)
+            for file in files:
+                path, mtime = str(file.resolve()), file.stat().st_mtime
+                if known.get(path) == mtime:
+                    continue
+                self._remove_file(path)
+                for title, link, body in _read_documents(file):
+                    self._add_document(path, title, link, body)
+                self._conn.execute("INSERT OR REPLACE INTO files (path, mtime) VALUES (?, ?)", (path, mtime))
+                changed += 1
+        return changed
+
+    def _add_document(self, file: str, title: str, link: str, body: str) -> None:
+        terms = Counter(tokenize(f"{title} {body}"))
+        length = sum(terms.values())
+        cursor = self._conn.execute(
+            "INSERT INTO documents (file, title, link, body, length) VALUES (?, ?, ?, ?, ?)",
+            (file, title, link, body, length),
+        )
+        self._conn.executemany(
+            "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+            [(term, cursor.lastrowid, tf) for term, tf in terms.items()],
+        )
+        self._conn.execute(
+            "UPDATE stats SET doc_count = doc_count + 1, total_length = total_length + ?", (length,)
+        )
+
+    def _remove_file(self, file: str) -> None:
+        rows = self._conn.execute("SELECT id, length FROM documents WHERE file = ?", (file,)).fetchall()
+        if rows:
+            self._conn.executemany("DELETE FROM postings WHERE doc_id = ?", [(doc_id,) for doc_id, _ in rows])
+            self._conn.execute("DELETE FROM documents WHERE file = ?", (file,))
+            self._conn.execute(
+                "UPDATE stats SET doc_count = doc_count - ?, total_length = total_length - ?",
+                (len(rows), sum(length for _, length in rows)),
+            )
+        self._conn.execute("DELETE FROM files WHERE path = ?", (file,))
+
+    def query(self, text: str, *, max_results: int = 3) -> list[SearchResult]:
+        terms = set(tokenize(text))
+        with self._lock:
+            doc_count, total_length = self._conn.execute("SELECT doc_count, total_length FROM stats").fetchone()
+            if not terms or not doc_count:
+                return []
+            avg_length = total_length / doc_count
+            scores: dict[int, float] = {}
+            for term in terms:
+                postings = self._conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN documents d ON d.id = p.doc_id "
+                    "WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf, length in postings:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+            ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))[:max_results]
+            results = []
+            for doc_id in ranked:
+                title, link, body = self._conn.execute(
+                    "SELECT title, link, body FROM documents WHERE id = ?", (doc_id,)
+                ).fetchone()
+                results.append(SearchResult(title=title, link=link, snippet=_snippet(body, terms)))
+            return results
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _read_documents(file: Path) -> Iterator[tuple[str, str, str]]:
+    if file.suffix == ".jsonl":
+        with file.open(encoding="utf-8") as handle:
+            for line_no, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                body = record.get("text") or record.get("content") or record.get("snippet") or ""
+                link = record.get("link") or record.get("url") or f"{file.resolve().as_uri()}#L{line_no}"
+                yield record.get("title") or link, link, body
+        return
+    body = file.read_text(encoding="utf-8", errors="replace")
+    yield file.stem, file.resolve().as_uri(), body
+
+
+def _snippet(body: str, terms: Iterable[str]) -> str:
+    """Return the window of ``body`` around the first query-term hit."""
+    lowered = body.casefold()
+    hits = [i for i in (lowered.find(term) for term in terms) if i >= 0]
+    start = max(min(hits) - _SNIPPET_CHARS // 4, 0) if hits else 0
+    snippet = " ".join(body[start:start + _SNIPPET_CHARS].split())
+    return ("..." if start else "") + snippet + ("..." if start + _SNIPPET_CHARS < len(body) else "")
+
+
+class LocalSearchBackend(SearchBackend):
+    """Offline, deterministic search over a LocalIndex, refreshed from ``corpus`` on start-up."""
+
+    name = "local"
+    cacheable = False
+
+    def __init__(self, index_path: str | Path, corpus: str | Path | None = None):
+        self.index = LocalIndex(index_path)
+        if corpus is not None:
+            self.index.refresh(corpus)
+
+    def enabled(self) -> bool:
+        return len(self.index) > 0
+
+    def search(self, query: str, max_results: int) -> list[SearchResult]:
+        return self.index.query(query, max_results=max_results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local search index.")
+    parser.add_argument("--index", type=Path, required=True, help="Path to the SQLite index file.")
+    parser.add_argument("--corpus", type=Path, help="Directory or JSONL file to (re-)index.")
+    parser.add_argument("--query", help="Run a query against the index and print the results.")
+    parser.add_argument("--max-results", type=int, default=3)
+    args = parser.parse_args()
+
+    index = LocalIndex(args.index)
+    if args.corpus:
+        changed = index.refresh(args.corpus)
+        print(f"Re-indexed {changed} file(s); {len(index)} document(s) in index.")
+    if args.query:
+        for result in index.query(args.query, max_results=args.max_results):
+            print(json.dumps(asdict(result), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
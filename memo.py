@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, is_dataclass
+from pathlib import Path
+from typing import Any
+
+from .context import ConversationContext, DiscoveryOutput, ExplorationOutput, IntegrationOutput, SearchLog
+from .llm_client import collecting_batch
+from .prompts import TEMPLATES
+from .router import default_router
+from .settings import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    key TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    output TEXT NOT NULL,
+    search_log TEXT,
+    created REAL NOT NULL
+);
+"""
+
+STAGE_OUTPUTS = {
+    "discovery": DiscoveryOutput,
+    "exploration": ExplorationOutput,
+    "integration": IntegrationOutput,
+}
+
+
+def stage_inputs(stage: str, ctx: ConversationContext) -> dict[str, Any]:
+    """
+    The context values the prompt of ``stage`` consumes
+
+    These are its template fields, plus the human preferences and search log that agents
+    send along after Discovery. Discovery only reads the story and the potential fix.
+    """
+    inputs = {name: _field(ctx, name) for name in TEMPLATES[stage].fields}
+    if stage != "discovery":
+        inputs["human_preferences"] = ctx.human_preferences or ""
+        inputs["search_log"] = list(ctx.search_log)
+    return inputs
+
+
+def stage_key(stage: str, ctx: ConversationContext) -> str:
+    """
+    Hash of ``stage``'s prompt, model parameters and inputs; equal keys mean the same stage call
+
+    The model is the one the router resolves it to, and the provider chain (which failover
+    answers may come from) and any draft model the stage uses are part of the parameters.
+    Batch jobs bypass both, so offline outputs are keyed on the stage's own model alone.
+    """
+    model = settings.stage_models.get(stage, settings.model_name)
+    routed = not collecting_batch()
+    providers = [{name: value for name, value in entry.items() if name != "api_key"} for entry in settings.providers]
+    config: list[Any] = [
+        default_router().resolve_model(model) if routed else model,
+        providers if routed else [],
+        settings.stage_temperatures.get(stage, settings.temperature),
+        settings.top_p,
+        settings.stage_max_tokens.get(stage, settings.max_tokens),
+    ]
+    if stage == "exploration":
+        config.append(settings.exploration_candidates)
+    if routed and settings.draft_model is not None and (not settings.draft_stages or stage in settings.draft_stages):
+        config.append([settings.draft_model, settings.draft_min_confidence])
+    payload = json.dumps(
+        [stage, TEMPLATES[stage].template, config, stage_inputs(stage, ctx)],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StageMemo:
+    """
+    Stage outputs stored under the stage_key() of the context they were computed from
+
+    A changed input only changes the keys of the stages that read it, so a rerun with, e.g.,
+    other human preferences reuses Discovery and recomputes from Exploration on. The search
+    log a stage leaves behind is stored with its output and restored on a hit. Stored in
+    SQLite, so several processes may share the memo.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+
+    def recall(self, key: str, ctx: ConversationContext) -> Any | None:
+        """The output stored under ``key``, with its search log restored into ctx, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT stage, output, search_log FROM outputs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        stage, output, search_log = row
+        if search_log is not None:
+            ctx.search_log = SearchLog(json.loads(search_log))
+        return STAGE_OUTPUTS[stage](**json.loads(output))
+
+    def store(self, key: str, stage: str, output: Any, ctx: ConversationContext) -> None:
+        """Remember ``output`` of ``stage`` under ``key``, along with the search log it left in ctx."""
+        if not is_dataclass(output):
+            return
+        search_log = None if stage == "discovery" else json.dumps(list(ctx.search_log), ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO outputs (key, stage, output, search_log, created) VALUES (?, ?, ?, ?, ?)",
+                (key, stage, json.dumps(asdict(output), ensure_ascii=False), search_log, time.time()),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM outputs")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _field(ctx: ConversationContext, name: str) -> Any:
+    for source in (ctx, ctx.discovery, ctx.exploration):
+        if source is not None and hasattr(source, name):
+            return getattr(source, name)
+    raise KeyError(f"No context value for prompt field {name!r}")
+
+
+_shared: dict[Path, StageMemo] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_stage_memo() -> StageMemo | None:
+    """Return the process-wide memo configured by ``U2_STAGE_MEMO_PATH``, or None when disabled."""
+    if not settings.stage_memo_path:
+        return None
+    path = Path(settings.stage_memo_path).expanduser()
+    with _shared_lock:
+        memo = _shared.get(path)
+        if memo is None:
+            memo = StageMemo(path)
+            _shared[path] = memo
+        return memo
@@ -1,30 +1,105 @@
 ﻿from __future__ import annotations
 
+import asyncio
+import contextvars
+import copy
+import difflib
+import inspect
 import json
-from typing import Any, Callable
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, fields, is_dataclass
+from typing import Any, Callable, ContextManager, Generator, Iterator
 
 from .agents.discovery import DiscoveryAgent
 from .agents.exploration import ExplorationAgent
 from .agents.integration import IntegrationAgent
-from .context import ConversationContext
+from .candidates import CandidateVariant, candidate_variants, score_exploration
+from .checkpoint import CheckpointStore
+from .context import ConversationContext, DiscoveryOutput
+from .dedupe import StoryIndex, shared_story_index
+from .events import StageEvent
+from .llm_client import listen_tokens, override_call
+from .memo import StageMemo, shared_stage_memo, stage_key
 from .search import SearchAugmentor
+from .settings import settings
+from .tokens import fit_context
+from .tracing import Tracer, annotate, count, current_metrics, span, trace_run
+from .usage import current_usage, record_usage, stage_scope, track_usage
+
+FEEDBACK_ACTIONS = ("proceed", "retry", "feedback", "stop")
+
+
+def feedback_reply(feedback: dict[str, Any]) -> dict[str, Any]:
+    """
+    ``feedback`` as a human_feedback_callback returns it: {'continue', 'feedback', 'action'}
+
+    The action defaults to 'proceed'; one not in FEEDBACK_ACTIONS raises ValueError.
+    """
+    action = feedback.get("action", "proceed")
+    if action not in FEEDBACK_ACTIONS:
+        raise ValueError(f"Feedback action must be one of {', '.join(FEEDBACK_ACTIONS)}, not {action!r}")
+    return {
+        "continue": bool(feedback.get("continue", action != "stop")),
+        "feedback": str(feedback.get("feedback") or ""),
+        "action": action,
+    }
 
 
 class Orchestrator:
-    def __init__(self, interactive: bool = False, human_feedback_callback: Callable | None = None):
+    def __init__(
+        self,
+        interactive: bool = False,
+        human_feedback_callback: Callable | None = None,
+        checkpoint_store: CheckpointStore | None = None,
+        event_callback: Callable[[StageEvent], None] | None = None,
+        tracer: Tracer | None = None,
+        suspend_on_feedback: bool = False,
+        story_index: StoryIndex | None = None,
+        stage_memo: StageMemo | None = None,
+    ):
         """
         Initialize Orchestrator
         
         Args:
             interactive: Enable interactive mode with human feedback after each agent stage
             human_feedback_callback: Custom human feedback callback function receiving (stage, output, ctx) parameters
+            checkpoint_store: Optional store used to persist runs started with a run_id
+            event_callback: Receives StageEvents (stage_started, token, stage_finished, run_finished);
+                defaults to progressive console output in interactive console mode
+            tracer: Optional Tracer receiving run, stage, LLM call and search spans
+                (e.g. tracing.OpenTelemetryTracer)
+            suspend_on_feedback: Instead of calling the feedback callback, park the run in
+                checkpoint_store at each feedback point and return; resume() continues it.
+                Implies interactive mode.
+            story_index: Index of finished runs used to skip near-duplicate stories; defaults to
+                the one at U2_DEDUPE_INDEX_PATH (see _begin())
+            stage_memo: Memo of stage outputs keyed on their prompt inputs, so a rerun with some
+                inputs changed only recomputes the stages reading them; defaults to the one at
+                U2_STAGE_MEMO_PATH (see _run_agent())
         """
+        if suspend_on_feedback and checkpoint_store is None:
+            raise ValueError("suspend_on_feedback needs a checkpoint_store to park runs in")
         search = SearchAugmentor()
         self.discovery = DiscoveryAgent()
         self.exploration = ExplorationAgent(search=search)
         self.integration = IntegrationAgent(search=search)
-        self.interactive = interactive
+        self.interactive = interactive or suspend_on_feedback
         self.human_feedback_callback = human_feedback_callback
+        self.checkpoint_store = checkpoint_store
+        self.suspend_on_feedback = suspend_on_feedback
+        self.story_index = story_index if story_index is not None else shared_story_index()
+        self.stage_memo = stage_memo if stage_memo is not None else shared_stage_memo()
+        if event_callback is None and interactive and human_feedback_callback is None:
+            event_callback = self._default_console_events
+        self.event_callback = event_callback
+        self.tracer = tracer
+        # Stages whose output the console has streamed since they last started.
+        self._streamed: set[str] = set()
 
     def _get_human_feedback(self, stage: str, output: Any, ctx: ConversationContext) -> dict[str, Any]:
         """
@@ -47,13 +122,32 @@ class Orchestrator:
         # Default console interaction implementation
         return self._default_console_feedback(stage, output, ctx)
     
+    def _default_console_events(self, event: StageEvent) -> None:
+        """Default console rendering of agent output while it streams"""
+        if event.kind == "stage_started":
+            self._streamed.discard(event.stage)
+            print(f"\n⏳ Running {event.stage.upper()} agent...\n")
+        elif event.kind == "token":
+            self._streamed.add(event.stage)
+            print(event.data, end="", flush=True)
+        elif event.kind == "stage_finished":
+            print()
+
     def _default_console_feedback(self, stage: str, output: Any, ctx: ConversationContext) -> dict[str, Any]:
-        """Default console human-in-the-loop interaction implementation"""
+        """
+        Default console human-in-the-loop interaction implementation
+
+        Output the console already streamed is not printed again; only Exploration's validated
+        UUs, the structured summary of its analysis, are repeated next to the prompt.
+        """
         print("\n" + "="*80)
         print(f"🤖 Agent Stage Completed: {stage.upper()}")
         print("="*80)
         
-        if stage == "discovery":
+        if stage in self._streamed:
+            if stage == "exploration":
+                print(f"\n✅ Validated UUs:\n{output.validated_uus}")
+        elif stage == "discovery":
             print(f"\n📋 Core Problem:\n{output.core_problem}")
             print(f"\n💡 Baseline Solution:\n{output.baseline_solution}")
             print(f"\n⚠️  Critical Defects:\n{output.critical_defects}")
@@ -92,106 +186,737 @@ class Orchestrator:
             "action": action
         }
 
-    def run(
-        self,
-        *,
-        enabler_story: str,
-        potential_fix: str,
-        human_preferences: str | None = None,
-    ) -> dict[str, Any]:
-        ctx = ConversationContext(
-            enabler_story=enabler_story,
-            potential_fix=potential_fix,
-            human_preferences=human_preferences,
-        )
-        
+    def _pipeline(
+        self, ctx: ConversationContext, start: str = "discovery", guard: _LoopGuard | None = None
+    ) -> Generator[tuple[str, str, Any], Any, dict[str, Any]]:
+        """
+        Discovery -> Exploration -> Integration control flow shared by run() and arun()
+
+        Yields ("agent", stage, restart) to request an agent run, ("feedback", stage, output)
+        to request human feedback and ("checkpoint", next_stage, None) at stage boundaries;
+        the driver sends back the agent output or feedback dict.
+        Starts at ``start`` ('discovery', 'exploration' or 'integration') and returns the
+        final result dictionary. ``guard`` carries the loop state of a resumed run.
+        """
+        guard = guard or _LoopGuard()
+        try:
+            terminated = yield from self._stages(ctx, start, guard)
+        except _TokenBudgetExceeded:
+            terminated = False
+            guard.stop_reason = "token_budget"
+        stop_reason = "terminated_by_user" if terminated else guard.stop_reason or "completed"
+        return self._build_result(ctx, terminated=terminated, stop_reason=stop_reason)
+
+    def _stages(
+        self, ctx: ConversationContext, start: str, guard: _LoopGuard
+    ) -> Generator[tuple[str, str, Any], Any, bool]:
+        """Run the stages from ``start``; returns True when the user stopped the run"""
         # Discovery stage
-        while True:
-            ctx.discovery = self.discovery.run(ctx)
+        while start == "discovery":
+            ctx.discovery = yield from guard.agent("discovery")
             
             if self.interactive:
-                feedback = self._get_human_feedback("discovery", ctx.discovery, ctx)
+                feedback = yield ("feedback", "discovery", ctx.discovery)
                 if not feedback["continue"]:
-                    return self._build_result(ctx, terminated=True)
+                    return True
                 
+                self._apply_feedback(ctx, "discovery", feedback)
                 if feedback["action"] == "retry":
-                    # Add human feedback to preferences
-                    if feedback["feedback"]:
-                        ctx.human_preferences = (ctx.human_preferences or "") + f"\n[Discovery Feedback]: {feedback['feedback']}"
+                    count("stage_retries")
                     continue
-                elif feedback["action"] == "feedback":
-                    if feedback["feedback"]:
-                        ctx.human_preferences = (ctx.human_preferences or "") + f"\n[Discovery Feedback]: {feedback['feedback']}"
             
+            yield ("checkpoint", "exploration", None)
             break
 
         # Exploration & Integration loop
         while True:
             # Exploration stage
-            while True:
-                ctx.exploration = self.exploration.run(ctx)
+            while start != "integration":
+                ctx.exploration = yield from guard.agent("exploration")
                 
-                if ctx.exploration.requires_discovery_reset:
-                    ctx.discovery = self.discovery.run(ctx, restart=True)
+                if ctx.exploration.requires_discovery_reset and guard.allow_loop("exploration", "discovery"):
+                    count("discovery_resets")
+                    ctx.discovery = yield from guard.agent("discovery", restart=True)
                     continue
                 
                 if self.interactive:
-                    feedback = self._get_human_feedback("exploration", ctx.exploration, ctx)
+                    feedback = yield ("feedback", "exploration", ctx.exploration)
                     if not feedback["continue"]:
-                        return self._build_result(ctx, terminated=True)
+                        return True
                     
+                    self._apply_feedback(ctx, "exploration", feedback)
                     if feedback["action"] == "retry":
-                        if feedback["feedback"]:
-                            ctx.human_preferences = (ctx.human_preferences or "") + f"\n[Exploration Feedback]: {feedback['feedback']}"
+                        count("stage_retries")
                         continue
-                    elif feedback["action"] == "feedback":
-                        if feedback["feedback"]:
-                            ctx.human_preferences = (ctx.human_preferences or "") + f"\n[Exploration Feedback]: {feedback['feedback']}"
                 
+                yield ("checkpoint", "integration", None)
                 break
+            start = "exploration"
 
             # Integration stage
             while True:
-                ctx.integration = self.integration.run(ctx)
+                ctx.integration = yield from guard.agent("integration")
                 
                 if self.interactive:
-                    feedback = self._get_human_feedback("integration", ctx.integration, ctx)
+                    feedback = yield ("feedback", "integration", ctx.integration)
                     if not feedback["continue"]:
-                        return self._build_result(ctx, terminated=True)
+                        return True
                     
+                    self._apply_feedback(ctx, "integration", feedback)
                     if feedback["action"] == "retry":
-                        if feedback["feedback"]:
-                            ctx.human_preferences = (ctx.human_preferences or "") + f"\n[Integration Feedback]: {feedback['feedback']}"
+                        count("stage_retries")
                         continue
-                    elif feedback["action"] == "feedback":
-                        if feedback["feedback"]:
-                            ctx.human_preferences = (ctx.human_preferences or "") + f"\n[Integration Feedback]: {feedback['feedback']}"
                 
                 break
             
             # Check Integration callback
-            if ctx.integration.callback == "exploration":
+            callback = ctx.integration.callback
+            if callback in ("exploration", "discovery") and not guard.allow_loop("integration", callback):
+                break
+            if callback == "exploration":
+                count("exploration_callbacks")
+                yield ("checkpoint", "exploration", None)
                 continue
-            if ctx.integration.callback == "discovery":
-                ctx.discovery = self.discovery.run(ctx, restart=True)
+            if callback == "discovery":
+                count("discovery_callbacks")
+                ctx.discovery = yield from guard.agent("discovery", restart=True)
+                yield ("checkpoint", "exploration", None)
                 continue
             break
 
-        return self._build_result(ctx, terminated=False)
+        return False
+
+    @staticmethod
+    def _apply_feedback(ctx: ConversationContext, stage: str, feedback: dict[str, Any]) -> None:
+        """Append retry/feedback text to human preferences so later stages see it"""
+        if feedback["action"] in ("retry", "feedback") and feedback["feedback"]:
+            ctx.human_preferences = (ctx.human_preferences or "") + f"\n[{stage.capitalize()} Feedback]: {feedback['feedback']}"
+
+    def run(
+        self,
+        *,
+        enabler_story: str,
+        potential_fix: str,
+        human_preferences: str | None = None,
+        run_id: str | None = None,
+        on_event: Callable[[StageEvent], None] | None = None,
+    ) -> dict[str, Any]:
+        """
+        Run the agent pipeline for one story
+        
+        Args:
+            run_id: Checkpoint key. With a checkpoint_store, the context is persisted after every
+                stage and a later call with the same run_id resumes from the last completed stage
+                (the stored context takes precedence over the other arguments); a finished run
+                returns its stored result.
+            on_event: Event callback for this run only, overriding event_callback
+
+        With suspend_on_feedback, a run reaching a feedback point is parked and its result has
+        stop_reason 'awaiting_feedback', a ``resume_token`` for resume() (the run_id, generated
+        when not given) and the ``pending_feedback`` stage, output and deadline.
+        """
+        on_event = on_event or self.event_callback
+        ctx, start, result, guard = self._begin(run_id, enabler_story, potential_fix, human_preferences)
+        if start == "suspended":
+            return result
+        if start == "done":
+            return self._finish(result, on_event)
+        if self.suspend_on_feedback and run_id is None:
+            run_id = uuid.uuid4().hex
+        return self._drive(run_id, ctx, start, guard, on_event)
+
+    def resume(
+        self,
+        token: str,
+        feedback: dict[str, Any] | None = None,
+        *,
+        on_event: Callable[[StageEvent], None] | None = None,
+    ) -> dict[str, Any]:
+        """
+        Continue a run parked at a feedback point with ``feedback`` ({'action', 'feedback',
+        'continue'}, as returned by a human_feedback_callback)
+
+        Without feedback, or once the run's ``U2_FEEDBACK_TIMEOUT`` has passed, the run continues
+        with ``U2_FEEDBACK_DEFAULT_ACTION``. Returns the final result, or a suspended result when
+        the run reaches its next feedback point. usage and metrics cover this segment only.
+        """
+        ctx, stage, guard, reply, timed_out = self._load_suspended(token, feedback)
+        return self._drive(token, ctx, stage, guard, on_event or self.event_callback, reply, timed_out)
+
+    def _drive(
+        self,
+        run_id: str | None,
+        ctx: ConversationContext,
+        start: str,
+        guard: _LoopGuard,
+        on_event: Callable[[StageEvent], None] | None,
+        resumed: dict[str, Any] | None = None,
+        timed_out: bool = False,
+    ) -> dict[str, Any]:
+        """Execute the pipeline from ``start``; ``resumed`` answers its first feedback request"""
+        steps = self._pipeline(ctx, start, guard)
+        reply = None
+        with track_usage(), trace_run(self.tracer, run_id=run_id):
+            if timed_out:
+                count("feedback_timeouts")
+            try:
+                while True:
+                    kind, stage, arg = steps.send(reply)
+                    reply = None
+                    if kind == "agent":
+                        memoize = guard.memoizable(stage, arg)
+                        reply = self._run_agent(stage, ctx, restart=arg, memoize=memoize, on_event=on_event)
+                    elif kind == "feedback" and resumed is not None:
+                        reply, resumed = resumed, None
+                    elif kind == "feedback" and self.suspend_on_feedback:
+                        return self._suspend(run_id, stage, arg, ctx, guard, on_event)
+                    elif kind == "feedback":
+                        reply = self._get_human_feedback(stage, arg, ctx)
+                    else:
+                        self._save_checkpoint(run_id, stage, ctx, guard=guard)
+            except StopIteration as stop:
+                self._finished(run_id, ctx, stop.value)
+                return self._finish(stop.value, on_event)
+
+    async def arun(
+        self,
+        *,
+        enabler_story: str,
+        potential_fix: str,
+        human_preferences: str | None = None,
+        run_id: str | None = None,
+        on_event: Callable[[StageEvent], None] | None = None,
+    ) -> dict[str, Any]:
+        """
+        Asynchronous run() for serving many stories from one event loop
+        
+        Agents exposing an ``arun`` coroutine (backed by AsyncLLMClient) are awaited directly;
+        synchronous agents and feedback callbacks are offloaded to the default executor, so
+        on_event may be called from a worker thread. Coroutine human_feedback_callbacks are
+        awaited. ``run_id`` and ``on_event`` behave as in run().
+        """
+        on_event = on_event or self.event_callback
+        ctx, start, result, guard = self._begin(run_id, enabler_story, potential_fix, human_preferences)
+        if start == "suspended":
+            return result
+        if start == "done":
+            return self._finish(result, on_event)
+        if self.suspend_on_feedback and run_id is None:
+            run_id = uuid.uuid4().hex
+        return await self._adrive(run_id, ctx, start, guard, on_event)
+
+    async def aresume(
+        self,
+        token: str,
+        feedback: dict[str, Any] | None = None,
+        *,
+        on_event: Callable[[StageEvent], None] | None = None,
+    ) -> dict[str, Any]:
+        """Asynchronous resume()"""
+        ctx, stage, guard, reply, timed_out = self._load_suspended(token, feedback)
+        return await self._adrive(token, ctx, stage, guard, on_event or self.event_callback, reply, timed_out)
+
+    async def _adrive(
+        self,
+        run_id: str | None,
+        ctx: ConversationContext,
+        start: str,
+        guard: _LoopGuard,
+        on_event: Callable[[StageEvent], None] | None,
+        resumed: dict[str, Any] | None = None,
+        timed_out: bool = False,
+    ) -> dict[str, Any]:
+        steps = self._pipeline(ctx, start, guard)
+        reply = None
+        with track_usage(), trace_run(self.tracer, run_id=run_id):
+            if timed_out:
+                count("feedback_timeouts")
+            try:
+                while True:
+                    kind, stage, arg = steps.send(reply)
+                    reply = None
+                    if kind == "agent":
+                        memoize = guard.memoizable(stage, arg)
+                        reply = await self._arun_agent(stage, ctx, restart=arg, memoize=memoize, on_event=on_event)
+                    elif kind == "feedback" and resumed is not None:
+                        reply, resumed = resumed, None
+                    elif kind == "feedback" and self.suspend_on_feedback:
+                        return self._suspend(run_id, stage, arg, ctx, guard, on_event)
+                    elif kind == "feedback":
+                        reply = await self._aget_human_feedback(stage, arg, ctx)
+                    else:
+                        self._save_checkpoint(run_id, stage, ctx, guard=guard)
+            except StopIteration as stop:
+                self._finished(run_id, ctx, stop.value)
+                return self._finish(stop.value, on_event)
+
+    def _begin(
+        self,
+        run_id: str | None,
+        enabler_story: str,
+        potential_fix: str,
+        human_preferences: str | None,
+    ) -> tuple[ConversationContext, str, dict[str, Any] | None, _LoopGuard]:
+        """
+        Return (context, start stage, stored result, loop guard), restoring from a checkpoint if one exists
+
+        The start stage is 'done' for a finished run and 'suspended' for a parked one. A run
+        resumed at a stage boundary keeps the iteration counts and outputs its loop guard had.
+
+        A new story is looked up in story_index first, unless the orchestrator is interactive. When a finished run of a
+        story at least ``U2_DEDUPE_THRESHOLD`` similar exists, its result is reused (marked with
+        ``reused_from``) if ``U2_DEDUPE_ACTION`` is 'reuse' and the human preferences are the
+        same; otherwise its Discovery output seeds the run, which starts at Exploration.
+        """
+        checkpoint = None
+        if self.checkpoint_store is not None and run_id is not None:
+            checkpoint = self.checkpoint_store.load(run_id)
+        if checkpoint is None:
+            ctx = ConversationContext(
+                enabler_story=enabler_story,
+                potential_fix=potential_fix,
+                human_preferences=human_preferences,
+            )
+            if self.story_index is None or self.interactive:
+                return ctx, "discovery", None, _LoopGuard()
+            matches = self.story_index.find(enabler_story, potential_fix, settings.dedupe_threshold)
+            if not matches:
+                return ctx, "discovery", None, _LoopGuard()
+            match = matches[0]
+            if settings.dedupe_action == "reuse" and match.human_preferences == (human_preferences or ""):
+                reused_from = {"run_id": match.run_id, "similarity": round(match.similarity, 4)}
+                # This run spent nothing; the stored usage and metrics belong to the original run.
+                result = {**match.result, "usage": {}, "metrics": {}, "reused_from": reused_from}
+                return ctx, "done", result, _LoopGuard()
+            ctx.discovery = DiscoveryOutput(
+                core_problem=match.result["core_problem"],
+                baseline_solution=match.result["baseline_solution"],
+                critical_defects=match.result["critical_defects"],
+            )
+            return ctx, "exploration", None, _LoopGuard()
+        stage = "suspended" if checkpoint.get("suspended") else checkpoint["stage"]
+        # Checkpoints written before the loop guard was saved restart its counts.
+        guard = _LoopGuard.from_dict(checkpoint["guard"]) if checkpoint.get("guard") else _LoopGuard()
+        return ConversationContext.from_dict(checkpoint["context"]), stage, checkpoint.get("result"), guard
+
+    def _save_checkpoint(
+        self,
+        run_id: str | None,
+        stage: str,
+        ctx: ConversationContext,
+        result: dict[str, Any] | None = None,
+        guard: _LoopGuard | None = None,
+    ) -> None:
+        if self.checkpoint_store is None or run_id is None:
+            return
+        self.checkpoint_store.save(
+            run_id,
+            {
+                "run_id": run_id,
+                "stage": stage,
+                "context": ctx.to_dict(),
+                "result": result,
+                "guard": guard.to_dict() if guard is not None else None,
+            },
+        )
+
+    def _finished(self, run_id: str | None, ctx: ConversationContext, result: dict[str, Any]) -> None:
+        """
+        Checkpoint a finished run as done and add it to story_index
+
+        A run cut short by the user or the token budget is not done: its checkpoint stays at
+        the last stage boundary, so a rerun with the same run_id continues from there. A run
+        without a run_id is indexed under a generated one.
+        """
+        if result["stop_reason"] in ("terminated_by_user", "token_budget"):
+            self._reopen(run_id)
+            return
+        self._save_checkpoint(run_id, "done", ctx, result)
+        if self.story_index is not None:
+            self.story_index.add(
+                run_id or uuid.uuid4().hex, ctx.enabler_story, ctx.potential_fix, ctx.human_preferences, result
+            )
+
+    def _reopen(self, run_id: str | None) -> None:
+        """Turn the checkpoint of a parked run that was stopped back into one a rerun starts at its stage"""
+        if self.checkpoint_store is None or run_id is None:
+            return
+        checkpoint = self.checkpoint_store.load(run_id)
+        if checkpoint is not None and checkpoint.get("suspended"):
+            self._save_checkpoint(
+                run_id,
+                checkpoint["stage"],
+                ConversationContext.from_dict(checkpoint["context"]),
+                guard=_LoopGuard.from_dict(checkpoint["suspended"]["guard"]),
+            )
+
+    def _suspend(
+        self,
+        run_id: str,
+        stage: str,
+        output: Any,
+        ctx: ConversationContext,
+        guard: _LoopGuard,
+        on_event: Callable[[StageEvent], None] | None,
+    ) -> dict[str, Any]:
+        """Park the run at the feedback point of ``stage`` and return its suspended result"""
+        deadline = time.time() + settings.feedback_timeout if settings.feedback_timeout is not None else None
+        count("runs_suspended")
+        result = self._build_result(ctx, stop_reason="awaiting_feedback")
+        result["resume_token"] = run_id
+        result["pending_feedback"] = {"stage": stage, "output": asdict(output), "deadline": deadline}
+        self.checkpoint_store.save(
+            run_id,
+            {
+                "run_id": run_id,
+                "stage": stage,
+                "context": ctx.to_dict(),
+                "result": result,
+                "suspended": {"guard": guard.to_dict(), "deadline": deadline},
+            },
+        )
+        if on_event is not None:
+            on_event(StageEvent("run_suspended", stage, result))
+        return result
+
+    def _load_suspended(
+        self, token: str, feedback: dict[str, Any] | None
+    ) -> tuple[ConversationContext, str, _LoopGuard, dict[str, Any], bool]:
+        """Context, stage, loop guard and feedback reply to resume the run parked under ``token``"""
+        checkpoint = self.checkpoint_store.load(token) if self.checkpoint_store is not None else None
+        if checkpoint is None or not checkpoint.get("suspended"):
+            raise KeyError(f"No run is awaiting feedback under {token!r}")
+        ctx = ConversationContext.from_dict(checkpoint["context"])
+        stage = checkpoint["stage"]
+        suspended = checkpoint["suspended"]
+        deadline = suspended["deadline"]
+        timed_out = deadline is not None and time.time() > deadline
+        if feedback is None or timed_out:
+            feedback = {"action": settings.feedback_default_action}
+        reply = feedback_reply(feedback)
+        guard = _LoopGuard.from_dict(suspended["guard"])
+        # The stage's output is already in ctx: the resumed pipeline takes it instead of rerunning the agent.
+        guard.replay[stage] = getattr(ctx, stage)
+        return ctx, stage, guard, reply, timed_out
+
+    def resume_expired(self) -> list[dict[str, Any]]:
+        """Resume every parked run whose feedback deadline has passed with U2_FEEDBACK_DEFAULT_ACTION"""
+        if self.checkpoint_store is None:
+            return []
+        results = []
+        now = time.time()
+        for run_id in self.checkpoint_store.run_ids():
+            checkpoint = self.checkpoint_store.load(run_id)
+            suspended = checkpoint.get("suspended") if checkpoint else None
+            if suspended and suspended["deadline"] is not None and suspended["deadline"] < now:
+                results.append(self.resume(run_id))
+        return results
+
+    def iter_events(self, **kwargs) -> Iterator[StageEvent]:
+        """
+        Run in a background thread and yield its StageEvents as they happen
+        
+        Accepts the keyword arguments of run(); the last event is 'run_finished' carrying the result.
+        Exceptions raised by the run are re-raised from the iterator.
+        """
+        events: queue.Queue[StageEvent | BaseException] = queue.Queue()
+
+        def target() -> None:
+            try:
+                self.run(**kwargs, on_event=events.put)
+            except BaseException as exc:
+                events.put(exc)
+
+        threading.Thread(target=target, name="u2-run", daemon=True).start()
+        while True:
+            event = events.get()
+            if isinstance(event, BaseException):
+                raise event
+            yield event
+            if event.kind == "run_finished":
+                return
+
+    def _run_agent(
+        self,
+        stage: str,
+        ctx: ConversationContext,
+        *,
+        restart: bool = False,
+        memoize: bool = False,
+        on_event: Callable[[StageEvent], None] | None = None,
+    ) -> Any:
+        """
+        Run the agent of ``stage`` on ctx and return its output
+
+        ``memoize`` marks the stage's first plain run. Only then may a stage_memo output stored
+        for the same prompt inputs stand in for the agent, and only then are its completions
+        read from the response cache; either way fresh outputs are stored.
+        """
+        agent = getattr(self, stage)
+        speculative = self._speculative(stage)
+        if on_event is not None:
+            on_event(StageEvent("stage_started", stage))
+        # Interleaved deltas of parallel candidates would be unreadable, so they are not streamed.
+        listener = self._token_listener(stage, None if speculative else on_event)
+        with stage_scope(stage), span(f"stage.{stage}", restart=restart), listener, override_call(fresh=not memoize):
+            self._fit_context(ctx, stage)
+            key, output = self._recall(stage, ctx, memoize)
+            if output is None:
+                if speculative:
+                    output = self._run_candidates(agent, ctx)
+                else:
+                    output = agent.run(ctx, restart=True) if restart else agent.run(ctx)
+                self._memorize(key, stage, output, ctx)
+        if on_event is not None:
+            on_event(StageEvent("stage_finished", stage, output))
+        return output
+
+    async def _arun_agent(
+        self,
+        stage: str,
+        ctx: ConversationContext,
+        *,
+        restart: bool = False,
+        memoize: bool = False,
+        on_event: Callable[[StageEvent], None] | None = None,
+    ) -> Any:
+        agent = getattr(self, stage)
+        kwargs = {"restart": True} if restart else {}
+        speculative = self._speculative(stage)
+        if on_event is not None:
+            on_event(StageEvent("stage_started", stage))
+        # Stage and token listener are context-local, so they also reach agents run via to_thread.
+        listener = self._token_listener(stage, None if speculative else on_event)
+        with stage_scope(stage), span(f"stage.{stage}", restart=restart), listener, override_call(fresh=not memoize):
+            self._fit_context(ctx, stage)
+            key, output = self._recall(stage, ctx, memoize)
+            if output is None:
+                if speculative:
+                    output = await self._arun_candidates(agent, ctx)
+                elif hasattr(agent, "arun"):
+                    output = await agent.arun(ctx, **kwargs)
+                else:
+                    output = await asyncio.to_thread(agent.run, ctx, **kwargs)
+                self._memorize(key, stage, output, ctx)
+        if on_event is not None:
+            on_event(StageEvent("stage_finished", stage, output))
+        return output
+
+    def _recall(self, stage: str, ctx: ConversationContext, memoize: bool) -> tuple[str | None, Any]:
+        """(memo key, stored output or None) of ``stage`` on ctx; no key when it is not memoized"""
+        if not memoize or self.stage_memo is None:
+            return None, None
+        key = stage_key(stage, ctx)
+        output = self.stage_memo.recall(key, ctx)
+        if output is not None:
+            count("stage_memo_hits")
+            annotate(memoized=True)
+        return key, output
+
+    def _memorize(self, key: str | None, stage: str, output: Any, ctx: ConversationContext) -> None:
+        if key is not None:
+            self.stage_memo.store(key, stage, output, ctx)
+
+    @staticmethod
+    def _speculative(stage: str) -> bool:
+        return stage == "exploration" and settings.exploration_candidates > 1
+
+    @staticmethod
+    def _candidate_variants() -> list[CandidateVariant]:
+        return candidate_variants(
+            settings.exploration_candidates,
+            settings.stage_temperatures.get("exploration", settings.temperature),
+            settings.candidate_temperature_spread,
+        )
+
+    def _run_candidates(self, agent: Any, ctx: ConversationContext) -> Any:
+        """Run Exploration candidates in parallel, each on its own copy of ctx, and adopt the best one"""
+        variants = self._candidate_variants()
+        contexts = [copy.deepcopy(ctx) for _ in variants]
+        with ThreadPoolExecutor(len(variants), thread_name_prefix="u2-candidate") as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._run_candidate, agent, candidate_ctx, index, variant)
+                for index, (variant, candidate_ctx) in enumerate(zip(variants, contexts))
+            ]
+            outcomes = [future.exception() or future.result() for future in futures]
+        return self._select_candidate(ctx, contexts, outcomes)
+
+    async def _arun_candidates(self, agent: Any, ctx: ConversationContext) -> Any:
+        variants = self._candidate_variants()
+        contexts = [copy.deepcopy(ctx) for _ in variants]
+        outcomes = await asyncio.gather(
+            *(
+                self._arun_candidate(agent, candidate_ctx, index, variant)
+                for index, (variant, candidate_ctx) in enumerate(zip(variants, contexts))
+            ),
+            return_exceptions=True,
+        )
+        return self._select_candidate(ctx, contexts, outcomes)
+
+    @staticmethod
+    def _run_candidate(agent: Any, ctx: ConversationContext, index: int, variant: CandidateVariant) -> Any:
+        with span("exploration.candidate", index=index, temperature=variant.temperature), override_call(
+            temperature=variant.temperature, instruction=variant.emphasis
+        ):
+            output = agent.run(ctx)
+            annotate(score=score_exploration(output))
+        return output
+
+    @staticmethod
+    async def _arun_candidate(agent: Any, ctx: ConversationContext, index: int, variant: CandidateVariant) -> Any:
+        with span("exploration.candidate", index=index, temperature=variant.temperature), override_call(
+            temperature=variant.temperature, instruction=variant.emphasis
+        ):
+            if hasattr(agent, "arun"):
+                output = await agent.arun(ctx)
+            else:
+                output = await asyncio.to_thread(agent.run, ctx)
+            annotate(score=score_exploration(output))
+        return output
+
+    @staticmethod
+    def _select_candidate(ctx: ConversationContext, contexts: list[ConversationContext], outcomes: list[Any]) -> Any:
+        """Copy the best-scoring candidate's context (e.g. its search log) into ctx and return its output"""
+        succeeded = [index for index, outcome in enumerate(outcomes) if not isinstance(outcome, BaseException)]
+        if not succeeded:
+            raise outcomes[0]
+        # Ties go to the earliest candidate, i.e. the unmodified prompt.
+        best = max(succeeded, key=lambda index: (score_exploration(outcomes[index]), -index))
+        for f in fields(ctx):
+            setattr(ctx, f.name, getattr(contexts[best], f.name))
+        annotate(candidates=len(outcomes), failed_candidates=len(outcomes) - len(succeeded), selected_candidate=best)
+        count("exploration_candidates", len(outcomes))
+        return outcomes[best]
+
+    @staticmethod
+    def _token_listener(stage: str, on_event: Callable[[StageEvent], None] | None) -> ContextManager:
+        if on_event is None:
+            return nullcontext()
+        return listen_tokens(lambda delta: on_event(StageEvent("token", stage, delta)))
+
+    @staticmethod
+    def _fit_context(ctx: ConversationContext, stage: str) -> None:
+        """Trim the oldest search results and feedback when the stage prompt would exceed the context budget"""
+        if settings.max_context_tokens is None:
+            return
+        removed = fit_context(ctx, stage, settings.max_context_tokens)
+        if removed:
+            record_usage(context_truncations=removed)
+
+    @staticmethod
+    def _finish(result: dict[str, Any], on_event: Callable[[StageEvent], None] | None) -> dict[str, Any]:
+        if on_event is not None:
+            on_event(StageEvent("run_finished", "", result))
+        return result
+
+    async def _aget_human_feedback(self, stage: str, output: Any, ctx: ConversationContext) -> dict[str, Any]:
+        if self.human_feedback_callback and inspect.iscoroutinefunction(self.human_feedback_callback):
+            return await self.human_feedback_callback(stage, output, ctx)
+        return await asyncio.to_thread(self._get_human_feedback, stage, output, ctx)
     
-    def _build_result(self, ctx: ConversationContext, terminated: bool = False) -> dict[str, Any]:
+    def _build_result(
+        self, ctx: ConversationContext, terminated: bool = False, stop_reason: str = "completed"
+    ) -> dict[str, Any]:
         """Build final result"""
+        usage = current_usage()
+        metrics = current_metrics()
         return {
             "core_problem": ctx.discovery.core_problem if ctx.discovery else "",
             "baseline_solution": ctx.discovery.baseline_solution if ctx.discovery else "",
             "critical_defects": ctx.discovery.critical_defects if ctx.discovery else "",
             "exploration_analysis": ctx.exploration.analysis if ctx.exploration else "",
             "integration_synthesis": ctx.integration.synthesis if ctx.integration else "",
-            "search_log": ctx.search_log,
+            "search_log": list(ctx.search_log),
             "terminated_by_user": terminated,
+            "stop_reason": stop_reason,
             "final_human_preferences": ctx.human_preferences,
+            "usage": usage.as_dict() if usage else {},
+            "metrics": metrics.as_dict() if metrics else {},
         }
 
     def run_to_json(self, **kwargs) -> str:
         result = self.run(**kwargs)
         return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+class _TokenBudgetExceeded(Exception):
+    pass
+
+
+class _LoopGuard:
+    """
+    Bounds the discovery-reset and integration-callback loops of one run
+
+    A loop back to a stage is refused once that stage has run its iteration limit, or when
+    the stage requesting the loop produced nearly the same output as on its previous run
+    (the loop has converged). No agent is started once the run has used ``max_run_tokens``.
+    stop_reason records the last guard that fired.
+    """
+
+    def __init__(self):
+        self.iterations: dict[str, int] = {}
+        self.outputs: dict[str, tuple[str | None, str]] = {}
+        self.stop_reason: str | None = None
+        # Outputs handed back instead of running the agent, once, e.g. for a resumed run.
+        self.replay: dict[str, Any] = {}
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "iterations": self.iterations,
+            "outputs": {stage: list(outputs) for stage, outputs in self.outputs.items()},
+            "stop_reason": self.stop_reason,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> _LoopGuard:
+        guard = cls()
+        guard.iterations = dict(data["iterations"])
+        guard.outputs = {stage: tuple(outputs) for stage, outputs in data["outputs"].items()}
+        guard.stop_reason = data["stop_reason"]
+        return guard
+
+    def agent(self, stage: str, restart: bool = False) -> Generator[tuple[str, str, Any], Any, Any]:
+        if stage in self.replay:
+            return self.replay.pop(stage)
+        usage = current_usage()
+        if settings.max_run_tokens is not None and usage is not None and usage.total_tokens >= settings.max_run_tokens:
+            raise _TokenBudgetExceeded
+        output = yield ("agent", stage, restart)
+        self.iterations[stage] = self.iterations.get(stage, 0) + 1
+        previous = self.outputs.get(stage)
+        self.outputs[stage] = (previous[1] if previous else None, _output_text(output))
+        return output
+
+    def memoizable(self, stage: str, restart: bool = False) -> bool:
+        """
+        Whether a stored output may stand in for this run of ``stage``: only its first, plain run
+
+        Retries, callbacks and restarts ask for a different answer to the same inputs.
+        """
+        return not restart and not self.iterations.get(stage)
+
+    def allow_loop(self, requester: str, stage: str) -> bool:
+        limit = settings.stage_iteration_limits.get(stage, settings.max_stage_iterations)
+        if self.iterations.get(stage, 0) >= limit:
+            self.stop_reason = "max_iterations"
+        elif self._converged(requester):
+            self.stop_reason = "converged"
+        else:
+            return True
+        count(f"loop_guard_{self.stop_reason}")
+        return False
+
+    def _converged(self, stage: str) -> bool:
+        threshold = settings.convergence_threshold
+        previous, latest = self.outputs.get(stage, (None, ""))
+        if threshold is None or previous is None:
+            return False
+        matcher = difflib.SequenceMatcher(None, previous, latest, autojunk=False)
+        # quick_ratio() is a cheap upper bound on ratio().
+        return matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+
+def _output_text(output: Any) -> str:
+    if is_dataclass(output):
+        return "\n".join(str(value) for value in asdict(output).values())
+    return str(output)
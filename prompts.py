@@ -1,4 +1,7 @@
-﻿DISCOVERY_PROMPT = """You are the Discovery Agent, the first component in the U2Facilitator framework. Your role is to systematically deconstruct problems, identify baseline solutions, and uncover critical blind spots that may lead to Unknown Unknowns.
+﻿import hashlib
+from string import Formatter
+
+DISCOVERY_PROMPT = """You are the Discovery Agent, the first component in the U2Facilitator framework. Your role is to systematically deconstruct problems, identify baseline solutions, and uncover critical blind spots that may lead to Unknown Unknowns.
 
 COGNITIVE MISSION:
 Simulate expert problem analysis by thoroughly examining the problem space, proposing initial solutions, and critically evaluating their limitations.
@@ -471,4 +474,53 @@ Now proceed with your integration and synthesis."""
 
 
 def format_prompt(template: str, **kwargs) -> str:
-    return template.format(**kwargs)
+    return template.format(**kwargs)
+
+
+class PromptTemplate:
+    """
+    A stage prompt compiled into a static system prefix and a variable input block
+
+    The input block (the "Input:" heading and the lines holding placeholders) moves to a
+    user message, so every call for a stage starts with a byte-identical system message
+    that providers can serve from their prompt cache.
+    """
+
+    def __init__(self, name: str, template: str):
+        self.name = name
+        self.template = template
+        lines = template.splitlines(keepends=True)
+        variable = [i for i, line in enumerate(lines) if any(field for _, field, _, _ in Formatter().parse(line))]
+        if not variable:
+            self.prefix, self.suffix = template, ""
+        else:
+            first, last = variable[0], variable[-1]
+            if first > 0 and lines[first - 1].rstrip().endswith(":"):
+                first -= 1
+            heading = lines[first].rstrip().rstrip(":")
+            self.prefix = "".join(
+                lines[:first] + [f"{heading}: provided in the user message.\n"] + lines[last + 1:]
+            )
+            self.suffix = "".join(lines[first:last + 1]).rstrip("\n")
+        self.fields = tuple(field for _, field, _, _ in Formatter().parse(self.suffix) if field)
+        self.prefix_hash = hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()[:16]
+
+    def render(self, **kwargs) -> str:
+        return self.suffix.format(**kwargs)
+
+    def build_messages(self, **kwargs) -> list[dict[str, str]]:
+        """Chat messages for this stage: the cached static prefix, then the rendered inputs."""
+        return [{"role": "system", "content": self.prefix}, {"role": "user", "content": self.render(**kwargs)}]
+
+
+TEMPLATES = {
+    "discovery": PromptTemplate("discovery", DISCOVERY_PROMPT),
+    "exploration": PromptTemplate("exploration", EXPLORATION_PROMPT),
+    "integration": PromptTemplate("integration", INTEGRATION_PROMPT),
+}
+# Prefix text -> hash, so a client can recognize a compiled prefix with one dict lookup.
+PREFIX_HASHES = {template.prefix: template.prefix_hash for template in TEMPLATES.values()}
+
+
+def build_messages(stage: str, **kwargs) -> list[dict[str, str]]:
+    return TEMPLATES[stage].build_messages(**kwargs)
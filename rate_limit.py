@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Callable, Mapping
+
+from .settings import settings
+from .tracing import count
+
+# Exponential backoff cap for errors that carry no Retry-After hint.
+_BACKOFF_MAX = 10.0
+_BUCKETS = ("requests", "tokens")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+"""
+
+
+class CircuitOpenError(RuntimeError):
+    """A call refused without reaching the provider, because its recent calls kept failing"""
+
+    def __init__(self, key: str, retry_in: float):
+        super().__init__(f"Circuit for {key} is open; next attempt in {retry_in:.1f}s")
+        self.key = key
+        self.retry_in = retry_in
+
+
+class MemoryBucketStore:
+    """Rate limit state of one process."""
+
+    def __init__(self):
+        self._states: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def update(self, key: str, function: Callable[[dict[str, float]], Any]) -> Any:
+        """Apply ``function`` to the state of ``key`` in place, atomically, and return its result."""
+        with self._lock:
+            return function(self._states.setdefault(key, {}))
+
+
+class SQLiteBucketStore:
+    """Rate limit state in a SQLite file, shared by every process that points at it."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def update(self, key: str, function: Callable[[dict[str, float]], Any]) -> Any:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so concurrent processes serialize here.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT state FROM buckets WHERE key = ?", (key,)).fetchone()
+                state = json.loads(row[0]) if row else {}
+                result = function(state)
+                self._conn.execute("INSERT OR REPLACE INTO buckets (key, state) VALUES (?, ?)", (key, json.dumps(state)))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    """
+    Token buckets of requests and tokens per minute, per provider and model
+
+    Each bucket holds ``utilization`` of the quota and refills continuously, so throughput
+    stays just under the limit instead of bursting into 429s. Quotas are configured
+    (``requests_per_minute``, ``tokens_per_minute``) and learned from the provider's
+    ``x-ratelimit-limit-*`` headers, the lower one winning; ``x-ratelimit-remaining-*``
+    drains a bucket that the provider reports emptier than we think, e.g. because other
+    clients share the quota. A Retry-After pauses the key for everyone. With a
+    SQLiteBucketStore every process sharing the file draws from the same buckets.
+    """
+
+    def __init__(
+        self,
+        store: MemoryBucketStore | SQLiteBucketStore | None = None,
+        *,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        utilization: float = 0.95,
+    ):
+        self.store = store or MemoryBucketStore()
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.utilization = utilization
+
+    def reserve(self, key: str, requests: int = 1, tokens: int = 0) -> float:
+        """Take ``requests`` and ``tokens`` from the buckets of ``key`` and return the seconds to wait before sending."""
+        amounts = {"requests": requests, "tokens": tokens}
+
+        def take(state: dict[str, float]) -> float:
+            now = self._refill(state)
+            wait = max(state.get("blocked_until", 0.0) - now, 0.0)
+            for bucket in _BUCKETS:
+                capacity = self._capacity(state, bucket)
+                if capacity is None or not amounts[bucket]:
+                    continue
+                # A request larger than the bucket waits for a full one rather than forever.
+                state[bucket] -= min(amounts[bucket], capacity)
+                if state[bucket] < 0:
+                    wait = max(wait, -state[bucket] * 60 / capacity)
+            return wait
+
+        return self.store.update(key, take)
+
+    def observe(self, key: str, headers: Mapping[str, str]) -> None:
+        """Adapt the buckets of ``key`` to the rate limit headers of a provider response."""
+        limits = {bucket: _number(headers.get(f"x-ratelimit-limit-{bucket}")) for bucket in _BUCKETS}
+        remaining = {bucket: _number(headers.get(f"x-ratelimit-remaining-{bucket}")) for bucket in _BUCKETS}
+        if not any(limits.values()) and all(value is None for value in remaining.values()):
+            return
+
+        def adapt(state: dict[str, float]) -> None:
+            self._refill(state)
+            for bucket in _BUCKETS:
+                if limits[bucket]:
+                    state[f"{bucket}_limit"] = limits[bucket]
+                    self._refill(state)
+                capacity = self._capacity(state, bucket)
+                if capacity is not None and remaining[bucket] is not None:
+                    headroom = capacity / self.utilization - capacity
+                    state[bucket] = min(state[bucket], remaining[bucket] - headroom)
+
+        self.store.update(key, adapt)
+
+    def defer(self, key: str, seconds: float) -> None:
+        """Hold every request for ``key`` back for ``seconds``, e.g. a provider's Retry-After."""
+
+        def block(state: dict[str, float]) -> None:
+            state["blocked_until"] = max(state.get("blocked_until", 0.0), time.time() + seconds)
+
+        self.store.update(key, block)
+
+    def _capacity(self, state: dict[str, float], bucket: str) -> float | None:
+        known = [limit for limit in (self.limits[bucket], state.get(f"{bucket}_limit")) if limit]
+        return min(known) * self.utilization if known else None
+
+    def _refill(self, state: dict[str, float]) -> float:
+        # Wall-clock time, as the state may be shared with other processes.
+        now = time.time()
+        elapsed = max(now - state.get("updated", now), 0.0)
+        for bucket in _BUCKETS:
+            capacity = self._capacity(state, bucket)
+            if capacity is None:
+                state.pop(bucket, None)
+            else:
+                state[bucket] = min(state.get(bucket, capacity) + elapsed * capacity / 60, capacity)
+        state["updated"] = now
+        return now
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider after ``threshold`` consecutive outage errors
+
+    Outages are connection errors, timeouts and 5xx responses; rate limiting and request
+    errors say nothing about the provider's health. An open circuit raises CircuitOpenError
+    until ``reset_seconds`` have passed, then lets a single probe call through: its success
+    closes the circuit and its failure opens it again. A probe that is cancelled instead
+    must be release()d, so that the next call probes.
+    """
+
+    def __init__(self, threshold: int = 5, reset_seconds: float = 30.0):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._failures: dict[str, int] = {}
+        self._opened: dict[str, float] = {}
+        self._probing: set[str] = set()
+        self._lock = threading.Lock()
+
+    def check(self, key: str) -> None:
+        """Raise CircuitOpenError unless a call to ``key`` may go ahead."""
+        with self._lock:
+            opened = self._opened.get(key)
+            if opened is None:
+                return
+            retry_in = opened + self.reset_seconds - time.monotonic()
+            if retry_in > 0 or key in self._probing:
+                raise CircuitOpenError(key, max(retry_in, 0.0))
+            self._probing.add(key)
+
+    def release(self, key: str) -> None:
+        """Forget a call to ``key`` that check() let through but that ended without an outcome, e.g. cancelled."""
+        with self._lock:
+            self._probing.discard(key)
+
+    def record(self, key: str, error: BaseException | None = None) -> None:
+        """Record the outcome of a call to ``key`` that check() let through."""
+        with self._lock:
+            probing = key in self._probing
+            self._probing.discard(key)
+            if error is None or not is_outage(error):
+                self._failures.pop(key, None)
+                self._opened.pop(key, None)
+                return
+            self._failures[key] = self._failures.get(key, 0) + 1
+            if probing or self._failures[key] >= self.threshold:
+                if key not in self._opened or probing:
+                    count("circuit_opens")
+                self._opened[key] = time.monotonic()
+
+
+def status_code(error: BaseException) -> int | None:
+    return getattr(error, "status_code", None)
+
+
+def is_transport_error(error: BaseException) -> bool:
+    """Whether ``error`` is a timeout or connection failure, i.e. the provider never answered."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    import httpx
+    import openai
+
+    return isinstance(error, (httpx.TransportError, openai.APIConnectionError))
+
+
+def is_outage(error: BaseException) -> bool:
+    """Whether ``error`` suggests the provider is down: a transport error or a 5xx."""
+    if not isinstance(error, Exception) or isinstance(error, CircuitOpenError):
+        return False
+    status = status_code(error)
+    return is_transport_error(error) if status is None else status >= 500
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failed call may succeed if repeated
+
+    Rate limiting (except an exhausted quota), timeouts, conflicts, 5xx and transport errors
+    are retried. Other 4xx responses are the request's fault, an open circuit fails fast, and
+    anything else (a local bug, or cancellation, which is not an Exception) is raised as is.
+    """
+    if not isinstance(error, Exception) or isinstance(error, CircuitOpenError):
+        return False
+    status = status_code(error)
+    if status is None:
+        return is_transport_error(error)
+    if status == 429:
+        return getattr(error, "code", None) != "insufficient_quota"
+    return status in (408, 409) or status >= 500
+
+
+def error_headers(error: BaseException) -> Mapping[str, str]:
+    return getattr(getattr(error, "response", None), "headers", None) or {}
+
+
+def retry_after(error: BaseException) -> float | None:
+    """Seconds the provider asked us to wait before retrying (Retry-After or retry-after-ms), if it did."""
+    headers = error_headers(error)
+    milliseconds = _number(headers.get("retry-after-ms"))
+    if milliseconds is not None:
+        return milliseconds / 1000
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    seconds = _number(value)
+    if seconds is None:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return max(seconds, 0.0)
+
+
+def retry_wait(retry_state: Any) -> float:
+    """tenacity ``wait``: the provider's Retry-After when given, else full-jitter exponential backoff."""
+    hinted = retry_after(retry_state.outcome.exception())
+    if hinted is not None:
+        return min(hinted, settings.retry_max_wait)
+    return random.uniform(0, min(2 ** retry_state.attempt_number, _BACKOFF_MAX))
+
+
+def _number(value: Any) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+_limiter: RateLimiter | None = None
+_breaker: CircuitBreaker | None = None
+_shared_lock = threading.Lock()
+
+
+def default_limiter() -> RateLimiter:
+    """Process-wide limiter over ``U2_RATE_LIMIT_RPM``/``U2_RATE_LIMIT_TPM``, shared through ``U2_RATE_LIMIT_PATH`` if set."""
+    global _limiter
+    with _shared_lock:
+        if _limiter is None:
+            store = SQLiteBucketStore(Path(settings.rate_limit_path).expanduser()) if settings.rate_limit_path else None
+            _limiter = RateLimiter(
+                store,
+                requests_per_minute=settings.rate_limit_rpm,
+                tokens_per_minute=settings.rate_limit_tpm,
+                utilization=settings.rate_limit_utilization,
+            )
+        return _limiter
+
+
+def default_breaker() -> CircuitBreaker:
+    global _breaker
+    with _shared_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(settings.circuit_failure_threshold, settings.circuit_reset_seconds)
+        return _breaker
@@ -0,0 +1,395 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import inspect
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Iterator
+
+from .rate_limit import CircuitBreaker, RateLimiter, default_breaker, default_limiter, error_headers, retry_after
+from .settings import settings
+from .tokens import count_message_tokens
+from .tracing import annotate, count
+
+
+@dataclass
+class Provider:
+    """
+    One OpenAI-compatible endpoint
+
+    ``model`` None means the model of the call; ``base_url`` None is the OpenAI API
+    (set it to e.g. ``http://localhost:8000/v1`` for a local server) and ``api_key`` None
+    is the calling client's key. A set ``model`` wins over the model a call asks for,
+    including per-stage and draft models, since the endpoint may serve no other one.
+    """
+
+    name: str
+    model: str | None = None
+    base_url: str | None = None
+    api_key: str | None = None
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies per provider, shared by every Router"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: str, q: float, min_samples: int) -> float | None:
+        """The ``q``-th percentile latency of ``key``, or None with fewer than ``min_samples`` samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(int(q / 100 * len(samples)), len(samples) - 1)]
+
+
+_tracker = LatencyTracker()
+_hedge_executor: ThreadPoolExecutor | None = None
+_shared_lock = threading.Lock()
+
+
+def _shared_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _shared_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=settings.max_in_flight, thread_name_prefix="u2-hedge")
+        return _hedge_executor
+
+
+class Router:
+    """
+    Sends each chat completion request to the first provider that answers
+
+    Providers are tried in order, failing over on any error. With ``hedge_percentile`` set, a
+    request still outstanding after that percentile of the provider's recent latency is
+    duplicated to the next provider (or the same one, if it is the last) and the first answer
+    wins. Errors are only raised once every provider has failed.
+
+    Every call to a provider first waits for its model's share of ``limiter`` and is refused
+    by ``breaker`` while that provider is down, which fails over to the next one.
+    """
+
+    def __init__(
+        self,
+        providers: list[Provider],
+        *,
+        hedge_percentile: float | None = None,
+        hedge_min_samples: int = 20,
+        tracker: LatencyTracker | None = None,
+        limiter: RateLimiter | None = None,
+        breaker: CircuitBreaker | None = None,
+    ):
+        if not providers:
+            raise ValueError("Router needs at least one provider")
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.tracker = tracker or _tracker
+        self.limiter = limiter or default_limiter()
+        self.breaker = breaker or default_breaker()
+
+    @property
+    def default_model(self) -> str | None:
+        return self.providers[0].model
+
+    def resolve_model(self, model: str) -> str:
+        """The model a call asking for ``model`` is answered by when the first provider is up."""
+        return self.providers[0].model or model
+
+    def create(self, client_for: Callable[[Provider], Any], *, model: str, **request: Any) -> tuple[Any, str]:
+        """
+        ``client.chat.completions.create(**request)`` on the first provider that succeeds
+
+        Returns the response and the model that produced it, which after a failover or a won
+        hedge may not be ``model``; callers cache and bill the response under that model.
+        """
+        error: Exception | None = None
+        for index in range(len(self.providers)):
+            if error is not None:
+                count("llm_failovers")
+            try:
+                response, provider = self._hedged(client_for, index, model, request)
+            except Exception as exc:
+                error = exc
+            else:
+                return response, _answered(provider, model)
+        raise error
+
+    async def acreate(
+        self, client_for: Callable[[Provider], Any], *, model: str, **request: Any
+    ) -> tuple[Any, str]:
+        error: Exception | None = None
+        for index in range(len(self.providers)):
+            if error is not None:
+                count("llm_failovers")
+            try:
+                response, provider = await self._ahedged(client_for, index, model, request)
+            except Exception as exc:
+                error = exc
+            else:
+                return response, _answered(provider, model)
+        raise error
+
+    def _hedge_delay(self, provider: Provider, request: dict[str, Any]) -> float | None:
+        if self.hedge_percentile is None:
+            return None
+        return self.tracker.percentile(_latency_key(provider, request), self.hedge_percentile, self.hedge_min_samples)
+
+    def _hedge_target(self, index: int) -> Provider:
+        return self.providers[min(index + 1, len(self.providers) - 1)]
+
+    def _admit(self, key: str, model: str, request: dict[str, Any]) -> float:
+        """Check the circuit of ``key`` and reserve its rate limit, returning the seconds to wait."""
+        self.breaker.check(key)
+        try:
+            tokens = count_message_tokens(request["messages"], model) + (request.get("max_tokens") or 0)
+            delay = self.limiter.reserve(key, tokens=tokens)
+        except BaseException:
+            self.breaker.release(key)
+            raise
+        if delay > 0:
+            count("rate_limit_waits")
+            annotate(rate_limit_wait_ms=round(delay * 1000, 3))
+        return delay
+
+    def _settle(self, key: str, request: dict[str, Any], response: Any, headers: Any) -> Any:
+        """Record a successful call and return its response, charging completion tokens not reserved up front."""
+        self.breaker.record(key)
+        self.limiter.observe(key, headers)
+        if request.get("max_tokens"):
+            return response
+
+        def charge(tokens: int) -> None:
+            self.limiter.reserve(key, requests=0, tokens=tokens)
+
+        if request.get("stream"):
+            # A stream reports its usage in its final chunk (requested with include_usage).
+            return _MeteredStream(response, charge)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            charge(usage.completion_tokens)
+        return response
+
+    def _failed(self, key: str, error: Exception) -> None:
+        self.breaker.record(key, error)
+        self.limiter.observe(key, error_headers(error))
+        wait = retry_after(error)
+        if wait:
+            self.limiter.defer(key, wait)
+
+    def _call(self, client_for: Callable[[Provider], Any], provider: Provider, model: str, request: dict[str, Any]) -> Any:
+        model = provider.model or model
+        key = f"{provider.name}:{model}"
+        delay = self._admit(key, model, request)
+        try:
+            if delay > 0:
+                time.sleep(delay)
+            started = time.perf_counter()
+            response, headers = _create(client_for(provider).chat.completions, model=model, **request)
+        except Exception as exc:
+            self._failed(key, exc)
+            raise
+        except BaseException:
+            self.breaker.release(key)
+            raise
+        self.tracker.observe(_latency_key(provider, request), time.perf_counter() - started)
+        return self._settle(key, request, response, headers)
+
+    def _hedged(
+        self, client_for: Callable[[Provider], Any], index: int, model: str, request: dict[str, Any]
+    ) -> tuple[Any, Provider]:
+        """The response of provider ``index``, or of its hedge, and the provider that gave it."""
+        provider = self.providers[index]
+        delay = self._hedge_delay(provider, request)
+        if delay is None:
+            response = self._call(client_for, provider, model, request)
+            annotate(provider=provider.name)
+            return response, provider
+
+        executor = _shared_hedge_executor()
+        primary = executor.submit(contextvars.copy_context().run, self._call, client_for, provider, model, request)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            annotate(provider=provider.name)
+            return primary.result(), provider
+
+        backup = self._hedge_target(index)
+        count("llm_hedges")
+        hedge = executor.submit(contextvars.copy_context().run, self._call, client_for, backup, model, request)
+        futures = {primary: provider, hedge: backup}
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        first = done.pop()
+        if first.exception() is not None:
+            first, other = (hedge, primary) if first is primary else (primary, hedge)
+            # Raises the other request's error too when both failed.
+            first.result()
+        else:
+            other = hedge if first is primary else primary
+        other.add_done_callback(_discard)
+        annotate(provider=futures[first].name, hedged=True)
+        return first.result(), futures[first]
+
+    async def _acall(
+        self, client_for: Callable[[Provider], Any], provider: Provider, model: str, request: dict[str, Any]
+    ) -> Any:
+        model = provider.model or model
+        key = f"{provider.name}:{model}"
+        delay = self._admit(key, model, request)
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = time.perf_counter()
+            response, headers = await _acreate(client_for(provider).chat.completions, model=model, **request)
+        except Exception as exc:
+            self._failed(key, exc)
+            raise
+        except BaseException:
+            # Cancelled, e.g. the losing hedge: no outcome, but a half-open probe must be freed.
+            self.breaker.release(key)
+            raise
+        self.tracker.observe(_latency_key(provider, request), time.perf_counter() - started)
+        return self._settle(key, request, response, headers)
+
+    async def _ahedged(
+        self, client_for: Callable[[Provider], Any], index: int, model: str, request: dict[str, Any]
+    ) -> tuple[Any, Provider]:
+        provider = self.providers[index]
+        delay = self._hedge_delay(provider, request)
+        if delay is None:
+            response = await self._acall(client_for, provider, model, request)
+            annotate(provider=provider.name)
+            return response, provider
+
+        primary = asyncio.ensure_future(self._acall(client_for, provider, model, request))
+        tasks = {primary: provider}
+        winner = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                winner = primary
+                annotate(provider=provider.name)
+                return primary.result(), provider
+
+            backup = self._hedge_target(index)
+            count("llm_hedges")
+            hedge = asyncio.ensure_future(self._acall(client_for, backup, model, request))
+            tasks[hedge] = backup
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            first = done.pop()
+            other = hedge if first is primary else primary
+            if first.exception() is not None:
+                first, other = other, first
+                try:
+                    await first
+                except Exception as exc:
+                    raise other.exception() from exc
+            winner = first
+            annotate(provider=tasks[first].name, hedged=True)
+            return first.result(), tasks[first]
+        finally:
+            # The losing call, or every call when the caller is cancelled, must not keep running.
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+                    task.add_done_callback(_adiscard)
+
+
+class _MeteredStream:
+    """A streamed response passing the completion tokens of its usage chunk to ``charge``"""
+
+    def __init__(self, stream: Any, charge: Callable[[int], None]):
+        self._stream = stream
+        self._charge = charge
+
+    def __iter__(self) -> Iterator[Any]:
+        for chunk in self._stream:
+            self._observe(chunk)
+            yield chunk
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        async for chunk in self._stream:
+            self._observe(chunk)
+            yield chunk
+
+    def _observe(self, chunk: Any) -> None:
+        usage = getattr(chunk, "usage", None)
+        if usage is not None:
+            self._charge(usage.completion_tokens)
+
+    def close(self) -> Any:
+        return self._stream.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+def _create(completions: Any, **request: Any) -> tuple[Any, Any]:
+    """``completions.create(**request)`` and the response headers, when the client exposes them."""
+    raw = getattr(completions, "with_raw_response", None)
+    if raw is None:
+        return completions.create(**request), {}
+    response = raw.create(**request)
+    return response.parse(), response.headers
+
+
+async def _acreate(completions: Any, **request: Any) -> tuple[Any, Any]:
+    raw = getattr(completions, "with_raw_response", None)
+    if raw is None:
+        return await completions.create(**request), {}
+    response = await raw.create(**request)
+    return response.parse(), response.headers
+
+
+def _answered(provider: Provider, model: str) -> str:
+    answered = provider.model or model
+    annotate(model=answered)
+    return answered
+
+
+def _latency_key(provider: Provider, request: dict[str, Any]) -> str:
+    return f"{provider.name}:{'stream' if request.get('stream') else 'complete'}"
+
+
+def _discard(future: Future) -> None:
+    """Close the losing response of a hedged request (e.g. an open stream) once it arrives."""
+    if not future.cancelled() and future.exception() is None:
+        close = getattr(future.result(), "close", None)
+        if close is not None:
+            close()
+
+
+def _adiscard(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is None:
+        close = getattr(task.result(), "close", None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+
+
+_default_router: Router | None = None
+
+
+def default_router() -> Router:
+    """Process-wide router over ``U2_PROVIDERS`` (by default, the OpenAI API alone)."""
+    global _default_router
+    with _shared_lock:
+        if _default_router is None:
+            providers = [Provider(**entry) for entry in settings.providers] or [Provider("openai")]
+            _default_router = Router(
+                providers,
+                hedge_percentile=settings.hedge_percentile,
+                hedge_min_samples=settings.hedge_min_samples,
+            )
+        return _default_router
@@ -1,45 +1,138 @@
 ﻿from __future__ import annotations
 
-import json
-import urllib.parse
-import urllib.request
+import contextvars
+import re
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Iterable
+from typing import TYPE_CHECKING, Iterable
 
+from .cache import MemoryTTLCache
 from .settings import settings
+from .tracing import annotate, span
 
+if TYPE_CHECKING:
+    import httpx
 
-@dataclass
+_SEARCH_TRIGGER = re.compile(r"Search needed for:?\s*(.+)", re.IGNORECASE)
+
+_caches: _SearchCaches | None = None
+_http_client: httpx.Client | None = None
+_executor: ThreadPoolExecutor | None = None
+_shared_lock = threading.Lock()
+
+
+class _SearchCaches:
+    def __init__(self):
+        # Shared by every SearchAugmentor in the process so repeated queries across runs are free.
+        self.results = MemoryTTLCache(settings.search_cache_size, ttl=settings.search_cache_ttl)
+        # Equal results (and their renderings) are stored once, however many runs and queries return them.
+        self.interned = MemoryTTLCache(settings.search_cache_size * 4)
+        self.rendered = MemoryTTLCache(settings.search_cache_size)
+
+
+def _shared_caches() -> _SearchCaches:
+    global _caches
+    with _shared_lock:
+        if _caches is None:
+            _caches = _SearchCaches()
+        return _caches
+
+
+def _shared_http_client() -> httpx.Client:
+    global _http_client
+    with _shared_lock:
+        if _http_client is None:
+            import httpx
+
+            _http_client = httpx.Client(
+                timeout=settings.search_timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.search_concurrency,
+                    max_keepalive_connections=settings.search_concurrency,
+                ),
+            )
+        return _http_client
+
+
+def _shared_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _shared_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.search_concurrency, thread_name_prefix="u2-search")
+        return _executor
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+def search_triggers(text: str) -> list[str]:
+    """Extract the queries of every "Search needed for: ..." trigger in an agent response."""
+    queries: list[str] = []
+    for match in _SEARCH_TRIGGER.finditer(text):
+        query = match.group(1).replace("[", "").replace("]", "").strip(" \"'.")
+        if query and query not in queries:
+            queries.append(query)
+    return queries
+
+
+@dataclass(frozen=True, slots=True)
 class SearchResult:
     title: str
     link: str
     snippet: str
 
 
-class SearchAugmentor:
-    def __init__(self):
-        self.api_key = settings.search_api_key
-        self.engine_id = settings.search_engine_id
+def intern_result(result: SearchResult) -> SearchResult:
+    """The process-wide instance equal to ``result``."""
+    interned = _shared_caches().interned
+    shared = interned.get(result)
+    if shared is None:
+        interned.put(result, result)
+        return result
+    return shared
+
 
+class SearchBackend(ABC):
+    """Source of search results used by SearchAugmentor"""
+
+    name = "backend"
+    # Whether results may be served from the shared in-process cache.
+    cacheable = True
+
+    @abstractmethod
     def enabled(self) -> bool:
-        return bool(self.api_key and self.engine_id)
+        ...
+
+    @abstractmethod
+    def search(self, query: str, max_results: int) -> list[SearchResult]:
+        ...
 
-    def search(self, query: str, *, max_results: int = 3) -> list[SearchResult]:
-        if not self.enabled():
-            return []
 
-        base = "https://www.googleapis.com/customsearch/v1"
-        params = urllib.parse.urlencode(
-            {
+class GoogleSearchBackend(SearchBackend):
+    name = "google"
+
+    def __init__(self, api_key: str | None = None, engine_id: str | None = None):
+        self.api_key = api_key or settings.search_api_key
+        self.engine_id = engine_id or settings.search_engine_id
+
+    def enabled(self) -> bool:
+        return bool(self.api_key and self.engine_id)
+
+    def search(self, query: str, max_results: int) -> list[SearchResult]:
+        response = _shared_http_client().get(
+            "https://www.googleapis.com/customsearch/v1",
+            params={
                 "key": self.api_key,
                 "cx": self.engine_id,
                 "q": query,
                 "num": max_results,
-            }
+            },
         )
-
-        with urllib.request.urlopen(f"{base}?{params}", timeout=10) as response:
-            payload = json.loads(response.read())
+        response.raise_for_status()
+        payload = response.json()
 
         items = payload.get("items", [])
         results: list[SearchResult] = []
@@ -53,7 +146,80 @@ class SearchAugmentor:
             )
         return results
 
+
+_default_backend: SearchBackend | None = None
+
+
+def default_backend() -> SearchBackend:
+    """Process-wide backend selected by ``U2_SEARCH_BACKEND`` ('google' or 'local')."""
+    global _default_backend
+    with _shared_lock:
+        if _default_backend is None:
+            if settings.search_backend == "local":
+                from .local_search import LocalSearchBackend  # imports this module
+
+                _default_backend = LocalSearchBackend(settings.local_index_path, settings.local_corpus)
+            elif settings.search_backend == "google":
+                _default_backend = GoogleSearchBackend()
+            else:
+                raise ValueError(f"Unknown search backend: {settings.search_backend!r}")
+        return _default_backend
+
+
+class SearchAugmentor:
+    def __init__(self, backend: SearchBackend | None = None):
+        self.backend = backend or default_backend()
+
+    def enabled(self) -> bool:
+        return self.backend.enabled()
+
+    def search(self, query: str, *, max_results: int = 3) -> list[SearchResult]:
+        if not self.enabled():
+            return []
+        with span("search", backend=self.backend.name):
+            if not self.backend.cacheable:
+                return self._fetch(query, max_results)
+
+            key = (self.backend.name, normalize_query(query), max_results)
+            cached = _shared_caches().results.get(key)
+            annotate(cached=cached is not None)
+            if cached is not None:
+                return list(cached)
+
+            results = self._fetch(query, max_results)
+        _shared_caches().results.put(key, tuple(results))
+        return results
+
+    def _fetch(self, query: str, max_results: int) -> list[SearchResult]:
+        results = [intern_result(result) for result in self.backend.search(query, max_results)]
+        annotate(results=len(results))
+        return results
+
+    def search_many(self, queries: Iterable[str], *, max_results: int = 3) -> list[list[SearchResult]]:
+        """Run ``queries`` concurrently over the shared connection pool, returning results in query order."""
+        queries = list(queries)
+        if not self.enabled() or not queries:
+            return [[] for _ in queries]
+        futures = {}
+        for query in queries:
+            key = normalize_query(query)
+            if key not in futures:
+                # Carry the run's usage and tracing context into the worker thread.
+                context = contextvars.copy_context()
+                futures[key] = _shared_executor().submit(context.run, self.search, query, max_results=max_results)
+        return [list(futures[normalize_query(query)].result()) for query in queries]
+
     def render_results(self, results: Iterable[SearchResult]) -> str:
+        results = tuple(results)
+        cache = _shared_caches().rendered
+        rendered = cache.get(results)
+        if rendered is None:
+            rendered = self._render(results)
+            cache.put(results, rendered)
+        return rendered
+
+    @staticmethod
+    def _render(results: tuple[SearchResult, ...]) -> str:
         lines: list[str] = []
         for index, result in enumerate(results, start=1):
             lines.append(
@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import json
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, is_dataclass
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+
+from .checkpoint import CheckpointStore, MemoryCheckpointStore
+from .events import StageEvent
+from .llm_client import aclose_pool
+from .settings import settings
+
+if TYPE_CHECKING:
+    from .orchestrator import Orchestrator
+
+_TERMINAL_EVENTS = ("run_finished", "job_failed")
+_MAX_BODY = 1 << 20
+_MAX_HEADERS = 100
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Job:
+    """
+    One story submitted to a JobService
+
+    status is 'queued', 'running', 'awaiting_feedback', 'done' or 'failed'. ``events`` keeps
+    every StageEvent except token deltas, which only reach live subscribers. A job awaiting
+    feedback is parked under ``resume_token`` (since ``parked``) and is queued again with
+    ``feedback`` once it is answered or its ``expiry`` timer fires.
+    """
+
+    id: str
+    record: dict[str, Any]
+    interactive: bool = False
+    status: str = "queued"
+    stage: str | None = None
+    result: dict[str, Any] | None = None
+    error: str | None = None
+    pending_feedback: dict[str, Any] | None = None
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    events: list[dict[str, Any]] = field(default_factory=list)
+    subscribers: list[asyncio.Queue] = field(default_factory=list)
+    resume_token: str | None = None
+    parked: float | None = None
+    feedback: dict[str, Any] | None = None
+    expiry: asyncio.TimerHandle | None = None
+
+    def status_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "interactive": self.interactive,
+            "error": self.error,
+            "pending_feedback": self.pending_feedback,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobService:
+    """
+    Runs submitted stories on ``workers`` concurrent Orchestrator.arun() calls in one process
+
+    Every run shares the process's async connection pool, response cache and warm settings.
+    Interactive jobs run on a copy of ``orchestrator`` that suspends them into the checkpoint
+    store (in memory when none is given) at each feedback point, so a job waiting for feedback
+    holds no worker. Posted feedback queues the job again to resume; after
+    ``U2_FEEDBACK_TIMEOUT`` seconds it resumes with ``U2_FEEDBACK_DEFAULT_ACTION`` instead.
+    At most ``U2_SERVICE_MAX_JOBS`` jobs are kept: finished ones are forgotten first, then
+    the ones parked longest, which fail so their event streams end.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int = 4,
+        checkpoint_store: CheckpointStore | None = None,
+        orchestrator: Orchestrator | None = None,
+    ):
+        if orchestrator is None:
+            from .orchestrator import Orchestrator
+
+            orchestrator = Orchestrator(checkpoint_store=checkpoint_store)
+        self.orchestrator = orchestrator
+        self.interactive_orchestrator = copy.copy(orchestrator)
+        self.interactive_orchestrator.interactive = True
+        self.interactive_orchestrator.suspend_on_feedback = True
+        self.interactive_orchestrator.human_feedback_callback = None
+        # Parked runs of forgotten jobs are dropped from a store the service made itself.
+        self._parking: MemoryCheckpointStore | None = None
+        if orchestrator.checkpoint_store is None:
+            self._parking = self.interactive_orchestrator.checkpoint_store = MemoryCheckpointStore()
+        self.workers = workers
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self._queue: asyncio.Queue[Job] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"u2-job-worker-{i}") for i in range(self.workers)]
+
+    async def close(self) -> None:
+        for job in self.jobs.values():
+            if job.expiry is not None:
+                job.expiry.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await aclose_pool()
+
+    def submit(self, record: dict[str, Any]) -> Job:
+        """Queue a story (``enabler_story``, ``potential_fix``, optional ``human_preferences``, ``id``, ``interactive``)."""
+        for name in ("enabler_story", "potential_fix"):
+            if not isinstance(record.get(name), str) or not record[name].strip():
+                raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, f"missing {name}")
+        job_id = str(record.get("id") or uuid.uuid4().hex)
+        existing = self.jobs.get(job_id)
+        if existing is not None and existing.status not in ("done", "failed"):
+            raise HTTPError(HTTPStatus.CONFLICT, f"job {job_id} is already {existing.status}")
+        job = Job(job_id, record, interactive=bool(record.get("interactive")))
+        self.jobs.pop(job_id, None)
+        self.jobs[job_id] = job
+        self._evict()
+        self._queue.put_nowait(job)
+        return job
+
+    def job(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no job {job_id}")
+        return job
+
+    def give_feedback(self, job_id: str, reply: dict[str, Any]) -> Job:
+        """Answer the feedback point an interactive job is parked at and queue it to resume."""
+        from .orchestrator import feedback_reply
+
+        job = self.job(job_id)
+        if job.status != "awaiting_feedback":
+            raise HTTPError(HTTPStatus.CONFLICT, f"job {job_id} is not awaiting feedback")
+        try:
+            feedback = feedback_reply(reply)
+        except ValueError as exc:
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, str(exc)) from None
+        self._resume(job, feedback)
+        return job
+
+    def subscribe(self, job: Job) -> tuple[list[dict[str, Any]], asyncio.Queue | None]:
+        """The job's events so far and a queue of the following ones (None once the job has ended)."""
+        if job.status in ("done", "failed"):
+            return list(job.events), None
+        queue: asyncio.Queue = asyncio.Queue()
+        job.subscribers.append(queue)
+        return list(job.events), queue
+
+    def unsubscribe(self, job: Job, queue: asyncio.Queue | None) -> None:
+        if queue is not None and queue in job.subscribers:
+            job.subscribers.remove(queue)
+
+    def stats(self) -> dict[str, Any]:
+        counts: dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"status": "ok", "workers": self.workers, "jobs": counts}
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status, job.started = "running", job.started or time.time()
+            try:
+                result = await self._run(job)
+            except Exception as exc:
+                # Queued after the run's own events, which may still be in flight from worker threads.
+                self._loop.call_soon(self._end, job, None, f"{type(exc).__name__}: {exc}")
+            else:
+                if result.get("stop_reason") == "awaiting_feedback":
+                    self._loop.call_soon(self._suspend, job, result)
+                else:
+                    self._loop.call_soon(self._end, job, result, None)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> dict[str, Any]:
+        """Start ``job``, or resume it from its feedback point; returns a final or suspended result"""
+        def on_event(event: StageEvent) -> None:
+            self._loop.call_soon_threadsafe(self._emit, job, event)
+
+        if job.resume_token is not None:
+            token, feedback = job.resume_token, job.feedback
+            job.resume_token = job.feedback = None
+            return await self.interactive_orchestrator.aresume(token, feedback, on_event=on_event)
+        orchestrator = self.interactive_orchestrator if job.interactive else self.orchestrator
+        return await orchestrator.arun(
+            enabler_story=job.record["enabler_story"],
+            potential_fix=job.record["potential_fix"],
+            human_preferences=job.record.get("human_preferences"),
+            run_id=job.id if orchestrator.checkpoint_store is not None else None,
+            on_event=on_event,
+        )
+
+    def _suspend(self, job: Job, result: dict[str, Any]) -> None:
+        job.status, job.parked = "awaiting_feedback", time.time()
+        job.resume_token = result["resume_token"]
+        job.pending_feedback = result["pending_feedback"]
+        if settings.feedback_timeout is not None:
+            job.expiry = self._loop.call_later(settings.feedback_timeout, self._resume, job, None)
+
+    def _resume(self, job: Job, feedback: dict[str, Any] | None) -> None:
+        """Queue a parked job to continue with ``feedback`` (None: the default action)."""
+        if job.status != "awaiting_feedback":
+            return
+        if job.expiry is not None:
+            job.expiry.cancel()
+        job.status, job.feedback, job.pending_feedback, job.expiry = "queued", feedback, None, None
+        self._queue.put_nowait(job)
+
+    def _emit(self, job: Job, event: StageEvent) -> None:
+        data = {"kind": event.kind, "stage": event.stage, "data": _jsonable(event.data)}
+        if event.kind == "stage_started":
+            job.stage = event.stage
+        if event.kind != "token":
+            job.events.append(data)
+        for queue in job.subscribers:
+            queue.put_nowait(data)
+
+    def _end(self, job: Job, result: dict[str, Any] | None, error: str | None) -> None:
+        job.result, job.error, job.finished = result, error, time.time()
+        job.status = "failed" if error else "done"
+        if error:
+            self._emit(job, StageEvent("job_failed", job.stage or "", error))
+        job.subscribers.clear()
+
+    def _evict(self) -> None:
+        finished = [job for job in self.jobs.values() if job.status in ("done", "failed")]
+        parked = sorted(
+            (job for job in self.jobs.values() if job.status == "awaiting_feedback"), key=lambda job: job.parked
+        )
+        for job in finished + parked:
+            if len(self.jobs) <= settings.service_max_jobs:
+                break
+            if job.status == "awaiting_feedback":
+                if job.expiry is not None:
+                    job.expiry.cancel()
+                self._end(job, None, "evicted while awaiting feedback")
+            del self.jobs[job.id]
+            if self._parking is not None:
+                self._parking.delete(job.id)
+
+
+async def handle_connection(service: JobService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Serve one HTTP/1.1 request; every response closes the connection."""
+    try:
+        try:
+            method, path, body = await _read_request(reader)
+            if method == "GET" and path.endswith("/events"):
+                await _stream_events(service, service.job(_job_id(path, "/events")), writer)
+                return
+            status, payload = _route(service, method, path, body)
+        except HTTPError as exc:
+            status, payload = exc.status, {"error": str(exc)}
+        _write_response(writer, status, payload)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def _route(service: JobService, method: str, path: str, body: bytes) -> tuple[HTTPStatus, Any]:
+    if path == "/health" and method == "GET":
+        return HTTPStatus.OK, service.stats()
+    if path == "/jobs" and method == "POST":
+        job = service.submit(_json_body(body))
+        return HTTPStatus.ACCEPTED, job.status_dict()
+    if path.endswith("/feedback") and method == "POST":
+        return HTTPStatus.OK, service.give_feedback(_job_id(path, "/feedback"), _json_body(body)).status_dict()
+    if path.endswith("/result") and method == "GET":
+        job = service.job(_job_id(path, "/result"))
+        if job.status == "failed":
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"id": job.id, "error": job.error}
+        if job.status != "done":
+            return HTTPStatus.CONFLICT, job.status_dict()
+        return HTTPStatus.OK, job.result
+    if method == "GET" and path.startswith("/jobs/") and path.count("/") == 2:
+        return HTTPStatus.OK, service.job(path.removeprefix("/jobs/")).status_dict()
+    raise HTTPError(HTTPStatus.NOT_FOUND, f"no route for {method} {path}")
+
+
+async def _stream_events(service: JobService, job: Job, writer: asyncio.StreamWriter) -> None:
+    """Server-sent events: the job's past events, then live ones (token deltas included) until it ends."""
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n"
+    )
+    history, queue = service.subscribe(job)
+    try:
+        for event in history:
+            writer.write(_sse(event))
+        await writer.drain()
+        while queue is not None:
+            event = await queue.get()
+            writer.write(_sse(event))
+            await writer.drain()
+            if event["kind"] in _TERMINAL_EVENTS:
+                break
+    finally:
+        service.unsubscribe(job, queue)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> tuple[str, str, bytes]:
+    request_line = (await _read_line(reader, HTTPStatus.BAD_REQUEST)).split()
+    if len(request_line) != 3:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed request line")
+    headers: dict[str, str] = {}
+    while True:
+        line = await _read_line(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        if line in ("\r\n", "\n", ""):
+            break
+        if len(headers) >= _MAX_HEADERS:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "too many header fields")
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length_header = headers.get("content-length") or "0"
+    if not length_header.isascii() or not length_header.isdigit():
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"invalid Content-Length: {length_header!r}")
+    length = int(length_header)
+    if length > _MAX_BODY:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return request_line[0].upper(), urlsplit(request_line[1]).path.rstrip("/") or "/", body
+
+
+async def _read_line(reader: asyncio.StreamReader, too_long: HTTPStatus) -> str:
+    """One line of the request head; a line over the reader's limit is answered with ``too_long``."""
+    try:
+        line = await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        # readline() raises ValueError (from LimitOverrunError) once a line outgrows the buffer limit.
+        raise HTTPError(too_long, "request line or header field too long") from None
+    return line.decode("latin-1")
+
+
+def _json_body(body: bytes) -> dict[str, Any]:
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError as exc:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {exc}") from None
+    if not isinstance(data, dict):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "expected a JSON object")
+    return data
+
+
+def _job_id(path: str, suffix: str) -> str:
+    job_id = path.removeprefix("/jobs/").removesuffix(suffix)
+    if not path.startswith("/jobs/") or not job_id or "/" in job_id:
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"no route for {path}")
+    return job_id
+
+
+def _write_response(writer: asyncio.StreamWriter, status: HTTPStatus, payload: Any) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+
+
+def _sse(event: dict[str, Any]) -> bytes:
+    return f"event: {event['kind']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _jsonable(value: Any) -> Any:
+    return asdict(value) if is_dataclass(value) else value
+
+
+async def serve(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    *,
+    workers: int = 4,
+    checkpoint_store: CheckpointStore | None = None,
+    ready: asyncio.Event | None = None,
+) -> None:
+    """
+    Serve the job API until cancelled
+
+        POST /jobs                 submit a story; 202 with the job status
+        GET  /jobs/{id}            job status, including any pending feedback request
+        GET  /jobs/{id}/result     result once done (409 while running, 500 if failed)
+        GET  /jobs/{id}/events     server-sent StageEvents, replayed from the start
+        POST /jobs/{id}/feedback   {"action": "proceed|retry|feedback|stop", "feedback": "..."}
+        GET  /health               job counts
+    """
+    service = JobService(workers=workers, checkpoint_store=checkpoint_store)
+    await service.start()
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
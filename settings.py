@@ -1,4 +1,7 @@
-﻿from pydantic import BaseSettings, Field
+﻿from functools import lru_cache
+from typing import Any, Literal
+
+from pydantic import BaseSettings, Field
 
 
 class Settings(BaseSettings):
@@ -6,13 +9,84 @@ class Settings(BaseSettings):
     model_name: str = Field("gpt-4o-mini", env="U2_MODEL_NAME")
     temperature: float = Field(0.6, env="U2_TEMPERATURE")
     top_p: float = Field(0.9, env="U2_TOP_P")
+    max_tokens: int | None = Field(default=None, env="U2_MAX_TOKENS")
+    stage_models: dict[str, str] = Field(default_factory=dict, env="U2_STAGE_MODELS")
+    stage_temperatures: dict[str, float] = Field(default_factory=dict, env="U2_STAGE_TEMPERATURES")
+    stage_max_tokens: dict[str, int] = Field(default_factory=dict, env="U2_STAGE_MAX_TOKENS")
+    draft_model: str | None = Field(default=None, env="U2_DRAFT_MODEL")
+    draft_min_confidence: float = Field(0.8, env="U2_DRAFT_MIN_CONFIDENCE")
+    draft_stages: list[str] = Field(default_factory=list, env="U2_DRAFT_STAGES")
     search_api_key: str | None = Field(default=None, env="GOOGLE_API_KEY")
     search_engine_id: str | None = Field(default=None, env="GOOGLE_CSE_ID")
+    search_backend: str = Field("google", env="U2_SEARCH_BACKEND")
+    local_index_path: str = Field(".u2_search_index.sqlite", env="U2_LOCAL_INDEX_PATH")
+    local_corpus: str | None = Field(default=None, env="U2_LOCAL_CORPUS")
+    search_timeout: float = Field(10.0, env="U2_SEARCH_TIMEOUT")
+    search_concurrency: int = Field(8, env="U2_SEARCH_CONCURRENCY")
+    search_cache_size: int = Field(1024, env="U2_SEARCH_CACHE_SIZE")
+    search_cache_ttl: float | None = Field(3600.0, env="U2_SEARCH_CACHE_TTL")
+    search_log_max_entries: int | None = Field(50, env="U2_SEARCH_LOG_MAX_ENTRIES")
     max_retries: int = Field(3, env="U2_MAX_RETRIES")
+    retry_max_wait: float = Field(60.0, env="U2_RETRY_MAX_WAIT")
+    rate_limit_rpm: int | None = Field(default=None, env="U2_RATE_LIMIT_RPM")
+    rate_limit_tpm: int | None = Field(default=None, env="U2_RATE_LIMIT_TPM")
+    rate_limit_utilization: float = Field(0.95, env="U2_RATE_LIMIT_UTILIZATION")
+    rate_limit_path: str | None = Field(default=None, env="U2_RATE_LIMIT_PATH")
+    circuit_failure_threshold: int = Field(5, env="U2_CIRCUIT_FAILURE_THRESHOLD")
+    circuit_reset_seconds: float = Field(30.0, env="U2_CIRCUIT_RESET_SECONDS")
+    providers: list[dict[str, str]] = Field(default_factory=list, env="U2_PROVIDERS")
+    hedge_percentile: float | None = Field(default=None, env="U2_HEDGE_PERCENTILE")
+    hedge_min_samples: int = Field(20, env="U2_HEDGE_MIN_SAMPLES")
+    max_in_flight: int = Field(32, env="U2_MAX_IN_FLIGHT")
+    max_connections: int = Field(64, env="U2_MAX_CONNECTIONS")
+    keepalive_expiry: float = Field(30.0, env="U2_KEEPALIVE_EXPIRY")
+    cache_path: str | None = Field(default=None, env="U2_CACHE_PATH")
+    cache_ttl: float | None = Field(default=None, env="U2_CACHE_TTL")
+    cache_max_bytes: int | None = Field(default=None, env="U2_CACHE_MAX_BYTES")
+    max_context_tokens: int | None = Field(default=None, env="U2_MAX_CONTEXT_TOKENS")
+    prompt_cost_per_1k: float = Field(0.00015, env="U2_PROMPT_COST_PER_1K")
+    completion_cost_per_1k: float = Field(0.0006, env="U2_COMPLETION_COST_PER_1K")
+    cached_prompt_discount: float = Field(0.5, env="U2_CACHED_PROMPT_DISCOUNT")
+    prompt_cache_key: bool = Field(False, env="U2_PROMPT_CACHE_KEY")
+    model_prices: dict[str, tuple[float, float]] = Field(default_factory=dict, env="U2_MODEL_PRICES")
+    max_run_tokens: int | None = Field(default=None, env="U2_MAX_RUN_TOKENS")
+    max_stage_iterations: int = Field(3, env="U2_MAX_STAGE_ITERATIONS")
+    stage_iteration_limits: dict[str, int] = Field(default_factory=dict, env="U2_STAGE_ITERATION_LIMITS")
+    convergence_threshold: float | None = Field(0.95, env="U2_CONVERGENCE_THRESHOLD")
+    exploration_candidates: int = Field(1, env="U2_EXPLORATION_CANDIDATES")
+    candidate_temperature_spread: float = Field(0.2, env="U2_CANDIDATE_TEMPERATURE_SPREAD")
+    batch_poll_interval: float = Field(30.0, env="U2_BATCH_POLL_INTERVAL")
+    batch_completion_window: str = Field("24h", env="U2_BATCH_COMPLETION_WINDOW")
+    batch_max_requests: int = Field(50000, env="U2_BATCH_MAX_REQUESTS")
+    batch_price_factor: float = Field(0.5, env="U2_BATCH_PRICE_FACTOR")
+    service_max_jobs: int = Field(10000, env="U2_SERVICE_MAX_JOBS")
+    feedback_timeout: float | None = Field(default=None, env="U2_FEEDBACK_TIMEOUT")
+    # Not 'retry': rerunning the stage after every feedback timeout would never end.
+    feedback_default_action: Literal["proceed", "feedback", "stop"] = Field("proceed", env="U2_FEEDBACK_DEFAULT_ACTION")
+    dedupe_index_path: str | None = Field(default=None, env="U2_DEDUPE_INDEX_PATH")
+    dedupe_threshold: float = Field(0.8, env="U2_DEDUPE_THRESHOLD")
+    dedupe_action: str = Field("reuse", env="U2_DEDUPE_ACTION")
+    stage_memo_path: str | None = Field(default=None, env="U2_STAGE_MEMO_PATH")
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
 
-settings = Settings()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """The process-wide Settings, read from the environment and .env on first call."""
+    return Settings()
+
+
+class _LazySettings:
+    """Stands in for the Settings instance so importing a module does not read the environment"""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(get_settings(), name, value)
+
+
+settings = _LazySettings()
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import json
+import re
+import typing
+from dataclasses import MISSING, fields, is_dataclass
+from typing import Any, TypeVar
+
+from .search import search_triggers
+
+T = TypeVar("T")
+
+_JSON_TYPES = {str: "string", bool: "boolean", int: "integer", float: "number"}
+# Only a fence wrapping the whole response is stripped; fences inside string values are content.
+_FENCE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+SEARCH_QUERIES = "search_queries"
+
+
+def output_schema(output_type: type) -> dict[str, Any]:
+    """
+    Strict JSON schema of a context.py output dataclass
+
+    Every field is required (optional ones are nullable), as OpenAI structured outputs demand,
+    and a ``search_queries`` array replaces "Search needed for:" triggers in prose. Fields may
+    also be lists of strings or of nested dataclasses.
+    """
+    schema = _object_schema(output_type)
+    schema["properties"][SEARCH_QUERIES] = {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "Web searches needed to validate claims, one query each",
+    }
+    schema["required"] = list(schema["properties"])
+    return schema
+
+
+def _object_schema(output_type: type) -> dict[str, Any]:
+    hints = typing.get_type_hints(output_type)
+    properties: dict[str, Any] = {}
+    for f in fields(output_type):
+        schema = _field_schema(hints[f.name])
+        schema.update(f.metadata)
+        properties[f.name] = schema
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def _field_schema(annotation: Any) -> dict[str, Any]:
+    args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+    if typing.get_origin(annotation) is list:
+        return {"type": "array", "items": _field_schema(args[0])}
+    if is_dataclass(annotation):
+        return _object_schema(annotation)
+    base = args[0] if args else annotation
+    schema: dict[str, Any] = {"type": _JSON_TYPES[base]}
+    if len(args) < len(typing.get_args(annotation)):
+        schema["type"] = [schema["type"], "null"]
+    return schema
+
+
+def response_format(output_type: type) -> dict[str, Any]:
+    """``response_format`` argument requesting ``output_type`` as schema-constrained JSON."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": output_type.__name__, "schema": output_schema(output_type), "strict": True},
+    }
+
+
+def parse_output(text: str, output_type: type[T]) -> tuple[T, list[str]]:
+    """
+    Parse a structured response into ``output_type`` and its search queries in a single pass
+
+    Malformed JSON is repaired locally (code fences, surrounding prose, trailing commas,
+    Python literals, truncation) and values are coerced to the field types. A response with
+    no JSON object at all is split on field headings such as "Core Problem:" instead.
+    """
+    data = _load_json(text)
+    if data is None:
+        data = _split_headings(text, output_type)
+        data.setdefault(SEARCH_QUERIES, search_triggers(text))
+    return _coerce(data, output_type)
+
+
+def _load_json(text: str) -> dict[str, Any] | None:
+    try:
+        data = json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        pass
+    else:
+        return data if isinstance(data, dict) else None
+    fenced = _FENCE.match(text)
+    if fenced is not None:
+        text = fenced.group(1)
+    start = text.find("{")
+    if start < 0:
+        return None
+    end = text.rfind("}")
+    candidate = text[start:end + 1] if end > start else text[start:]
+    try:
+        data = json.loads(candidate, strict=False)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(_repair(text[start:]), strict=False)
+        except json.JSONDecodeError:
+            return None
+    return data if isinstance(data, dict) else None
+
+
+def _repair(text: str) -> str:
+    """Best-effort fix of common LLM JSON defects, closing whatever truncation left open."""
+    out: list[str] = []
+    closers: list[str] = []
+    in_string = escaped = False
+    word = ""
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char.isalpha():
+            word += char
+            continue
+        if word:
+            out.append(_PYTHON_LITERALS.get(word, word))
+            word = ""
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not closers:
+                break
+            closers.pop()
+            out.append(char)
+            if not closers:
+                break
+            continue
+        out.append(char)
+    if word:
+        out.append(_PYTHON_LITERALS.get(word, word))
+    repaired = "".join(out).rstrip()
+    if in_string:
+        repaired += '"'
+    # A key cut off before its value, or a dangling comma, cannot be completed; drop it.
+    if closers and closers[-1] == "}":
+        repaired = re.sub(r"\s*:\s*$", "", repaired)
+        repaired = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"$', r"\1", repaired)
+    repaired = re.sub(r",\s*$", "", repaired)
+    repaired += "".join(reversed(closers))
+    return _TRAILING_COMMA.sub(r"\1", repaired)
+
+
+def _split_headings(text: str, output_type: type) -> dict[str, Any]:
+    """Fallback for prose answers: take each string field from under its "Field Name:" heading."""
+    names = [f.name for f in fields(output_type) if typing.get_type_hints(output_type)[f.name] is str]
+    pattern = re.compile(
+        r"^[ \t]*(" + "|".join(re.escape(name.replace("_", " ")) for name in names) + r")\b[^:\n]*:",
+        re.IGNORECASE | re.MULTILINE,
+    )
+    matches = list(pattern.finditer(text))
+    data: dict[str, Any] = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        name = match.group(1).lower().replace(" ", "_")
+        body = text[match.end():following.start() if following else len(text)].strip()
+        data.setdefault(name, body)
+    if not data and names:
+        data[names[0]] = text.strip()
+    return data
+
+
+def _coerce(data: dict[str, Any], output_type: type[T]) -> tuple[T, list[str]]:
+    normalized = _normalize(data)
+    queries = normalized.get(SEARCH_QUERIES) or []
+    if isinstance(queries, str):
+        queries = [queries]
+    return _coerce_fields(normalized, output_type), [str(query).strip() for query in queries if str(query).strip()]
+
+
+def _normalize(data: dict[str, Any]) -> dict[str, Any]:
+    return {str(key).strip().lower().replace(" ", "_").replace("-", "_"): value for key, value in data.items()}
+
+
+def _coerce_fields(normalized: dict[str, Any], output_type: type[T]) -> T:
+    hints = typing.get_type_hints(output_type)
+    values: dict[str, Any] = {}
+    for f in fields(output_type):
+        annotation = hints[f.name]
+        value = normalized.get(f.name)
+        if value is None:
+            if f.default is not MISSING:
+                values[f.name] = f.default
+            elif f.default_factory is not MISSING:
+                values[f.name] = f.default_factory()
+            else:
+                values[f.name] = "" if annotation is str else None
+            continue
+        allowed = f.metadata.get("enum")
+        if allowed is not None:
+            value = str(value).strip().lower() or None
+            values[f.name] = value if value in allowed else None
+        elif annotation is bool:
+            values[f.name] = value if isinstance(value, bool) else str(value).strip().lower() in ("true", "yes", "1")
+        elif annotation in (int, float):
+            values[f.name] = _as_number(value, annotation, f.default if f.default is not MISSING else annotation())
+        elif typing.get_origin(annotation) is list:
+            values[f.name] = _as_list(value, typing.get_args(annotation)[0])
+        else:
+            values[f.name] = _as_text(value)
+    return output_type(**values)
+
+
+def _as_list(value: Any, item_type: type) -> list[Any]:
+    items = value if isinstance(value, list) else [value]
+    if is_dataclass(item_type):
+        # Items that are not objects cannot be mapped onto the dataclass's fields.
+        return [_coerce_fields(_normalize(item), item_type) for item in items if isinstance(item, dict)]
+    return [_as_text(item) for item in items if item is not None]
+
+
+def _as_number(value: Any, number_type: type, default: Any) -> Any:
+    if isinstance(value, str):
+        match = re.search(r"-?\d+(?:\.\d+)?", value)
+        value = match.group(0) if match else None
+    try:
+        return number_type(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _as_text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(_as_text(item) for item in value)
+    return json.dumps(value, ensure_ascii=False, indent=2)
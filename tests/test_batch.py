@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import io
+import json
+
+from ..batch import run_offline
+from ..fake_llm import FakeLLMBackend
+from ..llm_client import override_clients
+from ..orchestrator import Orchestrator
+
+STORY = {"enabler_story": "story", "potential_fix": "fix"}
+
+
+def test_identical_offline_requests_are_submitted_and_billed_once():
+    backend = FakeLLMBackend(lambda stage, messages: f"{stage} answer")
+    out = io.StringIO()
+
+    with override_clients(backend, backend.async_client()):
+        counts = run_offline(Orchestrator(), [("first", STORY), ("second", STORY)], out, poll_interval=0)
+
+    results = {line["id"]: line["result"] for line in map(json.loads, out.getvalue().splitlines())}
+    first, second = results["first"]["usage"], results["second"]["usage"]
+    assert counts == {"succeeded": 2, "failed": 0, "skipped": 0}
+    assert backend.calls == {"discovery": 1, "exploration": 1, "integration": 1}
+    assert first["llm_calls"] == 3 and first["cost_usd"] > 0
+    assert (second["llm_calls"], second["total_tokens"], second["cost_usd"]) == (0, 0, 0)
+    assert second["cache_hits"] == 3
+    assert second["logical_tokens"] == first["logical_tokens"]
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from .. import cache as cache_module
+from ..cache import ResponseCache
+from ..fake_llm import FakeLLMBackend
+from ..llm_client import override_clients
+from ..orchestrator import Orchestrator
+from ..settings import settings
+
+
+def numbered_backend() -> FakeLLMBackend:
+    def respond(stage, messages):
+        return f"{stage} answer #{backend.calls[stage] - 1}"
+
+    backend = FakeLLMBackend(respond)
+    return backend
+
+
+def test_interactive_retry_reaches_the_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "cache_path", str(tmp_path / "cache.sqlite"))
+    backend = numbered_backend()
+    seen = []
+
+    def feedback(stage, output, ctx):
+        seen.append((stage, output.core_problem if stage == "discovery" else None))
+        if stage == "discovery" and len(seen) == 1:
+            return {"continue": True, "feedback": "", "action": "retry"}
+        return {"continue": True, "feedback": "", "action": "proceed"}
+
+    with override_clients(backend, backend.async_client()):
+        result = Orchestrator(interactive=True, human_feedback_callback=feedback).run(
+            enabler_story="story", potential_fix="fix"
+        )
+
+    assert backend.calls["discovery"] == 2
+    assert "#0" in seen[0][1] and "#1" in seen[1][1]
+    assert result["usage"]["cache_hits"] == 0
+
+
+def test_repeated_run_is_answered_from_the_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "cache_path", str(tmp_path / "cache.sqlite"))
+    backend = numbered_backend()
+
+    with override_clients(backend, backend.async_client()):
+        Orchestrator().run(enabler_story="story", potential_fix="fix")
+        calls = dict(backend.calls)
+        result = Orchestrator().run(enabler_story="story", potential_fix="fix")
+
+    assert backend.calls == calls
+    assert result["usage"]["cache_hits"] == len(calls)
+
+
+class Clock:
+    def __init__(self, monkeypatch):
+        self.now = 1_000_000.0
+        monkeypatch.setattr(cache_module.time, "time", lambda: self.now)
+
+
+def test_size_bound_evicts_the_least_recently_used_entries(monkeypatch, tmp_path):
+    clock = Clock(monkeypatch)
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_bytes=30)
+    for key in "abc":
+        clock.now += 1
+        cache.put(key, "x" * 10)
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.put("d", "x" * 10)
+
+    assert [key for key in "abcd" if cache.get(key) is not None] == ["a", "c", "d"]
+    assert cache.stats()["bytes"] == 30
+
+
+def test_replacing_an_entry_counts_its_size_once(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_bytes=15)
+    cache.put("a", "x" * 10)
+    cache.put("a", "y" * 10)
+    cache.put("b", "x" * 5)
+
+    assert cache.get("a") == "y" * 10 and cache.get("b") == "x" * 5
+
+
+def test_expired_entries_no_longer_count_towards_the_size_bound(monkeypatch, tmp_path):
+    clock = Clock(monkeypatch)
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=10, max_bytes=20)
+    cache.put("old", "x" * 10)
+    clock.now += 5
+    cache.put("a", "x" * 10)
+    clock.now += 6
+    cache.put("b", "x" * 10)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get("a") == "x" * 10
+
+
+def test_writes_do_not_sum_the_whole_table(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_bytes=1000)
+    statements: list[str] = []
+    cache._conn.set_trace_callback(statements.append)
+    for index in range(50):
+        cache.put(str(index), "x" * 100)
+
+    assert statements.count("SELECT COALESCE(SUM(size), 0) FROM responses") == 1
+    assert cache.stats()["bytes"] == 1000
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+
+import pytest
+
+from ..checkpoint import FileCheckpointStore, MemoryCheckpointStore
+from ..context import DiscoveryOutput, ExplorationOutput, IntegrationOutput
+from ..orchestrator import Orchestrator
+from ..settings import settings
+
+
+def test_run_ids_that_sanitise_alike_get_their_own_files(tmp_path):
+    store = FileCheckpointStore(tmp_path)
+    store.save("a/b", {"run_id": "a/b", "stage": "exploration"})
+    store.save("a_b", {"run_id": "a_b", "stage": "done"})
+
+    assert store.load("a/b")["stage"] == "exploration"
+    assert store.load("a_b")["stage"] == "done"
+    assert sorted(store.run_ids()) == ["a/b", "a_b"]
+    store.delete("a/b")
+    assert store.load("a/b") is None
+    assert store.is_finished("a_b")
+
+
+class Crash(Exception):
+    pass
+
+
+class LoopingAgents:
+    """Stage agents whose Integration always calls back Exploration; one Integration call may crash"""
+
+    def __init__(self, crash_on_integration: int | None = None):
+        self.calls: Counter[str] = Counter()
+        self.crash_on_integration = crash_on_integration
+
+    def install(self, orchestrator: Orchestrator) -> Orchestrator:
+        for stage in ("discovery", "exploration", "integration"):
+            setattr(orchestrator, stage, Agent(stage, self.calls, getattr(self, stage)))
+        return orchestrator
+
+    def discovery(self, n: int) -> DiscoveryOutput:
+        return DiscoveryOutput(core_problem=f"problem #{n}", baseline_solution="baseline", critical_defects="defects")
+
+    def exploration(self, n: int) -> ExplorationOutput:
+        return ExplorationOutput(analysis=f"analysis #{n}", validated_uus="uus")
+
+    def integration(self, n: int) -> IntegrationOutput:
+        if n == self.crash_on_integration:
+            raise Crash
+        return IntegrationOutput(synthesis=f"synthesis #{n}", callback="exploration")
+
+
+class Agent:
+    def __init__(self, stage, calls, output):
+        self.stage = stage
+        self.calls = calls
+        self.output = output
+
+    def run(self, ctx, restart=False):
+        self.calls[self.stage] += 1
+        return self.output(self.calls[self.stage])
+
+
+@pytest.fixture(autouse=True)
+def two_iterations(monkeypatch):
+    monkeypatch.setattr(settings, "max_stage_iterations", 2)
+    monkeypatch.setattr(settings, "convergence_threshold", None)
+
+
+def orchestrator(agents: LoopingAgents, store: MemoryCheckpointStore) -> Orchestrator:
+    return agents.install(Orchestrator(checkpoint_store=store))
+
+
+def test_uninterrupted_run_stops_at_the_iteration_limit():
+    agents = LoopingAgents()
+    result = orchestrator(agents, MemoryCheckpointStore()).run(
+        enabler_story="story", potential_fix="fix", run_id="run"
+    )
+
+    assert agents.calls["exploration"] == 2
+    assert result["stop_reason"] == "max_iterations"
+
+
+def test_loop_guard_survives_a_resume_from_a_stage_checkpoint():
+    store = MemoryCheckpointStore()
+    agents = LoopingAgents(crash_on_integration=2)
+
+    with pytest.raises(Crash):
+        orchestrator(agents, store).run(enabler_story="story", potential_fix="fix", run_id="run")
+    assert store.load("run")["guard"]["iterations"] == {"discovery": 1, "exploration": 2, "integration": 1}
+    result = orchestrator(agents, store).run(enabler_story="story", potential_fix="fix", run_id="run")
+
+    assert agents.calls["exploration"] == 2
+    assert result["stop_reason"] == "max_iterations"
+
+
+def test_arun_resumes_with_the_saved_loop_guard():
+    store = MemoryCheckpointStore()
+    agents = LoopingAgents(crash_on_integration=2)
+
+    async def scenario():
+        with pytest.raises(Crash):
+            await orchestrator(agents, store).arun(enabler_story="story", potential_fix="fix", run_id="run")
+        return await orchestrator(agents, store).arun(enabler_story="story", potential_fix="fix", run_id="run")
+
+    result = asyncio.run(scenario())
+    assert agents.calls["exploration"] == 2
+    assert result["stop_reason"] == "max_iterations"
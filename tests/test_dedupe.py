@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import argparse
+
+from ..cli import _input_run_id
+from ..dedupe import StoryIndex
+from ..fake_llm import FakeLLMBackend
+from ..llm_client import override_clients
+from ..orchestrator import Orchestrator
+
+STORY = "As a user I want to sign in with my fingerprint so that I never have to type a password again"
+FIX = "Add WebAuthn passkeys next to the password form"
+
+
+def test_similar_stories_are_found_and_others_are_not(tmp_path):
+    index = StoryIndex(tmp_path / "index.sqlite")
+    index.add("run", STORY, FIX, None, {"core_problem": "p"})
+
+    [match] = index.find(STORY + " again", FIX, 0.8)
+    assert match.run_id == "run" and match.similarity >= 0.8
+    assert index.find("Export the monthly invoices as CSV files", "Add an export button", 0.8) == []
+
+
+def test_adding_a_run_id_again_replaces_its_entry(tmp_path):
+    index = StoryIndex(tmp_path / "index.sqlite")
+    index.add("run", STORY, FIX, None, {"core_problem": "first"})
+    index.add("run", STORY, FIX, None, {"core_problem": "second"})
+
+    assert len(index) == 1
+    assert [match.result["core_problem"] for match in index.find(STORY, FIX, 0.8)] == ["second"]
+
+
+def test_a_near_duplicate_story_reuses_the_stored_result(tmp_path):
+    index = StoryIndex(tmp_path / "index.sqlite")
+    backend = FakeLLMBackend({"default": "answer"})
+
+    with override_clients(backend, backend.async_client()):
+        first = Orchestrator(story_index=index).run(enabler_story=STORY, potential_fix=FIX, run_id="first")
+        calls = dict(backend.calls)
+        second = Orchestrator(story_index=index).run(enabler_story=STORY + " again", potential_fix=FIX)
+
+    assert backend.calls == calls
+    assert second["reused_from"]["run_id"] == "first"
+    assert second["core_problem"] == first["core_problem"]
+    assert second["usage"] == {}
+
+
+def input_args(path, run_id=None) -> argparse.Namespace:
+    return argparse.Namespace(input=path, run_id=run_id)
+
+
+def test_input_files_of_the_same_name_get_distinct_run_ids(tmp_path):
+    first, second = tmp_path / "a" / "story.json", tmp_path / "b" / "story.json"
+    first_again = tmp_path / "b" / ".." / "a" / "story.json"
+
+    assert _input_run_id(input_args(first), {}) != _input_run_id(input_args(second), {})
+    assert _input_run_id(input_args(first), {}) == _input_run_id(input_args(first_again), {})
+    assert _input_run_id(input_args(first), {}).startswith("story-")
+
+
+def test_explicit_run_ids_win(tmp_path):
+    path = tmp_path / "story.json"
+
+    assert _input_run_id(input_args(path), {"id": 7}) == "7"
+    assert _input_run_id(input_args(path, run_id="mine"), {"id": 7}) == "mine"
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import io
+import json
+
+from ..evaluation import Evaluator, run_evaluation
+from ..fake_llm import FakeLLMBackend
+from ..llm_client import override_clients
+from ..settings import settings
+
+VERDICT = json.dumps(
+    {
+        "candidates": [
+            {"name": "A", "absence": True, "emergence": True, "transformation": True, "non_routine": True},
+            {"name": "B", "absence": True, "emergence": False, "transformation": True, "non_routine": True},
+        ],
+        "accepted": 9,
+    }
+)
+RECORDS = [("1", {"enabler_story": "story", "potential_fix": "fix"})]
+
+
+def evaluate(systems: list[str]) -> dict:
+    backend = FakeLLMBackend(lambda stage, messages: VERDICT if stage == "judge" else f"{stage} answer")
+    with override_clients(backend, backend.async_client()):
+        return run_evaluation(Evaluator(), RECORDS, io.StringIO(), systems=systems, workers=1)
+
+
+def test_acceptance_is_counted_from_per_candidate_verdicts():
+    report = evaluate(["zsp"])["zsp"]
+
+    assert report["accepted_uus_per_story"] == 1.0
+    assert report["acceptance_rate"] == 0.5
+    assert report["criterion_pass_rates"]["emergence"] == 0.5
+
+
+def test_cached_completions_still_count_towards_token_metrics(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "cache_path", str(tmp_path / "cache.sqlite"))
+
+    first = evaluate(["zsp", "u2f"])
+    second = evaluate(["zsp", "u2f"])
+
+    for system in ("zsp", "u2f"):
+        assert second[system]["billed_tokens_per_story"] == 0
+        assert second[system]["cost_usd"] == 0
+        assert second[system]["tokens_per_story"] > 0
+        assert second[system]["accepted_per_1k_tokens"] is not None
+        assert second[system]["judge_tokens"] > 0
+    assert second["zsp"]["tokens_per_story"] == first["zsp"]["tokens_per_story"]
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from ..cache import ResponseCache
+from ..fake_llm import FakeLLMBackend
+from ..llm_client import LLMClient, override_clients
+from ..rate_limit import CircuitBreaker
+from ..router import Provider, Router
+from ..settings import settings
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def client_with_cache(tmp_path) -> LLMClient:
+    router = Router([Provider("openai")], breaker=CircuitBreaker())
+    return LLMClient(cache=ResponseCache(tmp_path / "cache.sqlite"), router=router)
+
+
+def test_accepted_draft_is_cached_under_the_draft_model(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "draft_model", "draft-model")
+    backend = FakeLLMBackend({"default": "answer"}, confidence=0.99)
+
+    with override_clients(backend, backend.async_client()):
+        client = client_with_cache(tmp_path)
+        client.complete(MESSAGES)
+        client.complete(MESSAGES)
+        assert backend.calls == {"default": 1}
+
+        monkeypatch.setattr(settings, "draft_model", None)
+        client.complete(MESSAGES)
+        assert backend.calls == {"default": 2}
+
+
+def test_escalated_draft_is_cached_under_the_primary_model(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "draft_model", "draft-model")
+    backend = FakeLLMBackend({"default": "answer"}, confidence=0.1)
+
+    with override_clients(backend, backend.async_client()):
+        client = client_with_cache(tmp_path)
+        client.complete(MESSAGES)
+        assert backend.calls == {"default": 2}
+
+        monkeypatch.setattr(settings, "draft_model", None)
+        client.complete(MESSAGES)
+        assert backend.calls == {"default": 2}
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import json
+import sys
+
+from ..local_search import LocalIndex, main
+
+
+def test_query_prints_results_as_json(monkeypatch, tmp_path, capsys):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "residency.md").write_text("GDPR data residency forces geo-distributed storage.", encoding="utf-8")
+    (corpus / "logging.md").write_text("Structured logging for a new service.", encoding="utf-8")
+    index = tmp_path / "index.sqlite"
+    monkeypatch.setattr(
+        sys, "argv", ["local_search", "--index", str(index), "--corpus", str(corpus), "--query", "data residency"]
+    )
+
+    main()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "Re-indexed 2 file(s); 2 document(s) in index."
+    result = json.loads(lines[1])
+    assert result["title"] == "residency"
+    assert "geo-distributed" in result["snippet"]
+
+
+def test_refresh_skips_unchanged_files(tmp_path):
+    (tmp_path / "note.txt").write_text("event-driven collaboration", encoding="utf-8")
+    index = LocalIndex(tmp_path / "index.sqlite")
+
+    assert index.refresh(tmp_path) == 1
+    assert index.refresh(tmp_path) == 0
+    assert len(index) == 1
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from ..context import ConversationContext, DiscoveryOutput, ExplorationOutput
+from ..fake_llm import FakeLLMBackend
+from ..llm_client import override_clients
+from ..memo import StageMemo, stage_key
+from ..orchestrator import Orchestrator
+from ..settings import settings
+
+DISCOVERY = DiscoveryOutput(core_problem="problem", baseline_solution="baseline", critical_defects="defects")
+
+
+def context(**overrides) -> ConversationContext:
+    fields = {"enabler_story": "story", "potential_fix": "fix", "discovery": DISCOVERY}
+    return ConversationContext(**{**fields, **overrides})
+
+
+def test_only_the_stages_reading_an_input_change_their_key():
+    plain, preferring = context(), context(human_preferences="mobile first")
+
+    assert stage_key("discovery", plain) == stage_key("discovery", preferring)
+    assert stage_key("exploration", plain) != stage_key("exploration", preferring)
+    assert stage_key("exploration", plain) != stage_key("exploration", context(search_log=["Query: q\nresults"]))
+
+
+def test_provider_chain_and_draft_model_join_the_key(monkeypatch):
+    ctx = context()
+    key = stage_key("exploration", ctx)
+
+    monkeypatch.setattr(settings, "providers", [{"name": "openai", "api_key": "sk-one"}])
+    assert stage_key("exploration", ctx) != key
+    with_provider = stage_key("exploration", ctx)
+    monkeypatch.setattr(settings, "providers", [{"name": "openai", "api_key": "sk-two"}])
+    assert stage_key("exploration", ctx) == with_provider
+
+    monkeypatch.setattr(settings, "providers", [])
+    monkeypatch.setattr(settings, "draft_model", "gpt-4o-mini")
+    assert stage_key("exploration", ctx) != key
+    monkeypatch.setattr(settings, "draft_stages", ["discovery"])
+    assert stage_key("exploration", ctx) == key
+
+
+def test_recall_restores_the_output_and_its_search_log(tmp_path):
+    memo = StageMemo(tmp_path / "memo.sqlite")
+    output = ExplorationOutput(analysis="analysis", validated_uus="uus")
+    memo.store("key", "exploration", output, context(search_log=["Query: q\nresults"]))
+
+    ctx = context()
+    assert memo.recall("key", ctx) == output
+    assert list(ctx.search_log) == ["Query: q\nresults"]
+    assert memo.recall("other", ctx) is None
+
+
+def test_changed_preferences_rerun_from_exploration(tmp_path):
+    memo = StageMemo(tmp_path / "memo.sqlite")
+    backend = FakeLLMBackend(lambda stage, messages: f"{stage} answer")
+    story = {"enabler_story": "story", "potential_fix": "fix"}
+
+    with override_clients(backend, backend.async_client()):
+        Orchestrator(stage_memo=memo).run(**story)
+        Orchestrator(stage_memo=memo).run(**story)
+        assert backend.calls == {"discovery": 1, "exploration": 1, "integration": 1}
+        Orchestrator(stage_memo=memo).run(**story, human_preferences="mobile first")
+
+    assert backend.calls == {"discovery": 1, "exploration": 2, "integration": 2}
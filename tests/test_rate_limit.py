@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+import tenacity
+
+from ..fake_llm import FakeLLMBackend
+from ..llm_client import AsyncLLMClient, LLMClient, override_clients
+from ..rate_limit import CircuitBreaker, CircuitOpenError, is_outage, is_retryable
+from ..router import Provider, Router
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def status_error(status: int, code: str | None = None) -> Exception:
+    error = RuntimeError(f"HTTP {status}")
+    error.status_code = status
+    error.code = code
+    return error
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        openai.APITimeoutError(request=REQUEST),
+        openai.APIConnectionError(request=REQUEST),
+        httpx.ConnectError("refused"),
+        httpx.ReadTimeout("slow"),
+        TimeoutError(),
+        ConnectionResetError(),
+        status_error(429),
+        status_error(408),
+        status_error(409),
+        status_error(503),
+    ],
+)
+def test_transport_errors_rate_limits_and_5xx_are_retried(error):
+    assert is_retryable(error)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        status_error(429, "insufficient_quota"),
+        status_error(400),
+        status_error(404),
+        CircuitOpenError("openai/gpt-4o-mini", 1.0),
+        KeyError("choices"),
+        TypeError("bad argument"),
+        asyncio.CancelledError(),
+        KeyboardInterrupt(),
+    ],
+)
+def test_request_errors_local_bugs_and_cancellation_are_not_retried(error):
+    assert not is_retryable(error)
+
+
+@pytest.mark.parametrize(
+    ("error", "outage"),
+    [
+        (httpx.ConnectError("refused"), True),
+        (openai.APITimeoutError(request=REQUEST), True),
+        (status_error(502), True),
+        (status_error(429), False),
+        (KeyError("choices"), False),
+        (asyncio.CancelledError(), False),
+        (CircuitOpenError("openai/gpt-4o-mini", 1.0), False),
+    ],
+)
+def test_only_transport_errors_and_5xx_are_outages(error, outage):
+    assert is_outage(error) is outage
+
+
+def test_local_bugs_do_not_open_the_circuit():
+    breaker = CircuitBreaker(threshold=2)
+    for _ in range(3):
+        breaker.check("key")
+        breaker.record("key", TypeError("bug"))
+    breaker.check("key")
+
+
+def failing_backend(error: BaseException) -> FakeLLMBackend:
+    def respond(stage, messages):
+        raise error
+
+    return FakeLLMBackend(respond)
+
+
+def isolated_router() -> Router:
+    return Router([Provider("openai")], breaker=CircuitBreaker())
+
+
+def test_local_bug_is_raised_after_one_attempt():
+    backend = failing_backend(KeyError("choices"))
+    with override_clients(backend, backend.async_client()), pytest.raises(KeyError):
+        LLMClient(router=isolated_router()).complete(MESSAGES)
+    assert backend.calls == {"default": 1}
+
+
+def test_transport_error_is_retried(monkeypatch):
+    monkeypatch.setattr("random.uniform", lambda low, high: 0.0)
+    backend = failing_backend(httpx.ConnectError("refused"))
+    with override_clients(backend, backend.async_client()), pytest.raises(tenacity.RetryError):
+        LLMClient(router=isolated_router()).complete(MESSAGES)
+    assert backend.calls == {"default": 3}
+
+
+def test_cancellation_is_raised_after_one_attempt():
+    backend = failing_backend(asyncio.CancelledError())
+
+    async def complete():
+        with override_clients(backend, backend.async_client()):
+            await AsyncLLMClient(router=isolated_router()).complete(MESSAGES)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(complete())
+    assert backend.calls == {"default": 1}
+
+
+def test_quota_exhaustion_is_not_retried():
+    error = status_error(429, "insufficient_quota")
+    error.response = SimpleNamespace(headers={})
+    backend = failing_backend(error)
+    with override_clients(backend, backend.async_client()), pytest.raises(RuntimeError):
+        LLMClient(router=isolated_router()).complete(MESSAGES)
+    assert backend.calls == {"default": 1}
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from ..fake_llm import FakeLLMBackend, LatencyModel
+from ..rate_limit import CircuitBreaker, RateLimiter
+from ..router import LatencyTracker, Provider, Router
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+class SlowCompletions:
+    """An async client whose calls never answer, counting the ones that get cancelled"""
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+
+    async def create(self, **request):
+        self.started += 1
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def client(completions) -> SimpleNamespace:
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+def failing_client(error: Exception) -> SimpleNamespace:
+    async def create(**request):
+        raise error
+
+    return client(SimpleNamespace(create=create))
+
+
+def hedging_router(providers: list[Provider]) -> Router:
+    tracker = LatencyTracker()
+    for provider in providers:
+        tracker.observe(f"{provider.name}:complete", 0.01)
+    return Router(
+        providers,
+        hedge_percentile=50,
+        hedge_min_samples=1,
+        tracker=tracker,
+        limiter=RateLimiter(),
+        breaker=CircuitBreaker(),
+    )
+
+
+def test_failover_answers_from_the_next_provider():
+    backend = FakeLLMBackend({"default": "from b"})
+    clients = {"a": failing_client(httpx.ConnectError("refused")), "b": backend.async_client()}
+    router = Router([Provider("a"), Provider("b", model="local")], limiter=RateLimiter(), breaker=CircuitBreaker())
+
+    response, model = asyncio.run(
+        router.acreate(lambda provider: clients[provider.name], model="gpt-4o-mini", messages=MESSAGES)
+    )
+
+    assert response.choices[0].message.content == "from b"
+    assert model == "local"
+
+
+def test_every_provider_failing_raises_the_last_error():
+    clients = {"a": failing_client(httpx.ConnectError("refused")), "b": failing_client(httpx.ReadTimeout("slow"))}
+    router = Router([Provider("a"), Provider("b")], limiter=RateLimiter(), breaker=CircuitBreaker())
+
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(router.acreate(lambda provider: clients[provider.name], model="gpt-4o-mini", messages=MESSAGES))
+
+
+def test_hedge_wins_over_a_slow_provider_and_the_loser_is_cancelled():
+    slow = SlowCompletions()
+    backend = FakeLLMBackend({"default": "from b"}, latency=LatencyModel(mean=0.02))
+    clients = {"a": client(slow), "b": backend.async_client()}
+    router = hedging_router([Provider("a"), Provider("b")])
+
+    async def scenario():
+        response, _ = await router.acreate(
+            lambda provider: clients[provider.name], model="gpt-4o-mini", messages=MESSAGES
+        )
+        await asyncio.sleep(0.01)
+        return response, (slow.started, slow.cancelled)
+
+    response, calls = asyncio.run(scenario())
+    assert response.choices[0].message.content == "from b"
+    assert calls == (1, 1)
+
+
+def test_cancelling_the_caller_cancels_the_primary_and_the_hedge():
+    slow = SlowCompletions()
+    router = hedging_router([Provider("a"), Provider("b")])
+
+    async def scenario():
+        call = asyncio.ensure_future(
+            router.acreate(lambda provider: client(slow), model="gpt-4o-mini", messages=MESSAGES)
+        )
+        while slow.started < 2:
+            await asyncio.sleep(0.005)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0.01)
+        return slow.started, slow.cancelled
+
+    assert asyncio.run(scenario()) == (2, 2)
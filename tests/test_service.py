@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import httpx
+import pytest
+
+from ..fake_llm import FakeLLMBackend
+from ..llm_client import override_clients
+from ..service import JobService, handle_connection
+from ..settings import settings
+
+STORY = {"enabler_story": "story", "potential_fix": "fix"}
+
+
+@asynccontextmanager
+async def running_service(workers: int = 1) -> AsyncIterator[tuple[JobService, httpx.AsyncClient]]:
+    backend = FakeLLMBackend({"default": "answer"})
+    with override_clients(backend, backend.async_client()):
+        service = JobService(workers=workers)
+        await service.start()
+        server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=10) as client:
+                yield service, client
+        finally:
+            server.close()
+            await server.wait_closed()
+            await service.close()
+
+
+async def wait_for(client: httpx.AsyncClient, job_id: str, status: str) -> dict:
+    for _ in range(500):
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}: {job}")
+
+
+async def raw_request(client: httpx.AsyncClient, request: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection(client.base_url.host, client.base_url.port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response.split(b"\r\n", 1)[0]
+
+
+def test_parked_job_holds_no_worker():
+    async def scenario():
+        async with running_service(workers=1) as (service, client):
+            await client.post("/jobs", json={**STORY, "id": "asks", "interactive": True})
+            await wait_for(client, "asks", "awaiting_feedback")
+            await client.post("/jobs", json={**STORY, "id": "plain"})
+            await wait_for(client, "plain", "done")
+            return (await client.get("/jobs/asks")).json()["status"]
+
+    assert asyncio.run(scenario()) == "awaiting_feedback"
+
+
+def test_feedback_resumes_a_parked_job_until_it_finishes():
+    async def scenario():
+        async with running_service() as (service, client):
+            await client.post("/jobs", json={**STORY, "id": "asks", "interactive": True})
+            stages = []
+            for _ in range(3):
+                job = await wait_for(client, "asks", "awaiting_feedback")
+                stages.append(job["pending_feedback"]["stage"])
+                response = await client.post("/jobs/asks/feedback", json={"action": "proceed"})
+                assert response.status_code == 200
+            await wait_for(client, "asks", "done")
+            return stages, (await client.get("/jobs/asks/result")).json()["stop_reason"]
+
+    stages, stop_reason = asyncio.run(scenario())
+    assert stages == ["discovery", "exploration", "integration"]
+    assert stop_reason == "completed"
+
+
+def test_unknown_feedback_action_is_rejected_by_the_orchestrator_rules():
+    async def scenario():
+        async with running_service() as (service, client):
+            await client.post("/jobs", json={**STORY, "id": "asks", "interactive": True})
+            await wait_for(client, "asks", "awaiting_feedback")
+            response = await client.post("/jobs/asks/feedback", json={"action": "skip"})
+            return response.status_code, response.json()["error"]
+
+    status, error = asyncio.run(scenario())
+    assert status == 422
+    assert "proceed, retry, feedback, stop" in error
+
+
+def test_jobs_parked_longest_are_evicted_beyond_the_limit(monkeypatch):
+    monkeypatch.setattr(settings, "service_max_jobs", 2)
+
+    async def scenario():
+        async with running_service() as (service, client):
+            for job_id in ("first", "second"):
+                await client.post("/jobs", json={**STORY, "id": job_id, "interactive": True})
+                await wait_for(client, job_id, "awaiting_feedback")
+            await client.post("/jobs", json={**STORY, "id": "third"})
+            await wait_for(client, "third", "done")
+            evicted = (await client.get("/jobs/first")).status_code
+            return evicted, list(service._parking.run_ids()), (await client.get("/jobs/second")).json()["status"]
+
+    evicted, parked, second = asyncio.run(scenario())
+    assert evicted == 404
+    assert parked == ["second"]
+    assert second == "awaiting_feedback"
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-5", b"+3"])
+def test_invalid_content_length_is_answered_400(length):
+    async def scenario():
+        async with running_service() as (service, client):
+            return await raw_request(client, b"POST /jobs HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n{}")
+
+    assert asyncio.run(scenario()) == b"HTTP/1.1 400 Bad Request"
+
+
+def test_overlong_header_is_answered_431():
+    async def scenario():
+        async with running_service() as (service, client):
+            return await raw_request(client, b"GET /health HTTP/1.1\r\nX-Long: " + b"a" * 100_000 + b"\r\n\r\n")
+
+    assert asyncio.run(scenario()) == b"HTTP/1.1 431 Request Header Fields Too Large"
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import json
+
+from ..context import IntegrationOutput
+from ..structured import parse_output
+
+SNIPPET = "Wrap the client:\n```python\nclient = Retrying(client)\n```\nthen deploy."
+
+
+def test_fence_inside_string_value_is_kept():
+    text = json.dumps({"synthesis": SNIPPET, "callback": "exploration", "search_queries": ["retry budgets"]})
+
+    output, queries = parse_output(text, IntegrationOutput)
+
+    assert output.synthesis == SNIPPET
+    assert output.callback == "exploration"
+    assert queries == ["retry budgets"]
+
+
+def test_fence_wrapping_the_response_is_stripped():
+    payload = json.dumps({"synthesis": SNIPPET, "callback": None, "search_queries": []})
+
+    output, queries = parse_output(f"```json\n{payload}\n```", IntegrationOutput)
+
+    assert output.synthesis == SNIPPET
+    assert output.callback is None
+    assert queries == []
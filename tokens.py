@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from .context import ConversationContext
+from .prompts import DISCOVERY_PROMPT, EXPLORATION_PROMPT, INTEGRATION_PROMPT
+from .settings import settings
+
+if TYPE_CHECKING:
+    import tiktoken
+
+# Per-message framing overhead of the chat format, as documented for OpenAI chat models.
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_PER_REPLY = 3
+
+_STAGE_TEMPLATES = {
+    "discovery": DISCOVERY_PROMPT,
+    "exploration": EXPLORATION_PROMPT,
+    "integration": INTEGRATION_PROMPT,
+}
+_FEEDBACK_ENTRY = re.compile(r"\n\[\w+ Feedback\]: ")
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> tiktoken.Encoding | None:
+    import tiktoken
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # BPE files are downloaded on first use; offline hosts fall back to an estimate.
+        return None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    encoding = _encoding(model or settings.model_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: list[dict[str, str]], model: str | None = None) -> int:
+    total = _TOKENS_PER_REPLY
+    for message in messages:
+        total += _TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "", model)
+    return total
+
+
+def fit_messages(messages: list[dict[str, str]], budget: int, model: str | None = None) -> list[dict[str, str]]:
+    """
+    Drop the oldest intermediate messages until ``messages`` fits in ``budget`` tokens
+
+    System messages and the final message are always kept, so the result may still exceed
+    the budget when those alone are too large.
+    """
+    kept = list(messages)
+    while count_message_tokens(kept, model) > budget:
+        droppable = [i for i, m in enumerate(kept[:-1]) if m.get("role") != "system"]
+        if not droppable:
+            break
+        del kept[droppable[0]]
+    return kept
+
+
+def estimate_stage_tokens(ctx: ConversationContext, stage: str, model: str | None = None) -> int:
+    """Approximate prompt size of ``stage``: its template plus every context field an agent may send."""
+    parts = [ctx.enabler_story, ctx.potential_fix, ctx.human_preferences or "", *ctx.search_log]
+    if stage != "discovery" and ctx.discovery is not None:
+        parts += [ctx.discovery.core_problem, ctx.discovery.baseline_solution, ctx.discovery.critical_defects]
+    if stage == "integration" and ctx.exploration is not None:
+        parts.append(ctx.exploration.validated_uus)
+    return _template_tokens(stage, model or settings.model_name) + sum(count_tokens(p, model) for p in parts if p)
+
+
+@lru_cache(maxsize=None)
+def _template_tokens(stage: str, model: str) -> int:
+    return count_tokens(_STAGE_TEMPLATES[stage], model)
+
+
+def fit_context(ctx: ConversationContext, stage: str, budget: int, model: str | None = None) -> int:
+    """
+    Trim the oldest accumulated context until ``stage``'s estimated prompt fits in ``budget``
+
+    Drops the oldest search log entries first, then the oldest interactive feedback entries
+    appended to human_preferences (the caller's original preferences are kept).
+    Returns the number of entries removed.
+    """
+    removed = 0
+    while ctx.search_log and estimate_stage_tokens(ctx, stage, model) > budget:
+        del ctx.search_log[0]
+        removed += 1
+    while ctx.human_preferences and estimate_stage_tokens(ctx, stage, model) > budget:
+        entries = list(_FEEDBACK_ENTRY.finditer(ctx.human_preferences))
+        if not entries:
+            break
+        start = entries[0].start()
+        end = entries[1].start() if len(entries) > 1 else len(ctx.human_preferences)
+        ctx.human_preferences = ctx.human_preferences[:start] + ctx.human_preferences[end:]
+        removed += 1
+    return removed
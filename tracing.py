@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+
+@dataclass
+class Span:
+    """
+    One timed operation: a stage ('stage.<name>'), an LLM call ('llm.complete', 'llm.stream'),
+    a search ('search') or the whole run ('run')
+    """
+
+    name: str
+    attributes: dict[str, Any] = field(default_factory=dict)
+    parent: Span | None = field(default=None, repr=False)
+    start: float = field(default_factory=time.perf_counter)
+    end: float | None = None
+    error: str | None = None
+    # Tracer-specific state, e.g. the OpenTelemetry span mirroring this one.
+    handle: Any = field(default=None, repr=False)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+
+class Tracer:
+    """Receives every span of a run; pass an instance to Orchestrator(tracer=...)"""
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        pass
+
+
+class OpenTelemetryTracer(Tracer):
+    """Mirror spans into OpenTelemetry (requires the ``opentelemetry-api`` package)"""
+
+    def __init__(self, tracer: Any = None):
+        try:
+            from opentelemetry import trace
+        except ImportError as exc:
+            raise ImportError("OpenTelemetryTracer requires the 'opentelemetry-api' package") from exc
+        self._trace = trace
+        self._tracer = tracer or trace.get_tracer("u2f")
+
+    def on_start(self, span: Span) -> None:
+        parent = span.parent.handle if span.parent is not None else None
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        span.handle = self._tracer.start_span(f"u2.{span.name}", context=context)
+
+    def on_end(self, span: Span) -> None:
+        otel_span = span.handle
+        if otel_span is None:
+            return
+        for name, value in span.attributes.items():
+            if isinstance(value, (bool, int, float, str)):
+                otel_span.set_attribute(f"u2.{name}", value)
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end()
+
+
+@dataclass
+class RunMetrics:
+    """Span timings and loop counters aggregated over one orchestrator run."""
+
+    started: float = field(default_factory=time.perf_counter)
+    spans: dict[str, dict[str, float]] = field(default_factory=dict)
+    counters: dict[str, int] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def observe(self, span: Span) -> None:
+        with self._lock:
+            stats = self.spans.setdefault(span.name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            duration = span.duration_ms
+            stats["count"] += 1
+            stats["total_ms"] += duration
+            stats["max_ms"] = max(stats["max_ms"], duration)
+            if span.error is not None:
+                stats["errors"] += 1
+            if span.attributes.get("retries"):
+                stats["retries"] = stats.get("retries", 0) + span.attributes["retries"]
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            spans = {name: dict(stats) for name, stats in self.spans.items()}
+            counters = dict(self.counters)
+        for stats in spans.values():
+            stats["mean_ms"] = round(stats["total_ms"] / stats["count"], 3)
+            stats["total_ms"] = round(stats["total_ms"], 3)
+            stats["max_ms"] = round(stats["max_ms"], 3)
+        return {
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "spans": spans,
+            "counters": counters,
+        }
+
+
+_current_metrics: ContextVar[RunMetrics | None] = ContextVar("u2_run_metrics", default=None)
+_current_tracer: ContextVar[Tracer | None] = ContextVar("u2_tracer", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("u2_span", default=None)
+
+
+def current_metrics() -> RunMetrics | None:
+    return _current_metrics.get()
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def start_span(name: str, **attributes: Any) -> Span:
+    """Open a span under the current one without making it current; close it with finish_span()."""
+    span = Span(name, attributes, parent=_current_span.get())
+    tracer = _current_tracer.get()
+    if tracer is not None:
+        tracer.on_start(span)
+    return span
+
+
+def finish_span(span: Span, error: BaseException | None = None) -> None:
+    span.end = time.perf_counter()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.observe(span)
+    tracer = _current_tracer.get()
+    if tracer is not None:
+        tracer.on_end(span)
+
+
+@contextmanager
+def activate(span: Span) -> Iterator[Span]:
+    """Make ``span`` the parent of spans and the target of annotations in this block."""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time the block as a child of the current span, recording the exception that ends it, if any."""
+    current = start_span(name, **attributes)
+    error = None
+    try:
+        with activate(current):
+            yield current
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        finish_span(current, error)
+
+
+def annotate(**attributes: Any) -> None:
+    """Set attributes on the current span; a no-op outside one."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Increment a run counter such as 'discovery_resets'; a no-op outside a run."""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.increment(name, amount)
+
+
+def record_retry(retry_state: Any) -> None:
+    """tenacity ``before_sleep`` hook counting retries on the current span and the run."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes["retries"] = current.attributes.get("retries", 0) + 1
+    count("llm_retries")
+
+
+@contextmanager
+def trace_run(tracer: Tracer | None = None, **attributes: Any) -> Iterator[RunMetrics]:
+    """Collect RunMetrics for the block and report its spans to ``tracer`` under a root 'run' span."""
+    metrics = RunMetrics()
+    metrics_token = _current_metrics.set(metrics)
+    tracer_token = _current_tracer.set(tracer)
+    try:
+        with span("run", **attributes):
+            yield metrics
+    finally:
+        _current_tracer.reset(tracer_token)
+        _current_metrics.reset(metrics_token)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, fields
+from typing import Any, Iterator
+
+
+@dataclass
+class RunUsage:
+    """Counters accumulated by LLM calls made on behalf of one orchestrator run."""
+
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # Prompt and completion tokens of completions answered by the response cache, which cost nothing.
+    cache_hit_tokens: int = 0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost_usd: float = 0.0
+    context_truncations: int = 0
+    stages: dict[str, dict[str, float]] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def logical_tokens(self) -> int:
+        """Tokens the run's completions stand for, billed or served from the response cache."""
+        return self.total_tokens + self.cache_hit_tokens
+
+    def record(self, stage: str | None = None, **counts: float) -> None:
+        with self._lock:
+            per_stage = self.stages.setdefault(stage, {}) if stage else None
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+                if per_stage is not None:
+                    per_stage[name] = per_stage.get(name, 0) + value
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            data = {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+            data["stages"] = {stage: dict(counts) for stage, counts in self.stages.items()}
+        data["total_tokens"] = self.total_tokens
+        data["logical_tokens"] = self.logical_tokens
+        data["cost_usd"] = round(self.cost_usd, 6)
+        for counts in data["stages"].values():
+            if "cost_usd" in counts:
+                counts["cost_usd"] = round(counts["cost_usd"], 6)
+        return data
+
+
+_current_usage: ContextVar[RunUsage | None] = ContextVar("u2_run_usage", default=None)
+_current_stage: ContextVar[str | None] = ContextVar("u2_stage", default=None)
+
+
+def current_usage() -> RunUsage | None:
+    return _current_usage.get()
+
+
+def current_stage() -> str | None:
+    return _current_stage.get()
+
+
+def record_usage(**counts: float) -> None:
+    """Add ``counts`` to the active run's usage and current stage; a no-op outside a run."""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.record(_current_stage.get(), **counts)
+
+
+@contextmanager
+def track_usage() -> Iterator[RunUsage]:
+    usage = RunUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+@contextmanager
+def stage_scope(stage: str) -> Iterator[None]:
+    """Attribute LLM calls made in this context to ``stage``."""
+    token = _current_stage.set(stage)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)